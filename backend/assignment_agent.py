@@ -1,20 +1,54 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import os
+import time
+import queue
+import argparse
+import threading
+from datetime import datetime, timezone
+
+from metrics import REGISTRY, get_logger, observe, run_agent
 
 # --- IMPROVED: Define constants ---
 ISSUES_COLLECTION = "issues"
 WORK_ORDERS_COLLECTION = "work_orders"
 
+# --- Listener Mode ---
+# New issues are buffered and assigned once ASSIGN_BATCH_SIZE have arrived or the
+# oldest one has waited ASSIGN_MAX_WAIT_SECONDS, whichever comes first.
+ASSIGN_BATCH_SIZE = int(os.getenv("ASSIGN_BATCH_SIZE", "50"))
+ASSIGN_MAX_WAIT_SECONDS = float(os.getenv("ASSIGN_MAX_WAIT_SECONDS", "2"))
+ASSIGN_REPORT_INTERVAL_SECONDS = float(os.getenv("ASSIGN_REPORT_INTERVAL_SECONDS", "60"))
+
+log = get_logger("assignment")
+
 # --- Firebase Initialization ---
-# In a real Cloud Function, this part is often simplified.
-try:
-    cred = credentials.Certificate("serviceAccountKey.json")
-    if not firebase_admin._apps:
-        firebase_admin.initialize_app(cred)
-    db = firestore.client()
-except Exception as e:
-    print(f"❌ FATAL: Could not initialize Firebase: {e}")
-    exit()
+# Deferred to first use so that importing this module (e.g. for DEPARTMENT_MAP)
+# does not pay the firebase_admin import and credential loading cost.
+db = None
+
+def initialize_firebase():
+    """Initializes Firebase once and returns the Firestore client."""
+    global db
+    if db is None:
+        from firestore_backend import use_memory_backend, memory_client
+        if use_memory_backend():
+            db = memory_client()
+            return db
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+        try:
+            if os.getenv("FIRESTORE_EMULATOR_HOST"):
+                # The emulator needs no service account; the client picks up the host itself
+                from google.cloud import firestore as gcloud_firestore
+                db = gcloud_firestore.Client(project=os.getenv("GOOGLE_CLOUD_PROJECT", "demo-civic-issues"))
+                return db
+            cred = credentials.Certificate("serviceAccountKey.json")
+            if not firebase_admin._apps:
+                firebase_admin.initialize_app(cred)
+            db = firestore.client()
+        except Exception as e:
+            log.critical("❌ FATAL: Could not initialize Firebase: %s", e)
+            exit()
+    return db
 
 # --- Department Mapping ---
 DEPARTMENT_MAP = {
@@ -25,70 +59,272 @@ DEPARTMENT_MAP = {
     "traffic signal": "Traffic Control"
 }
 
-def prioritize_and_assign():
+# A grouped work order takes the most urgent priority among its reports
+PRIORITY_RANK = {"high": 0, "medium": 1, "low": 2}
+
+def _created_at(doc):
+    """When the issue was written, from the issue itself or the document's create time."""
+    created = doc.to_dict().get("created_at") or getattr(doc, "create_time", None)
+    if not isinstance(created, datetime):
+        return None
+    return created if created.tzinfo else created.replace(tzinfo=timezone.utc)
+
+
+def assign_issues(db, docs):
+    """
+    Assigns the issue snapshots in `docs` (see queue_assignments) and commits
+    the writes in chunked batches. A work order and all its issue updates are
+    committed in the same batch, so an issue is never marked without its work
+    order. Returns the ids of the issues whose writes were committed.
+    """
+    from batch_writer import BatchWriter
+
+    # Chunks of at most 500 writes are committed as they fill; the rest on exit
+    with BatchWriter(db, label="issue assignment writes") as writer:
+        status_updates = queue_assignments(db, writer, docs)
+
+    failed = writer.failed_paths
+    committed = {issue_id: status for issue_id, status in status_updates.items()
+                 if f"{ISSUES_COLLECTION}/{issue_id}" not in failed}
+    if committed:
+        from tile_aggregator import record_tile_updates
+        record_tile_updates(ISSUES_COLLECTION, statuses=committed)
+    return list(committed)
+
+
+def queue_assignments(db, writer, docs):
     """
-    Scans for 'new' issues, creates work orders, and updates issue statuses
-    using an atomic batch write for data integrity.
+    Groups the issue snapshots in `docs` into reports of the same problem
+    (issue_grouping), queues one work order per group that lists every member
+    in `issue_ids` on `writer`, and marks each member as pending assignment
+    in the same write group. Returns {issue_id: new status}.
     """
-    print(f"[{firestore.SERVER_TIMESTAMP}] 🔎 Scanning for 'new' issues...")
+    from firestore_backend import SERVER_TIMESTAMP
+    from geo_utils import parse_location
+    from issue_grouping import group_issues
+    from department_router import get_router
+
+    issues = [(doc, doc.to_dict()) for doc in docs]
+    items = []
+    for doc, data in issues:
+        location = parse_location(data)
+        created = _created_at(doc)
+        items.append(((data.get("subcategory") or "").lower(),
+                      location[0] if location else None, location[1] if location else None,
+                      created.timestamp() if created else None))
+    groups = group_issues(items)
+    # Keyword/embedding routing, so near-miss subcategories ("street light") still reach a department
+    routes = get_router().route_many([issues[group[0]][1] for group in groups])
+
+    status_updates = {}
+    for group, route in zip(groups, routes):
+        members = [issues[i] for i in group]
+        doc, data = members[0]  # The first report describes the problem
+        issue_ids = [member.id for member, _ in members]
+        log.debug("📄 Found new issue → %s%s", doc.id,
+                  f" (+{len(members) - 1} duplicate report(s))" if len(members) > 1 else "")
+
+        subcategory = data.get("subcategory", "").lower()
+        department = route.department
+        priority = min((member_data.get("priority") for _, member_data in members),
+                       key=lambda value: PRIORITY_RANK.get(value, len(PRIORITY_RANK)))
+
+        work_order_data = {
+            "issue_id": doc.id,
+            "issue_ids": issue_ids,
+            "report_count": len(issue_ids),
+            "description": data.get("description"),
+            "category": data.get("category"),
+            "subcategory": subcategory,
+            "priority": priority,
+            "assigned_department": department,
+            "department_confidence": round(route.confidence, 3),
+            "routing_method": route.method,
+            # Set when routing was too unsure to commit to a department; kept for manual triage
+            "suggested_department": route.suggested_department,
+            "status": "proposed",
+            # --- IMPROVED: Use reliable server timestamp ---
+            "created_at": SERVER_TIMESTAMP,
+            "last_updated": SERVER_TIMESTAMP,
+        }
+
+        work_order_ref = db.collection(WORK_ORDERS_COLLECTION).document()
+        with writer.group():
+            # 1. Create the work order
+            writer.set(work_order_ref, work_order_data)
+            # 2. Update every member issue in the same batch
+            for member, _ in members:
+                writer.update(member.reference, {
+                    "status": "pending_assignment",
+                    "work_order_id": work_order_ref.id # Link the issue to the work order
+                })
+                status_updates[member.id] = "pending_assignment"
+        log.debug("✅ Work order for '%s' and %d issue status update(s) queued.", department, len(issue_ids))
+    return status_updates
+
+
+def prioritize_and_assign():
+    """Scans for 'new' issues page by page and assigns each page."""
+    from firestore_backend import FieldFilter
+    from batch_writer import iter_pages
+    db = initialize_firebase()
+    log.info("🔎 Scanning for 'new' issues...")
 
     try:
         issues_ref = db.collection(ISSUES_COLLECTION)
         # --- IMPROVED: Use modern FieldFilter syntax ---
-        from google.cloud.firestore_v1.base_query import FieldFilter
         query = issues_ref.where(filter=FieldFilter("status", "==", "new"))
-        results = query.stream()
-
-        # --- IMPROVED: Use a batch for atomic operations ---
-        batch = db.batch()
         processed_count = 0
 
-        for doc in results:
-            data = doc.to_dict()
-            issue_id = doc.id
-            print(f"\n📄 Found New Issue → {issue_id}")
-
-            subcategory = data.get("subcategory", "").lower()
-            department = DEPARTMENT_MAP.get(subcategory, "General Dept (Uncategorized)")
-
-            work_order_data = {
-                "issue_id": issue_id,
-                "description": data.get("description"),
-                "category": data.get("category"),
-                "subcategory": subcategory,
-                "priority": data.get("priority"),
-                "assigned_department": department,
-                "status": "proposed",
-                # --- IMPROVED: Use reliable server timestamp ---
-                "created_at": firestore.SERVER_TIMESTAMP,
-                "last_updated": firestore.SERVER_TIMESTAMP,
-            }
-
-            # 1. Add the "create work order" operation to the batch
-            work_order_ref = db.collection(WORK_ORDERS_COLLECTION).document()
-            batch.set(work_order_ref, work_order_data)
-            print(f"✅ Work Order for '{department}' added to batch.")
-
-            # 2. Add the "update issue" operation to the batch
-            batch.update(doc.reference, {
-                "status": "pending_assignment",
-                "work_order_id": work_order_ref.id # Link the issue to the work order
-            })
-            print("🔁 Issue status update added to batch.")
-            
-            processed_count += 1
-
-        # --- IMPROVED: Commit the batch once after the loop ---
+        for page in iter_pages(query):
+            processed_count += len(assign_issues(db, page))
+
         if processed_count > 0:
-            batch.commit()
-            print(f"\n✨ Successfully committed batch with {processed_count} operations.")
+            log.info("✨ Assigned %d issue(s).", processed_count)
         else:
-            print("✅ No new issues found to process.")
+            log.info("✅ No new issues found to process.")
 
     except Exception as e:
-        print(f"❌ An error occurred: {e}")
+        log.error("❌ An error occurred: %s", e)
+
+
+# --- LISTENER MODE ---
+def report_assignment_latency(title="End-to-end assignment latency"):
+    """Logs the `assignment_latency` histogram from the metrics registry as text bars."""
+    histogram = REGISTRY.histogram("assignment_latency")
+    if histogram is None or not histogram.count:
+        log.info("📊 %s: no issues assigned yet.", title)
+        return
+    log.info("📊 %s (%d issue(s)): p50 ≤%g ms, p95 ≤%g ms, max %.0f ms", title, histogram.count,
+             histogram.quantile(0.5) * 1000, histogram.quantile(0.95) * 1000, histogram.max * 1000)
+    for line in histogram.bar_lines():
+        log.info("   %s", line)
+
+
+def listen_for_new_issues(batch_size=ASSIGN_BATCH_SIZE, max_wait=ASSIGN_MAX_WAIT_SECONDS,
+                          report_interval=ASSIGN_REPORT_INTERVAL_SECONDS, stop_event=None):
+    """
+    Watches `status == "new"` with a snapshot listener instead of polling. The
+    listener only queues arriving issues; a worker thread assigns them in
+    micro-batches, flushing when `batch_size` issues are waiting or the oldest
+    has waited `max_wait` seconds. Latency from issue creation to committed
+    work order is recorded as the `assignment_latency` metric and logged
+    every `report_interval` seconds and on shutdown.
+    """
+    from firestore_backend import FieldFilter
+    db = initialize_firebase()
+    query = db.collection(ISSUES_COLLECTION).where(filter=FieldFilter("status", "==", "new"))
+    arrivals = queue.Queue()
+    stop_event = stop_event or threading.Event()
+    pending_ids = set()  # Queued or in flight; guards against the same issue arriving twice
+    pending_lock = threading.Lock()
+
+    def on_snapshot(snapshots, changes, read_time):
+        # Runs on the listener's thread, so it must not block on writes
+        for change in changes:
+            if change.type.name != "ADDED":
+                continue  # MODIFIED/REMOVED follow from our own status updates
+            with pending_lock:
+                if change.document.id in pending_ids:
+                    continue
+                pending_ids.add(change.document.id)
+            arrivals.put((change.document, time.monotonic()))
+
+    def worker():
+        next_report = time.monotonic() + report_interval
+        while not stop_event.is_set() or not arrivals.empty():
+            try:
+                first = arrivals.get(timeout=0.5)
+            except queue.Empty:
+                first = None
+            buffered = [first] if first else []
+            deadline = (first[1] if first else time.monotonic()) + max_wait
+            while buffered and len(buffered) < batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    buffered.append(arrivals.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            if buffered:
+                docs = [doc for doc, _ in buffered]
+                try:
+                    assigned = set(assign_issues(db, docs))
+                except Exception as e:
+                    log.error("❌ Micro-batch of %d issue(s) failed: %s", len(docs), e)
+                    assigned = set()
+                committed_at, now = datetime.now(timezone.utc), time.monotonic()
+                for doc, arrived in buffered:
+                    if doc.id not in assigned:
+                        continue
+                    created = _created_at(doc)
+                    # Fall back to time since the listener saw it when the creation time is unknown
+                    latency_s = ((committed_at - created).total_seconds() if created else now - arrived)
+                    observe("assignment_latency", max(0.0, latency_s))
+                with pending_lock:
+                    # Failed issues stay "new" but the listener will not re-send them; retry on the next restart
+                    pending_ids.difference_update(doc.id for doc, _ in buffered)
+                log.debug("⚡ Assigned %d/%d issue(s) in a micro-batch.", len(assigned), len(docs))
+
+            if time.monotonic() >= next_report:
+                report_assignment_latency()
+                next_report = time.monotonic() + report_interval
+
+    log.info("👂 Listening for new issues (batches of up to %d, max wait %gs)%s. Ctrl+C to stop.", batch_size,
+             max_wait, " on the Firestore emulator" if os.getenv("FIRESTORE_EMULATOR_HOST") else "")
+    worker_thread = threading.Thread(target=worker, daemon=True)
+    worker_thread.start()
+    watch = query.on_snapshot(on_snapshot)
+    try:
+        while not stop_event.wait(1.0):
+            pass
+    except KeyboardInterrupt:
+        log.info("🛑 Stopping listener...")
+    finally:
+        watch.unsubscribe()
+        stop_event.set()
+        worker_thread.join()
+        report_assignment_latency()
+    return REGISTRY.histogram("assignment_latency")
+
+
+def seed_emulator_issues(count, interval=0.05):
+    """Writes `count` synthetic new issues for trying the listener. Emulator only."""
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        log.error("❌ --seed only runs against the Firestore emulator (set FIRESTORE_EMULATOR_HOST).")
+        return
+    db = initialize_firebase()
+    subcategories = list(DEPARTMENT_MAP)
+    for i in range(count):
+        db.collection(ISSUES_COLLECTION).add({
+            "description": f"Synthetic issue {i}",
+            "category": "Infrastructure",
+            "subcategory": subcategories[i % len(subcategories)],
+            "priority": "medium",
+            "status": "new",
+            "created_at": datetime.now(timezone.utc),
+        })
+        time.sleep(interval)
+    log.info("🌱 Seeded %d new issue(s) on the emulator.", count)
 
 
 # --- NOTE: The while loop is removed as this logic should be in a Cloud Function ---
 if __name__ == "__main__":
-    prioritize_and_assign()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Create work orders for new issues.")
+    parser.add_argument("--listen", action="store_true",
+                        help="Keep running and assign new issues as they arrive instead of scanning once")
+    parser.add_argument("--batch-size", type=int, default=ASSIGN_BATCH_SIZE)
+    parser.add_argument("--max-wait", type=float, default=ASSIGN_MAX_WAIT_SECONDS,
+                        help="Seconds an issue may wait before its micro-batch is flushed")
+    parser.add_argument("--seed", type=int, metavar="N",
+                        help="With --listen on the emulator: write N synthetic issues while listening")
+    args = parser.parse_args()
+
+    if args.listen:
+        if args.seed:
+            threading.Thread(target=seed_emulator_issues, args=(args.seed,), daemon=True).start()
+        run_agent("assignment_agent", listen_for_new_issues, args.batch_size, args.max_wait)
+    else:
+        run_agent("assignment_agent", prioritize_and_assign)
@@ -0,0 +1,199 @@
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import count, get_logger, timer
+
+# --- CONFIGURATION ---
+FIRESTORE_BATCH_LIMIT = 500  # Firestore rejects batches with more writes than this
+BATCH_WRITER_CONCURRENCY = int(os.getenv("BATCH_WRITER_CONCURRENCY", "4"))
+BATCH_WRITER_MAX_RETRIES = int(os.getenv("BATCH_WRITER_MAX_RETRIES", "3"))
+PAGE_SIZE = int(os.getenv("FIRESTORE_PAGE_SIZE", "500"))
+RETRY_BASE_DELAY = 0.5  # Seconds; doubled on every attempt, with full jitter
+RETRY_MAX_DELAY = 10.0
+
+log = get_logger("batch_writer")
+
+
+# --- PAGINATED READS ---
+def iter_pages(query, page_size=PAGE_SIZE, start_after=None):
+    """
+    Yields the query's results as lists of at most `page_size` documents,
+    resuming each page after the last document of the previous one, so only
+    one page is held in memory. `start_after` resumes from a snapshot.
+    """
+    cursor = start_after
+    while True:
+        page_query = query.limit(page_size)
+        if cursor is not None:
+            page_query = page_query.start_after(cursor)
+        with timer("firestore_read", op="page"):
+            page = list(page_query.stream())
+        count("firestore_documents_read", len(page))
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        cursor = page[-1]
+
+
+def paginate(query, page_size=PAGE_SIZE):
+    """Streams documents one at a time through `iter_pages`."""
+    for page in iter_pages(query, page_size):
+        yield from page
+
+
+# --- CHUNKED WRITES ---
+class BatchWriter:
+    """
+    Collects set/update/delete operations and commits them in batches of at
+    most FIRESTORE_BATCH_LIMIT writes. Full chunks are committed in the
+    background by up to `concurrency` threads; a failing chunk is retried on
+    its own with jittered backoff. Atomicity therefore holds per chunk only;
+    operations that must land together go inside `with writer.group():`.
+
+        with BatchWriter(db) as writer:
+            writer.update(doc.reference, {"status": "done"})
+    """
+
+    def __init__(self, db, limit=FIRESTORE_BATCH_LIMIT, concurrency=BATCH_WRITER_CONCURRENCY,
+                 max_retries=BATCH_WRITER_MAX_RETRIES, label="writes"):
+        self.db = db
+        self.limit = limit
+        self.max_retries = max_retries
+        self.label = label
+        self._ops = []
+        self._group_start = None
+        self._futures = []
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+        self._lock = threading.Lock()
+        self.latencies_ms = []
+        self.failed = []  # (chunk index, error, ops)
+        self.stats = {"chunks": 0, "writes": 0, "retries": 0, "failed_writes": 0}
+
+    # --- Operations ---
+    def set(self, doc_ref, data, merge=False):
+        self._queue(("set", doc_ref, data, merge))
+
+    def update(self, doc_ref, data):
+        self._queue(("update", doc_ref, data, None))
+
+    def delete(self, doc_ref):
+        self._queue(("delete", doc_ref, None, None))
+
+    def __len__(self):
+        return self.stats["writes"] + len(self._ops)
+
+    @contextmanager
+    def group(self):
+        """Keeps the operations queued inside the block in the same batch."""
+        self._group_start = len(self._ops)
+        try:
+            yield self
+        finally:
+            self._group_start = None
+            if len(self._ops) >= self.limit:
+                self._submit(self._ops)
+                self._ops = []
+
+    def _queue(self, op):
+        self._ops.append(op)
+        if len(self._ops) < self.limit:
+            return
+        if self._group_start is None:
+            self._submit(self._ops)
+            self._ops = []
+        elif len(self._ops) > self.limit:
+            if self._group_start == 0:
+                raise ValueError(f"A write group cannot exceed {self.limit} operations")
+            # Ship everything before the open group; the group starts the next chunk
+            self._submit(self._ops[:self._group_start])
+            self._ops = self._ops[self._group_start:]
+            self._group_start = 0
+
+    # --- Commits ---
+    def _submit(self, ops):
+        with self._lock:
+            index = self.stats["chunks"]
+            self.stats["chunks"] += 1
+        self._futures.append(self._executor.submit(self._commit_chunk, index, list(ops)))
+
+    def _commit_chunk(self, index, ops):
+        for attempt in range(self.max_retries + 1):
+            batch = self.db.batch()  # A batch cannot be reused after a failed commit
+            for method, doc_ref, data, merge in ops:
+                if method == "set":
+                    batch.set(doc_ref, data, merge=merge)
+                elif method == "update":
+                    batch.update(doc_ref, data)
+                else:
+                    batch.delete(doc_ref)
+            start = time.perf_counter()
+            try:
+                with timer("firestore_commit", writer=self.label):
+                    batch.commit()
+            except Exception as e:
+                if attempt == self.max_retries:
+                    with self._lock:
+                        self.failed.append((index, e, ops))
+                        self.stats["failed_writes"] += len(ops)
+                    count("firestore_failed_writes", len(ops), writer=self.label)
+                    log.error("❌ Chunk %d (%d %s) failed after %d attempt(s): %s",
+                              index, len(ops), self.label, attempt + 1, e)
+                    return
+                with self._lock:
+                    self.stats["retries"] += 1
+                count("firestore_commit_retries", writer=self.label)
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt))
+                time.sleep(random.uniform(0, delay))
+                continue
+            with self._lock:
+                self.latencies_ms.append((time.perf_counter() - start) * 1000)
+                self.stats["writes"] += len(ops)
+            count("firestore_writes", len(ops), writer=self.label)
+            return
+
+    def flush(self):
+        """Commits everything queued so far and waits for all chunks to finish."""
+        if self._ops:
+            self._submit(self._ops)
+            self._ops = []
+        for future in self._futures:
+            future.result()
+        self._futures = []
+        return self.stats
+
+    @property
+    def failed_paths(self):
+        """Document paths ("collection/id") whose writes were given up on."""
+        return {doc_ref.path for _, _, ops in self.failed for _, doc_ref, _, _ in ops}
+
+    def report(self):
+        if not self.latencies_ms and not self.failed:
+            return
+        latencies = sorted(self.latencies_ms)
+        latency = (f"; chunk latency p50 {latencies[len(latencies) // 2]:.0f} ms, max {latencies[-1]:.0f} ms"
+                   if latencies else "")
+        log.info("💾 Committed %d %s in %d chunk(s) (retries: %d%s)",
+                 self.stats['writes'], self.label, len(latencies), self.stats['retries'], latency)
+        if self.failed:
+            log.error("❌ %d %s in %d chunk(s) were not committed.", self.stats['failed_writes'], self.label,
+                      len(self.failed))
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+        self.report()
+        return self.stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
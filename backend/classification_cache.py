@@ -0,0 +1,139 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import unicodedata
+
+import numpy as np
+
+from embedding_index import EmbeddingIndex
+
+# --- CONFIGURATION ---
+CLASSIFICATION_CACHE_PATH = os.getenv("CLASSIFICATION_CACHE_PATH", "classification_cache.sqlite3")
+CACHE_TTL_DAYS = float(os.getenv("CLASSIFICATION_CACHE_TTL_DAYS", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CLASSIFICATION_CACHE_MAX_ENTRIES", "50000"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))  # 0 disables the semantic tier
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Canonical form used as the exact-match key: NFKC, lowercase, no punctuation, single spaces."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def prompt_version(prompt_template):
+    """Short fingerprint of the prompt; any edit to the few-shot examples changes it."""
+    return hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()[:12]
+
+
+# --- CACHE ---
+class ClassificationCache:
+    """
+    SQLite-backed cache of Gemini classifications.
+
+    Lookups first try an exact match on the normalized report text, then
+    (optionally) a semantic match against stored MiniLM embeddings above
+    `semantic_threshold`. Entries are scoped to the prompt version, expire
+    after `ttl_days` and the least recently used rows are evicted once the
+    cache grows past `max_entries`.
+    """
+
+    def __init__(self, prompt_template, path=CLASSIFICATION_CACHE_PATH, ttl_days=CACHE_TTL_DAYS,
+                 max_entries=CACHE_MAX_ENTRIES, semantic_threshold=SEMANTIC_CACHE_THRESHOLD):
+        self.version = prompt_version(prompt_template)
+        self.ttl_seconds = ttl_days * 24 * 3600 if ttl_days > 0 else None
+        self.max_entries = max_entries
+        self.semantic_threshold = semantic_threshold
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "writes": 0}
+
+        # Opened once per run; the orchestrator uses it from its perception thread
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS classifications (
+                key TEXT PRIMARY KEY,
+                prompt_version TEXT NOT NULL,
+                result TEXT NOT NULL,
+                embedding BLOB,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON classifications(last_access)")
+        # Classifications produced by an older prompt are no longer valid
+        self._conn.execute("DELETE FROM classifications WHERE prompt_version != ?", (self.version,))
+        self._expire()
+        self._conn.commit()
+
+        self._semantic_index = None
+        if self.semantic_threshold > 0:
+            self._semantic_index = EmbeddingIndex(window_seconds=None)
+            for key, blob in self._conn.execute("SELECT key, embedding FROM classifications WHERE embedding IS NOT NULL"):
+                self._semantic_index.add(key, np.frombuffer(blob, dtype=np.float32))
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.version}:{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _expire(self):
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM classifications WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+
+    def _fetch(self, key):
+        row = self._conn.execute("SELECT result, created_at FROM classifications WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        result, created_at = row
+        if self.ttl_seconds is not None and created_at < time.time() - self.ttl_seconds:
+            return None
+        self._conn.execute("UPDATE classifications SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(result)
+
+    def get(self, text, embedding=None):
+        """Returns a cached classification for `text`, or None on a miss."""
+        result = self._fetch(self._key(text))
+        if result is not None:
+            self.stats["exact_hits"] += 1
+            return result
+
+        if self._semantic_index is not None and embedding is not None:
+            match_key = self._semantic_index.find_match(embedding, self.semantic_threshold)
+            result = self._fetch(match_key) if match_key else None
+            if result is not None:
+                self.stats["semantic_hits"] += 1
+                return result
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, text, result, embedding=None):
+        """Stores a classification; the embedding (if any) feeds the semantic tier."""
+        key = self._key(text)
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO classifications VALUES (?, ?, ?, ?, ?, ?)",
+            (key, self.version, json.dumps(result), blob, now, now),
+        )
+        if self._semantic_index is not None and embedding is not None:
+            self._semantic_index.add(key, embedding)
+        self.stats["writes"] += 1
+
+    def flush(self):
+        """Applies TTL and LRU eviction and commits pending writes."""
+        self._expire()
+        if self.max_entries > 0:
+            self._conn.execute("""
+                DELETE FROM classifications WHERE key IN (
+                    SELECT key FROM classifications ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+        self._conn.commit()
+
+    def close(self):
+        self.flush()
+        self._conn.close()
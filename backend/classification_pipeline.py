@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import count, get_logger, timer
+
+# --- CONFIGURATION ---
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "4"))  # Requests kept in flight
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))
+GEMINI_PACK_SIZE = int(os.getenv("GEMINI_PACK_SIZE", "1"))  # Reports per prompt (1 = no packing)
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = 1.0  # Seconds; doubled on every attempt, with full jitter
+RETRY_MAX_DELAY = 30.0
+
+log = get_logger("classification")
+
+BATCH_PROMPT_SUFFIX = """
+You will now receive several reports as a JSON array. Classify each one
+independently and reply with a JSON array containing exactly one output
+object per report, in the same order.
+Reports: {inputs}
+Output:
+"""
+
+
+# --- RATE LIMITING ---
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is available."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# --- FAKE BACKEND ---
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """
+    Offline stand-in for genai.GenerativeModel used for benchmarking.
+
+    Sleeps for `latency` seconds per call and answers with a keyword-based
+    classification, returning a JSON array when the prompt is a packed batch.
+    """
+
+    KEYWORDS = {
+        "pothole": ("road", "pothole"),
+        "streetlight": ("electrical", "streetlight"),
+        "light": ("electrical", "streetlight"),
+        "garbage": ("sanitation", "garbage"),
+        "leak": ("water", "water leakage"),
+        "signal": ("traffic", "traffic signal"),
+    }
+
+    def __init__(self, latency=0.5, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+
+    def _classify(self, text):
+        category, subcategory = "general", "other"
+        for keyword, labels in self.KEYWORDS.items():
+            if keyword in text.lower():
+                category, subcategory = labels
+                break
+        return {"category": category, "subcategory": subcategory, "priority": "medium",
+                "description": text, "status": "new"}
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise RuntimeError("429 Resource has been exhausted (fake)")
+        if "Reports: " in prompt:
+            payload = prompt.rsplit("Reports: ", 1)[1].rsplit("\nOutput:", 1)[0]
+            return FakeResponse(json.dumps([self._classify(text) for text in json.loads(payload)]))
+        text = prompt.rsplit('User: "', 1)[1].rsplit('"', 1)[0]
+        return FakeResponse(json.dumps(self._classify(text)))
+
+
+# --- PIPELINE ---
+class ClassificationPipeline:
+    """
+    Classifies many reports concurrently with a bounded thread pool.
+
+    Keeps up to `concurrency` Gemini requests in flight, throttles them with
+    a token bucket, retries failures with jittered exponential backoff and can
+    pack `pack_size` reports into one prompt. Results come back in input order;
+    failed items are returned as the exception that ended their last attempt.
+    """
+
+    def __init__(self, model, prompt_template, concurrency=GEMINI_CONCURRENCY,
+                 requests_per_minute=GEMINI_REQUESTS_PER_MINUTE, pack_size=GEMINI_PACK_SIZE,
+                 max_retries=GEMINI_MAX_RETRIES):
+        self.model = model
+        self.prompt_template = prompt_template
+        self.concurrency = max(1, concurrency)
+        self.pack_size = max(1, pack_size)
+        self.max_retries = max_retries
+        self.limiter = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+
+    def _call(self, prompt):
+        """Sends one prompt, retrying with full-jitter backoff."""
+        for attempt in range(self.max_retries + 1):
+            if self.limiter:
+                self.limiter.acquire()
+            try:
+                with timer("gemini_call"):
+                    return json.loads(self.model.generate_content(prompt).text)
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                count("gemini_retries")
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt))
+                time.sleep(random.uniform(0, delay))
+
+    def _classify_single(self, text):
+        try:
+            return self._call(self.prompt_template.format(input=text))
+        except Exception as e:
+            return e
+
+    def _classify_pack(self, texts):
+        if len(texts) == 1:
+            return [self._classify_single(texts[0])]
+        prompt = self.prompt_template.split("Now classify:")[0].format() + BATCH_PROMPT_SUFFIX.format(
+            inputs=json.dumps(texts, ensure_ascii=False))
+        try:
+            results = self._call(prompt)
+            if isinstance(results, list) and len(results) == len(texts):
+                return results
+            log.warning("⚠️ Packed response had %s items for %d reports. Retrying individually.",
+                        len(results) if isinstance(results, list) else 'no', len(texts))
+        except Exception as e:
+            log.warning("⚠️ Packed request failed (%s). Retrying individually.", e)
+        return [self._classify_single(text) for text in texts]
+
+    def classify(self, texts):
+        """Returns one result (dict or Exception) per input text, in input order."""
+        packs = [texts[i:i + self.pack_size] for i in range(0, len(texts), self.pack_size)]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pack_results = list(executor.map(self._classify_pack, packs))
+        return [result for results in pack_results for result in results]
+
+
+# --- BENCHMARK ---
+def run_benchmark(reports, latency, concurrency, pack_size, requests_per_minute):
+    """Times the pipeline against the fake backend and prints throughput."""
+    from perception_agent import FEW_SHOT_PROMPT
+
+    samples = ["Big pothole near Sector 14 crossing", "Streetlight flickering in Block C",
+               "Garbage not collected for a week", "Water leak on main road", "Traffic signal stuck on red"]
+    texts = [f"{samples[i % len(samples)]} (report {i})" for i in range(reports)]
+    model = FakeGeminiModel(latency=latency)
+    pipeline = ClassificationPipeline(model, FEW_SHOT_PROMPT, concurrency=concurrency,
+                                      requests_per_minute=requests_per_minute, pack_size=pack_size)
+
+    start = time.perf_counter()
+    results = pipeline.classify(texts)
+    elapsed = time.perf_counter() - start
+    failures = sum(isinstance(r, Exception) for r in results)
+    print(f"📊 {reports} reports in {elapsed:.2f}s ({reports / elapsed:.1f} reports/sec), "
+          f"{model.calls} model calls, {failures} failures")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Gemini classification pipeline offline.")
+    parser.add_argument("--reports", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake per-request latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=GEMINI_CONCURRENCY)
+    parser.add_argument("--pack-size", type=int, default=GEMINI_PACK_SIZE)
+    parser.add_argument("--rpm", type=float, default=0, help="Requests per minute (0 = unlimited)")
+    args = parser.parse_args()
+    if args.reports <= 0:
+        print("❌ --reports must be positive")
+        sys.exit(1)
+    run_benchmark(args.reports, args.latency, args.concurrency, args.pack_size, args.rpm)
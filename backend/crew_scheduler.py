@@ -0,0 +1,405 @@
+import os
+import json
+import math
+import time
+import random
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+# --- CONFIGURATION ---
+CREWS_PATH = os.getenv("CREWS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "crews.json"))
+SCHEDULE_HORIZON_DAYS = int(os.getenv("SCHEDULE_HORIZON_DAYS", "14"))
+CREW_DAILY_HOURS = 8.0
+CREW_SPEED_KMH = float(os.getenv("CREW_SPEED_KMH", "25"))
+ROAD_FACTOR = 1.3  # Road distance is longer than the straight line between two stops
+DEFAULT_SERVICE_HOURS = 1.5
+CANDIDATE_CREWS = 8  # Only the nearest skilled crews are considered for each order
+LOCAL_SEARCH_SECONDS = float(os.getenv("SCHEDULER_LOCAL_SEARCH_SECONDS", "5"))
+KM_PER_DEGREE = 111.195
+
+# Hours of travel an order is "worth" per day of delay; being late costs far more
+DELAY_COST_HOURS = {"high": 2.0, "medium": 0.5, "low": 0.1}
+LATE_COST_HOURS = 24.0
+
+# Skill that lets a crew take orders from any department
+GENERALIST_SKILL = "*"
+
+Crew = namedtuple("Crew", ["crew_id", "name", "skills", "lat", "lng", "daily_hours"])
+Job = namedtuple("Job", ["job_id", "department", "priority", "deadline_day", "lat", "lng", "service_hours"])
+Assignment = namedtuple("Assignment", ["crew_id", "crew_name", "day", "sequence", "estimated_hours"])
+
+
+# --- CREWS ---
+def load_crews(path=CREWS_PATH):
+    """
+    Reads crews from a JSON list such as
+        [{"crew_id": "pw-1", "name": "Public Works 1", "skills": ["Public Works"],
+          "home": {"lat": 12.97, "lng": 77.59}, "daily_hours": 8}]
+    Skills are department names from assignment_agent.DEPARTMENT_MAP, or "*".
+    Returns None when the file does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        rows = json.load(f)
+    crews = []
+    for i, row in enumerate(rows):
+        home = row.get("home") or {}
+        crews.append(Crew(
+            crew_id=str(row.get("crew_id") or f"crew-{i + 1}"),
+            name=row.get("name") or str(row.get("crew_id") or f"Crew {i + 1}"),
+            skills=frozenset(row.get("skills") or [GENERALIST_SKILL]),
+            lat=float(home.get("lat", home.get("latitude", 0.0))),
+            lng=float(home.get("lng", home.get("longitude", 0.0))),
+            daily_hours=float(row.get("daily_hours", CREW_DAILY_HOURS)),
+        ))
+    return crews
+
+
+def default_crews(jobs):
+    """One generalist crew per department, based at the centroid of that department's orders."""
+    crews = []
+    for department in sorted({job.department for job in jobs}):
+        located = [(job.lat, job.lng) for job in jobs if job.department == department and job.lat is not None]
+        lat, lng = np.mean(located, axis=0) if located else (0.0, 0.0)
+        crews.append(Crew(f"default-{len(crews) + 1}", f"{department} Crew", frozenset([department]),
+                          float(lat), float(lng), CREW_DAILY_HOURS))
+    return crews
+
+
+# --- SOLVER ---
+class CrewScheduler:
+    """
+    Assigns jobs to (crew, day) routes within the planning horizon.
+
+    Greedy phase: jobs are taken in deadline/priority order, and each one is
+    placed at the cheapest insertion point among the nearest skilled crews'
+    day routes that still have capacity. Cost is the added travel time plus a
+    per-day delay cost that grows with priority and jumps once the deadline
+    has passed. Local search then relocates single jobs while that lowers the
+    total cost. Each route starts and ends at the crew's home.
+
+    `booked_hours` maps (crew_id, day) to hours already committed by earlier
+    runs, which reduces that day's capacity.
+    """
+
+    def __init__(self, crews, horizon_days=SCHEDULE_HORIZON_DAYS, speed_kmh=CREW_SPEED_KMH,
+                 candidate_crews=CANDIDATE_CREWS, booked_hours=None):
+        self.crews = list(crews)
+        self.horizon = horizon_days
+        self.hours_per_km = ROAD_FACTOR / speed_kmh
+        self.candidate_crews = candidate_crews
+        self.booked_hours = booked_hours or {}
+
+    # --- Geometry ---
+    def _project(self, jobs):
+        """Local equirectangular projection to kilometres; accurate enough at city scale."""
+        lats = [c.lat for c in self.crews] + [j.lat for j in jobs if j.lat is not None]
+        self._lat0 = math.radians(float(np.mean(lats))) if lats else 0.0
+        scale = math.cos(self._lat0) * KM_PER_DEGREE
+        self.crew_xy = [(c.lng * scale, c.lat * KM_PER_DEGREE) for c in self.crews]
+        located_xy = [(j.lng * scale, j.lat * KM_PER_DEGREE) for j in jobs if j.lat is not None]
+        fallback = {}
+        for department in {j.department for j in jobs if j.lat is None}:
+            located = [(j.lng * scale, j.lat * KM_PER_DEGREE) for j in jobs
+                       if j.department == department and j.lat is not None]
+            homes = [xy for c, xy in zip(self.crews, self.crew_xy)
+                     if department in c.skills or GENERALIST_SKILL in c.skills] or self.crew_xy
+            # No location: assume the middle of the department's other work, else of all work,
+            # else of the crews that could take it
+            points = located or located_xy or homes or [(0.0, 0.0)]
+            fallback[department] = tuple(float(v) for v in np.mean(points, axis=0))
+        self.job_xy = []
+        for job in jobs:
+            if job.lat is not None:
+                self.job_xy.append((job.lng * scale, job.lat * KM_PER_DEGREE))
+            else:
+                self.job_xy.append(fallback[job.department])
+
+    def _travel(self, a, b):
+        return math.hypot(a[0] - b[0], a[1] - b[1]) * self.hours_per_km
+
+    def _candidates(self, jobs):
+        """The nearest skilled crews for every job, found department by department with NumPy."""
+        crew_xy = np.asarray(self.crew_xy, dtype=np.float64).reshape(-1, 2)
+        candidates = [[] for _ in jobs]
+        by_department = {}
+        for index, job in enumerate(jobs):
+            by_department.setdefault(job.department, []).append(index)
+        for department, indices in by_department.items():
+            skilled = np.array([i for i, c in enumerate(self.crews) if department in c.skills], dtype=np.int64)
+            if not len(skilled):
+                skilled = np.array([i for i, c in enumerate(self.crews) if GENERALIST_SKILL in c.skills],
+                                   dtype=np.int64)
+            if not len(skilled):
+                continue
+            points = np.array([self.job_xy[i] for i in indices], dtype=np.float64)
+            distances = np.hypot(points[:, None, 0] - crew_xy[skilled, 0], points[:, None, 1] - crew_xy[skilled, 1])
+            k = min(self.candidate_crews, len(skilled))
+            nearest = np.argpartition(distances, k - 1, axis=1)[:, :k] if k < len(skilled) else \
+                np.tile(np.arange(len(skilled)), (len(indices), 1))
+            for row, index in enumerate(indices):
+                order = nearest[row][np.argsort(distances[row, nearest[row]])]
+                candidates[index] = skilled[order].tolist()
+        return candidates
+
+    # --- Costs ---
+    def _day_cost(self, job, day):
+        cost = DELAY_COST_HOURS.get(job.priority, DELAY_COST_HOURS["low"]) * day
+        if day > job.deadline_day:
+            cost += LATE_COST_HOURS * (day - job.deadline_day)
+        return cost
+
+    def _best_insertion(self, j, route, home):
+        """(added travel hours, position) for inserting job j into the route's stop list."""
+        point = self.job_xy[j]
+        best_delta, best_position = math.inf, 0
+        previous = home
+        for position in range(len(route) + 1):
+            following = self.job_xy[route[position]] if position < len(route) else home
+            delta = (self._travel(previous, point) + self._travel(point, following)
+                     - self._travel(previous, following))
+            if delta < best_delta:
+                best_delta, best_position = delta, position
+            previous = following
+        return best_delta, best_position
+
+    def _removal_delta(self, j, route, home):
+        position = route.index(j)
+        previous = self.job_xy[route[position - 1]] if position > 0 else home
+        following = self.job_xy[route[position + 1]] if position + 1 < len(route) else home
+        point = self.job_xy[j]
+        return (self._travel(previous, point) + self._travel(point, following)
+                - self._travel(previous, following))
+
+    def _find_slot(self, j, job, crew_indices, exclude_cost=math.inf):
+        """Cheapest feasible (cost, crew index, day, position, added hours) over the candidate crews."""
+        best = None
+        best_cost = exclude_cost
+        for c in crew_indices:
+            crew = self.crews[c]
+            home = self.crew_xy[c]
+            for day in range(self.horizon):
+                day_cost = self._day_cost(job, day)
+                if day_cost >= best_cost:
+                    break  # Later days only cost more
+                key = (c, day)
+                route = self.routes.get(key, [])
+                delta, position = self._best_insertion(j, route, home)
+                added = delta + job.service_hours
+                if self.used_hours.get(key, 0.0) + added > crew.daily_hours + 1e-9:
+                    continue
+                cost = delta + day_cost
+                if cost < best_cost:
+                    best_cost = cost
+                    best = (cost, c, day, position, added)
+        return best
+
+    def _insert(self, j, c, day, position, added):
+        key = (c, day)
+        self.routes.setdefault(key, []).insert(position, j)
+        self.used_hours[key] = self.used_hours.get(key, 0.0) + added
+        self.placement[j] = key
+
+    def _remove(self, j):
+        key = self.placement.pop(j)
+        route = self.routes[key]
+        delta = self._removal_delta(j, route, self.crew_xy[key[0]])
+        route.remove(j)
+        self.used_hours[key] -= delta + self.jobs[j].service_hours
+        return key, delta
+
+    # --- Solve ---
+    def solve(self, jobs, time_limit=LOCAL_SEARCH_SECONDS):
+        """Returns ({job_id: Assignment}, [unassigned job ids], stats)."""
+        start = time.perf_counter()
+        self.jobs = list(jobs)
+        self._project(self.jobs)
+        candidates = self._candidates(self.jobs)
+        self.routes, self.placement = {}, {}
+        self.used_hours = {}
+        for crew_index, crew in enumerate(self.crews):
+            for day in range(self.horizon):
+                booked = self.booked_hours.get((crew.crew_id, day))
+                if booked:
+                    self.used_hours[(crew_index, day)] = booked
+
+        # Greedy: most urgent first
+        rank = {"high": 0, "medium": 1, "low": 2}
+        order = sorted(range(len(self.jobs)),
+                       key=lambda j: (self.jobs[j].deadline_day, rank.get(self.jobs[j].priority, 3)))
+        unassigned = []
+        for j in order:
+            slot = self._find_slot(j, self.jobs[j], candidates[j])
+            if slot is None:
+                unassigned.append(j)
+            else:
+                self._insert(j, *slot[1:])
+        greedy_cost = self.total_cost()
+        greedy_seconds = time.perf_counter() - start
+
+        # Local search: relocate single jobs while that lowers the cost
+        moves, passes = 0, 0
+        deadline = time.perf_counter() + time_limit
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved, passes = False, passes + 1
+            for j in list(self.placement):
+                if time.perf_counter() >= deadline:
+                    break
+                job = self.jobs[j]
+                key = self.placement[j]
+                current = self._removal_delta(j, self.routes[key], self.crew_xy[key[0]]) + self._day_cost(job, key[1])
+                old_position = self.routes[key].index(j)
+                _, removed_delta = self._remove(j)
+                slot = self._find_slot(j, job, candidates[j], exclude_cost=current - 1e-6)
+                if slot is None:
+                    # Put it back exactly where it was
+                    self.routes[key].insert(old_position, j)
+                    self.used_hours[key] += removed_delta + job.service_hours
+                    self.placement[j] = key
+                    continue
+                self._insert(j, *slot[1:])
+                moves += 1
+                improved = True
+
+        # Unassigned jobs get one more try against every skilled crew
+        for j in list(unassigned):
+            job = self.jobs[j]
+            everyone = [c for c, crew in enumerate(self.crews)
+                        if job.department in crew.skills or GENERALIST_SKILL in crew.skills]
+            slot = self._find_slot(j, job, everyone)
+            if slot is not None:
+                self._insert(j, *slot[1:])
+                unassigned.remove(j)
+
+        assignments = self._assignments()
+        late = sum(1 for j, (_, day) in self.placement.items() if day > self.jobs[j].deadline_day)
+        stats = {
+            "jobs": len(self.jobs),
+            "assigned": len(self.placement),
+            "unassigned": len(unassigned),
+            "late": late,
+            "travel_km": self.total_travel_hours() / self.hours_per_km,
+            "greedy_cost": greedy_cost,
+            "final_cost": self.total_cost(),
+            "relocations": moves,
+            "passes": passes,
+            "greedy_seconds": greedy_seconds,
+            "seconds": time.perf_counter() - start,
+        }
+        return assignments, [self.jobs[j].job_id for j in unassigned], stats
+
+    def committed_hours(self):
+        """Hours per (crew_id, day) after solve(), booked hours included; the next run's `booked_hours`."""
+        return {(self.crews[c].crew_id, day): hours for (c, day), hours in self.used_hours.items() if hours > 0}
+
+    def _assignments(self):
+        assignments = {}
+        for (c, day), route in self.routes.items():
+            crew = self.crews[c]
+            previous = self.crew_xy[c]
+            for sequence, j in enumerate(route, start=1):
+                hours = self._travel(previous, self.job_xy[j]) + self.jobs[j].service_hours
+                assignments[self.jobs[j].job_id] = Assignment(crew.crew_id, crew.name, day, sequence, round(hours, 2))
+                previous = self.job_xy[j]
+        return assignments
+
+    def total_travel_hours(self):
+        total = 0.0
+        for (c, _), route in self.routes.items():
+            stops = [self.crew_xy[c]] + [self.job_xy[j] for j in route] + [self.crew_xy[c]]
+            total += sum(self._travel(a, b) for a, b in zip(stops, stops[1:]) if route)
+        return total
+
+    def total_cost(self):
+        return self.total_travel_hours() + sum(self._day_cost(self.jobs[j], day)
+                                               for j, (_, day) in self.placement.items())
+
+
+# --- BENCHMARK ---
+def synthetic_problem(job_count, crew_count, center=(12.9716, 77.5946), spread_km=15.0, seed=7):
+    """Random crews and jobs spread around a city centre, with skills from the department map."""
+    from assignment_agent import DEPARTMENT_MAP
+    from scheduling_agent import PRIORITY_SCHEDULE_MAP
+
+    rng = random.Random(seed)
+    departments = sorted(set(DEPARTMENT_MAP.values()))
+    spread = spread_km / KM_PER_DEGREE
+
+    def point():
+        return (center[0] + rng.gauss(0, spread / 2),
+                center[1] + rng.gauss(0, spread / 2) / math.cos(math.radians(center[0])))
+
+    crews = []
+    for i in range(crew_count):
+        lat, lng = point()
+        skills = {departments[i % len(departments)]}
+        if rng.random() < 0.2:
+            skills.add(rng.choice(departments))
+        crews.append(Crew(f"crew-{i + 1}", f"Crew {i + 1}", frozenset(skills), lat, lng, CREW_DAILY_HOURS))
+
+    jobs = []
+    priorities = ["high", "medium", "medium", "low", "low"]
+    for i in range(job_count):
+        lat, lng = point()
+        priority = rng.choice(priorities)
+        jobs.append(Job(f"job-{i + 1}", rng.choice(departments), priority,
+                        PRIORITY_SCHEDULE_MAP[priority] - 1, lat, lng, rng.choice([0.5, 1.0, 1.5, 2.0, 3.0])))
+    return crews, jobs
+
+
+def run_benchmark(job_count, crew_count, time_limit):
+    print(f"🧪 Scheduling {job_count} synthetic work orders across {crew_count} crews...")
+    crews, jobs = synthetic_problem(job_count, crew_count)
+    scheduler = CrewScheduler(crews)
+    _, _, stats = scheduler.solve(jobs, time_limit=time_limit)
+    print(f"⚡ Greedy: {stats['greedy_seconds']:.2f}s, cost {stats['greedy_cost']:.0f} h-eq")
+    print(f"🔁 Local search: {stats['relocations']} relocation(s) in {stats['passes']} pass(es), "
+          f"cost {stats['final_cost']:.0f} h-eq")
+    used = sum(scheduler.used_hours.values())
+    capacity = sum(crew.daily_hours for crew in crews) * scheduler.horizon
+    print(f"✅ {stats['assigned']}/{stats['jobs']} assigned ({stats['late']} late, {stats['unassigned']} unassigned), "
+          f"{stats['travel_km']:.0f} km of travel, {100 * used / capacity:.0f}% of crew capacity, "
+          f"{stats['seconds']:.2f}s total")
+
+
+def check_unlocated_jobs():
+    """Jobs without a location, including whole departments of them, must still be scheduled."""
+    ok = True
+    home = Crew("c1", "Crew 1", frozenset(["Public Works"]), 12.97, 77.59, 8.0)
+    cases = {
+        "only job unlocated": ([home], [Job("j1", "Public Works", "medium", 5, None, None, 2.0)]),
+        "department unlocated, others located": (
+            [home, Crew("c2", "Crew 2", frozenset(["Water Department"]), 12.99, 77.61, 8.0)],
+            [Job("j1", "Public Works", "high", 2, None, None, 1.0),
+             Job("j2", "Water Department", "low", 9, 12.98, 77.60, 1.0)]),
+        "generalist crew": ([home._replace(skills=frozenset([GENERALIST_SKILL]))],
+                            [Job("j1", "Electricity Board", "low", 9, None, None, 1.0)]),
+    }
+    for name, (crews, jobs) in cases.items():
+        try:
+            assignments, unassigned, _ = CrewScheduler(crews).solve(jobs, time_limit=0.1)
+            passed = len(assignments) == len(jobs) and not unassigned
+        except Exception as e:
+            print(f"❌ {name}: {e}")
+            ok = False
+            continue
+        print(f"{'✅' if passed else '❌'} {name}: {len(assignments)}/{len(jobs)} assigned")
+        ok = ok and passed
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capacity-aware crew scheduler for work orders.")
+    parser.add_argument("--benchmark", type=int, metavar="N", default=5000, help="Number of synthetic work orders")
+    parser.add_argument("--crews", type=int, default=300, help="Number of synthetic crews")
+    parser.add_argument("--time-limit", type=float, default=LOCAL_SEARCH_SECONDS,
+                        help="Seconds allowed for local search")
+    parser.add_argument("--check", action="store_true", help="Run the scheduler's regression checks and exit")
+    args = parser.parse_args()
+    if args.check:
+        raise SystemExit(0 if check_unlocated_jobs() else 1)
+    run_benchmark(args.benchmark, args.crews, args.time_limit)
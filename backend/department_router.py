@@ -0,0 +1,298 @@
+import os
+import re
+import time
+import random
+import argparse
+from collections import deque, namedtuple
+
+import numpy as np
+
+from assignment_agent import DEPARTMENT_MAP
+from metrics import get_logger
+
+# --- CONFIGURATION ---
+UNCATEGORIZED_DEPARTMENT = "General Dept (Uncategorized)"
+DEPARTMENT_CENTROIDS_PATH = os.getenv(
+    "DEPARTMENT_CENTROIDS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "department_centroids.npz"))
+KEYWORD_MIN_CONFIDENCE = 0.6  # Below this the embedding classifier gets a say
+CENTROID_MIN_SIMILARITY = float(os.getenv("CENTROID_MIN_SIMILARITY", "0.35"))
+# Keyword routes weaker than this stay uncategorized, with the department kept as a suggestion
+KEYWORD_ROUTE_MIN_CONFIDENCE = float(os.getenv("KEYWORD_ROUTE_MIN_CONFIDENCE", "0.4"))
+
+# Phrases that point at each department, on top of the DEPARTMENT_MAP subcategories.
+# Matched on whole words after lowercasing and collapsing punctuation to spaces.
+DEPARTMENT_KEYWORDS = {
+    "Public Works": ["pothole", "potholes", "road damage", "damaged road", "broken road", "road crack",
+                     "cracked road", "sinkhole", "manhole", "footpath", "sidewalk", "pavement", "speed breaker",
+                     "road", "bridge", "asphalt"],
+    "Electrical Dept": ["street light", "streetlight", "streetlights", "street lamp", "lamp post", "light pole",
+                        "electric pole", "power line", "exposed wire", "live wire", "transformer", "power cut",
+                        "electrical", "electricity", "flickering"],
+    "Sanitation Dept": ["garbage", "trash", "waste", "litter", "rubbish", "dump", "dumping", "overflowing bin",
+                        "dustbin", "garbage overflow", "sanitation", "dead animal", "stray animal carcass"],
+    "Water Supply": ["water leakage", "water leak", "leakage", "leaking", "pipe burst", "burst pipe",
+                     "broken pipe", "water supply", "no water", "contaminated water", "sewage", "drainage",
+                     "waterlogging", "water logging", "overflowing drain"],
+    "Traffic Control": ["traffic signal", "traffic light", "signal", "signals", "traffic", "zebra crossing",
+                        "road sign", "signboard", "traffic jam", "congestion"],
+}
+# A keyword found in the subcategory counts for more than one buried in a description
+FIELD_WEIGHTS = {"subcategory": 3.0, "category": 1.0, "description": 1.0}
+STRONG_EVIDENCE = 3.0  # Keyword score for full confidence: one word in the subcategory, or three elsewhere
+
+log = get_logger("department_router")
+
+Route = namedtuple("Route", ["department", "confidence", "method", "suggested_department"], defaults=(None,))
+
+
+def _normalize(text):
+    return " " + re.sub(r"[^a-z0-9]+", " ", str(text or "").lower()).strip() + " "
+
+
+# --- KEYWORD MATCHER ---
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over whole-word phrases. Text is scanned once,
+    whatever the number of phrases. Phrases are padded with spaces and text
+    is normalized the same way, so "signal" does not match inside "signalled".
+    """
+
+    def __init__(self, phrases):
+        self.phrases = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for phrase, payload in phrases:
+            self._insert(_normalize(phrase), payload)
+        self._build_failure_links()
+
+    def _insert(self, phrase, payload):
+        state = 0
+        for char in phrase:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._output[state].append(len(self.phrases))
+        self.phrases.append((phrase.strip(), payload))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, following in self._goto[state].items():
+                queue.append(following)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[following] = self._goto[fallback].get(char, 0)
+                self._output[following] = self._output[following] + self._output[self._fail[following]]
+
+    def find(self, text):
+        """Yields the index of every phrase occurring in already-normalized text."""
+        state = 0
+        goto, fail, output = self._goto, self._fail, self._output
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            yield from output[state]
+
+
+# --- EMBEDDING CLASSIFIER ---
+class CentroidClassifier:
+    """Nearest-centroid classifier over the MiniLM text embeddings stored on issues."""
+
+    def __init__(self, departments, centroids):
+        self.departments = list(departments)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+
+    @classmethod
+    def fit(cls, embeddings, labels):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        labels = np.asarray(labels)
+        departments = sorted(set(labels.tolist()))
+        centroids = np.stack([embeddings[labels == department].mean(axis=0) for department in departments])
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        return cls(departments, centroids)
+
+    def predict(self, embeddings):
+        """Returns (department indices, cosine similarity to the winning centroid) for a batch."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        scores = embeddings @ self.centroids.T
+        best = np.argmax(scores, axis=1)
+        return best, scores[np.arange(len(best)), best]
+
+    def save(self, path):
+        np.savez(path, departments=np.array(self.departments), centroids=self.centroids)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as snapshot:
+            return cls([str(d) for d in snapshot["departments"]], snapshot["centroids"])
+
+
+# --- ROUTER ---
+class DepartmentRouter:
+    """
+    Routes issues to departments without an LLM call. An exact
+    DEPARTMENT_MAP subcategory wins outright; otherwise keyword hits across
+    subcategory, category and description are weighted. Confidence is the
+    winning department's share of the score, scaled down when the evidence
+    is weak. When that share is below
+    KEYWORD_MIN_CONFIDENCE and a centroid classifier is loaded, the issue's
+    text embedding decides instead, with its cosine similarity as confidence.
+    Keyword routes still below KEYWORD_ROUTE_MIN_CONFIDENCE go to
+    UNCATEGORIZED_DEPARTMENT, with the keyword pick as suggested_department.
+    """
+
+    def __init__(self, keywords=DEPARTMENT_KEYWORDS, classifier=None):
+        phrases = [(subcategory, department) for subcategory, department in DEPARTMENT_MAP.items()]
+        phrases += [(phrase, department) for department, words in keywords.items() for phrase in words]
+        self.automaton = KeywordAutomaton(phrases)
+        self.classifier = classifier
+
+    def _keyword_route(self, data):
+        subcategory = (data.get("subcategory") or "").strip().lower()
+        if subcategory in DEPARTMENT_MAP:
+            return Route(DEPARTMENT_MAP[subcategory], 1.0, "exact")
+        scores = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            seen = set()
+            for index in self.automaton.find(_normalize(data.get(field))):
+                phrase, department = self.automaton.phrases[index]
+                if phrase in seen:
+                    continue
+                seen.add(phrase)
+                # Longer phrases are more specific ("traffic signal" beats "road")
+                scores[department] = scores.get(department, 0.0) + weight * len(phrase.split())
+        if not scores:
+            return Route(UNCATEGORIZED_DEPARTMENT, 0.0, "none")
+        department = max(scores, key=scores.get)
+        share = scores[department] / sum(scores.values())
+        return Route(department, share * min(1.0, scores[department] / STRONG_EVIDENCE), "keyword")
+
+    def route(self, data):
+        return self.route_many([data])[0]
+
+    def route_many(self, issues):
+        """Routes a list of issue dicts; embeddings of uncertain ones are classified in one batch."""
+        routes = [self._keyword_route(data) for data in issues]
+        uncertain = [i for i, route in enumerate(routes)
+                     if route.confidence < KEYWORD_MIN_CONFIDENCE and issues[i].get("text_embedding")]
+        if self.classifier is not None and uncertain:
+            best, similarity = self.classifier.predict([issues[i]["text_embedding"] for i in uncertain])
+            for i, department_index, score in zip(uncertain, best, similarity):
+                if score >= CENTROID_MIN_SIMILARITY and score > routes[i].confidence:
+                    routes[i] = Route(self.classifier.departments[department_index], float(score), "embedding")
+        return [self._apply_floor(route) for route in routes]
+
+    @staticmethod
+    def _apply_floor(route):
+        if route.method != "keyword" or route.confidence >= KEYWORD_ROUTE_MIN_CONFIDENCE:
+            return route
+        return Route(UNCATEGORIZED_DEPARTMENT, route.confidence, route.method, route.department)
+
+
+_router = None
+
+def get_router():
+    """The process-wide router, compiled on first use with centroids loaded if a snapshot exists."""
+    global _router
+    if _router is None:
+        classifier = None
+        if os.path.exists(DEPARTMENT_CENTROIDS_PATH):
+            classifier = CentroidClassifier.load(DEPARTMENT_CENTROIDS_PATH)
+        _router = DepartmentRouter(classifier=classifier)
+    return _router
+
+
+# --- TRAINING ---
+def train_centroids(db, path=DEPARTMENT_CENTROIDS_PATH):
+    """
+    Fits department centroids from existing work orders: each order's final
+    assigned_department (including manual re-routes) labels the text
+    embedding of its issue.
+    """
+    from batch_writer import PAGE_SIZE, paginate
+    from assignment_agent import ISSUES_COLLECTION, WORK_ORDERS_COLLECTION
+
+    labels = {}
+    for work_order in paginate(db.collection(WORK_ORDERS_COLLECTION)):
+        data = work_order.to_dict()
+        department = data.get("assigned_department")
+        if department and department != UNCATEGORIZED_DEPARTMENT:
+            for issue_id in data.get("issue_ids") or [data.get("issue_id")]:
+                if issue_id:
+                    labels[issue_id] = department
+
+    issue_ids = list(labels)
+    embeddings, targets = [], []
+    for i in range(0, len(issue_ids), PAGE_SIZE):
+        refs = [db.collection(ISSUES_COLLECTION).document(issue_id) for issue_id in issue_ids[i:i + PAGE_SIZE]]
+        for snapshot in db.get_all(refs):
+            embedding = snapshot.to_dict().get("text_embedding") if snapshot.exists else None
+            if embedding:
+                embeddings.append(embedding)
+                targets.append(labels[snapshot.id])
+    if not embeddings:
+        log.warning("⚠️ No labelled issues with text embeddings found; nothing to train.")
+        return None
+    classifier = CentroidClassifier.fit(embeddings, targets)
+    classifier.save(path)
+    log.info("✅ Trained %d department centroid(s) from %d issue(s) → %s", len(classifier.departments),
+             len(embeddings), path)
+    return classifier
+
+
+# --- BENCHMARK ---
+def run_benchmark(count):
+    rng = random.Random(3)
+    samples = [
+        ("street light", "electrical", "The street lamp near the park is not working"),
+        ("garbage overflow", "sanitation", "Overflowing bin and trash everywhere on 5th cross"),
+        ("road damage", "road", "Huge crack and a sinkhole forming on the main road"),
+        ("pipe burst", "water", "Water leaking from a broken pipe since morning"),
+        ("signal not working", "traffic", "Traffic light at the junction is stuck on red"),
+        ("other", "general", "Someone parked a car on the footpath"),
+        ("pothole", "road", "Big pothole"),
+    ]
+    issues = []
+    for _ in range(count):
+        subcategory, category, description = rng.choice(samples)
+        issues.append({"subcategory": subcategory, "category": category,
+                       "description": f"{description} ({rng.randint(1, 999)})"})
+
+    start = time.perf_counter()
+    router = DepartmentRouter()
+    compiled = time.perf_counter()
+    routes = router.route_many(issues)
+    elapsed = time.perf_counter() - compiled
+    uncategorized = sum(route.department == UNCATEGORIZED_DEPARTMENT for route in routes)
+    exact = sum(DEPARTMENT_MAP.get(issue["subcategory"]) is not None for issue in issues)
+    print(f"🧭 Compiled {len(router.automaton.phrases)} phrases in {(compiled - start) * 1000:.1f} ms")
+    print(f"✅ Routed {count} issues in {elapsed * 1000:.0f} ms ({count / elapsed:,.0f}/sec); "
+          f"uncategorized {count - exact} → {uncategorized} with exact-match routing → keyword routing")
+    for subcategory, category, description in samples:
+        route = router.route({"subcategory": subcategory, "category": category, "description": description})
+        suggestion = f", suggested {route.suggested_department}" if route.suggested_department else ""
+        print(f"   {subcategory!r:22} → {route.department} ({route.confidence:.2f}, {route.method}{suggestion})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Route issues to departments without an LLM call.")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="Route N synthetic issues and report throughput")
+    parser.add_argument("--train", action="store_true",
+                        help="Fit embedding centroids from existing work orders and save them")
+    args = parser.parse_args()
+
+    if args.train:
+        from assignment_agent import initialize_firebase
+        train_centroids(initialize_firebase())
+    else:
+        run_benchmark(args.benchmark or 20000)
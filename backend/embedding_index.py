@@ -0,0 +1,168 @@
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from metrics import get_logger
+
+# --- CONFIGURATION ---
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2 output size
+DEFAULT_WINDOW_SECONDS = 24 * 3600
+INITIAL_CAPACITY = 1024
+
+log = get_logger("embedding_index")
+
+
+def to_epoch(value):
+    """Converts a Firestore timestamp / datetime / number to epoch seconds."""
+    if value is None:
+        return time.time()
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return time.time()
+
+
+# --- VECTOR INDEX ---
+class EmbeddingIndex:
+    """
+    Time-windowed in-memory index of L2-normalised text embeddings.
+
+    Vectors live in one contiguous float32 matrix so a query is a single
+    matrix-vector product. Entries older than `window_seconds` are evicted
+    lazily. If `hnswlib` is installed and `backend="hnsw"` is requested, an
+    approximate HNSW graph is used for the top-k search instead.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM, window_seconds=DEFAULT_WINDOW_SECONDS, backend="flat"):
+        self.dim = dim
+        self.window_seconds = window_seconds
+        self._vectors = np.zeros((INITIAL_CAPACITY, dim), dtype=np.float32)
+        self._timestamps = np.zeros(INITIAL_CAPACITY, dtype=np.float64)
+        self._ids = []
+        self._size = 0
+        self._hnsw = None
+        if backend == "hnsw":
+            self._hnsw = self._create_hnsw()
+
+    def __len__(self):
+        return self._size
+
+    def _create_hnsw(self):
+        try:
+            import hnswlib
+        except ImportError:
+            log.info("ℹ️ hnswlib not installed, falling back to flat embedding index.")
+            return None
+        graph = hnswlib.Index(space="ip", dim=self.dim)
+        graph.init_index(max_elements=INITIAL_CAPACITY, ef_construction=200, M=16, allow_replace_deleted=True)
+        graph.set_ef(64)
+        return graph
+
+    def _grow(self):
+        capacity = self._vectors.shape[0] * 2
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        timestamps = np.zeros(capacity, dtype=np.float64)
+        timestamps[:self._size] = self._timestamps[:self._size]
+        self._vectors, self._timestamps = vectors, timestamps
+        if self._hnsw is not None:
+            self._hnsw.resize_index(capacity)
+
+    def add(self, doc_id, embedding, created_at=None):
+        """Adds one embedding to the index."""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        if vector.shape[0] != self.dim or norm == 0:
+            return
+        if self._size == self._vectors.shape[0]:
+            self._grow()
+        self._vectors[self._size] = vector / norm
+        self._timestamps[self._size] = to_epoch(created_at)
+        self._ids.append(doc_id)
+        if self._hnsw is not None:
+            self._hnsw.add_items(self._vectors[self._size:self._size + 1], [self._size])
+        self._size += 1
+
+    def evict_expired(self, now=None):
+        """Drops entries that have fallen out of the time window."""
+        if not self._size or self.window_seconds is None:
+            return 0
+        cutoff = (now if now is not None else time.time()) - self.window_seconds
+        return self._compact(self._timestamps[:self._size] >= cutoff)
+
+    def remove(self, doc_ids):
+        """Drops the entries for `doc_ids`; returns how many were removed."""
+        doc_ids = set(doc_ids)
+        if not self._size or not doc_ids:
+            return 0
+        return self._compact(np.array([doc_id not in doc_ids for doc_id in self._ids], dtype=bool))
+
+    def _compact(self, keep):
+        """Keeps only the entries where `keep` is true, in order."""
+        removed = int(self._size - keep.sum())
+        if removed:
+            kept = np.flatnonzero(keep)
+            self._vectors[:kept.size] = self._vectors[kept]
+            self._timestamps[:kept.size] = self._timestamps[kept]
+            self._ids = [self._ids[i] for i in kept]
+            self._size = kept.size
+            if self._hnsw is not None:
+                self._hnsw = self._create_hnsw()
+                if self._size:
+                    self._hnsw.resize_index(self._vectors.shape[0])
+                    self._hnsw.add_items(self._vectors[:self._size], np.arange(self._size))
+        return removed
+
+    def query(self, embedding, k=1):
+        """Returns up to k (doc_id, cosine_similarity) pairs, best first."""
+        if not self._size:
+            return []
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return []
+        vector = vector / norm
+        k = min(k, self._size)
+        if self._hnsw is not None:
+            labels, distances = self._hnsw.knn_query(vector, k=k)
+            return [(self._ids[i], 1.0 - float(d)) for i, d in zip(labels[0], distances[0])]
+        scores = self._vectors[:self._size] @ vector
+        if k == 1:
+            best = int(np.argmax(scores))
+            return [(self._ids[best], float(scores[best]))]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._ids[i], float(scores[i])) for i in top]
+
+    def find_match(self, embedding, threshold):
+        """Returns the id of the most similar entry at or above threshold, else None."""
+        matches = self.query(embedding, k=1)
+        if matches and matches[0][1] >= threshold:
+            return matches[0][0]
+        return None
+
+    # --- PERSISTENCE ---
+    def save(self, path):
+        """Writes the live entries to a compressed .npz snapshot."""
+        np.savez_compressed(
+            path,
+            vectors=self._vectors[:self._size],
+            timestamps=self._timestamps[:self._size],
+            ids=np.array(self._ids, dtype=object),
+        )
+
+    @classmethod
+    def load(cls, path, window_seconds=DEFAULT_WINDOW_SECONDS, backend="flat"):
+        """Restores an index from a snapshot written by save()."""
+        with np.load(path, allow_pickle=True) as snapshot:
+            vectors = snapshot["vectors"]
+            index = cls(dim=vectors.shape[1] if vectors.ndim == 2 else EMBEDDING_DIM,
+                        window_seconds=window_seconds, backend=backend)
+            for doc_id, vector, ts in zip(snapshot["ids"], vectors, snapshot["timestamps"]):
+                index.add(str(doc_id), vector, float(ts))
+        index.evict_expired()
+        return index
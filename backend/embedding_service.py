@@ -0,0 +1,215 @@
+import os
+import sys
+import json
+import stat
+import zlib
+import argparse
+import threading
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from metrics import get_logger
+
+# --- CONFIGURATION ---
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "float32")  # "float16" halves payload size
+# A per-user 0700 directory; a world-writable /tmp path would let other users stand in for the worker
+EMBEDDING_RUNTIME_DIR = os.getenv("XDG_RUNTIME_DIR") or os.path.join("/tmp", f"civic-{os.getuid()}")
+EMBEDDING_SOCKET = os.getenv("EMBEDDING_SOCKET", os.path.join(EMBEDDING_RUNTIME_DIR, "civic_embedding_worker.sock"))
+# Shared secret between worker and clients; there is no default, and without it the worker is not used
+EMBEDDING_AUTHKEY = os.getenv("EMBEDDING_AUTHKEY", "").encode("utf-8") or None
+EMBEDDING_MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+WIRE_DTYPES = ("float32", "float16")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "model")  # "fake" hashes words instead of running MiniLM
+FAKE_EMBEDDING_DIM = 384  # Same width as all-MiniLM-L6-v2
+
+log = get_logger("embedding")
+
+
+# --- ENCODING ---
+def load_sentence_model():
+    """Loads the MiniLM model in this process."""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+
+def encode_texts(model, texts, batch_size=EMBEDDING_BATCH_SIZE, dtype=EMBEDDING_DTYPE):
+    """Encodes all texts in one batched call and returns an (N, dim) array."""
+    if not texts:
+        return np.zeros((0, 0), dtype=dtype)
+    from metrics import count, timer
+    with timer("embedding_encode"):
+        embeddings = model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+    count("texts_embedded", len(texts))
+    return np.asarray(embeddings).astype(dtype, copy=False)
+
+
+# --- WIRE FORMAT ---
+# Requests are one JSON message; replies are a JSON header followed, on success,
+# by the raw array bytes. Nothing on the socket is pickled.
+def check_private_dir(path):
+    """Raises unless `path` is a directory owned by this user with no group/other access."""
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{path} must be a directory owned by this user with mode 0700")
+
+
+def ensure_private_dir(path):
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    check_private_dir(path)
+
+
+def require_authkey(authkey):
+    if not authkey:
+        raise RuntimeError("EMBEDDING_AUTHKEY is not set; the embedding worker needs a shared secret")
+    return authkey
+
+
+def send_array(conn, array):
+    array = np.ascontiguousarray(array)
+    conn.send_bytes(json.dumps({"status": "ok", "dtype": array.dtype.name, "shape": list(array.shape)}).encode("utf-8"))
+    conn.send_bytes(array.tobytes())
+
+
+def recv_array(conn):
+    header = json.loads(conn.recv_bytes(EMBEDDING_MAX_MESSAGE_BYTES))
+    if header.get("status") != "ok":
+        raise RuntimeError(f"Embedding worker error: {header.get('error')}")
+    if header.get("dtype") not in WIRE_DTYPES:
+        raise RuntimeError(f"Embedding worker sent an unexpected dtype: {header.get('dtype')!r}")
+    shape = tuple(int(n) for n in header["shape"])
+    return np.frombuffer(conn.recv_bytes(EMBEDDING_MAX_MESSAGE_BYTES), dtype=header["dtype"]).reshape(shape)
+
+
+# --- WARM WORKER CLIENT ---
+class RemoteSentenceModel:
+    """Drop-in replacement for SentenceTransformer.encode() backed by the warm worker."""
+
+    def __init__(self, address=EMBEDDING_SOCKET, authkey=EMBEDDING_AUTHKEY):
+        self.address = address
+        self.authkey = require_authkey(authkey)
+        check_private_dir(os.path.dirname(os.path.abspath(address)))
+        self._conn = Client(address, family="AF_UNIX", authkey=self.authkey)
+        self._lock = threading.Lock()
+
+    def encode(self, sentences, batch_size=EMBEDDING_BATCH_SIZE, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        request = {"command": "encode", "texts": texts, "batch_size": int(batch_size),
+                   "dtype": kwargs.get("dtype", "float32")}
+        with self._lock:
+            self._conn.send_bytes(json.dumps(request).encode("utf-8"))
+            embeddings = recv_array(self._conn)
+        return embeddings[0] if single else embeddings
+
+    def close(self):
+        self._conn.close()
+
+
+# --- FAKE BACKEND ---
+class FakeSentenceModel:
+    """
+    Offline stand-in for SentenceTransformer used for benchmarking: a signed,
+    hashed bag of words, L2-normalised. Reports sharing most of their words
+    come out similar, so duplicate detection and the semantic cache still
+    have something to find.
+    """
+
+    def __init__(self, dim=FAKE_EMBEDDING_DIM):
+        self.dim = dim
+
+    def encode(self, sentences, batch_size=EMBEDDING_BATCH_SIZE, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                digest = zlib.crc32(word.encode("utf-8"))
+                embeddings[row, digest % self.dim] += 1.0 if digest & 0x80000000 else -1.0
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings[0] if single else embeddings
+
+
+def get_sentence_model():
+    """Uses the warm embedding worker when it is running, else loads the model locally."""
+    if EMBEDDING_BACKEND == "fake":
+        log.info("🧪 Using fake sentence embeddings (no model download).")
+        return FakeSentenceModel()
+    if os.path.exists(EMBEDDING_SOCKET) and not EMBEDDING_AUTHKEY:
+        log.warning("⚠️ Embedding worker socket found but EMBEDDING_AUTHKEY is not set. Loading model locally.")
+    elif os.path.exists(EMBEDDING_SOCKET):
+        try:
+            model = RemoteSentenceModel()
+            log.info("✅ Connected to warm embedding worker at %s.", EMBEDDING_SOCKET)
+            return model
+        except Exception as e:
+            log.warning("⚠️ Embedding worker unavailable (%s). Loading model locally.", e)
+    model = load_sentence_model()
+    log.info("✅ Sentence Transformer Model Loaded.")
+    return model
+
+
+# --- WARM WORKER SERVER ---
+def _handle_connection(conn, model, model_lock):
+    with conn:
+        while True:
+            try:
+                request = json.loads(conn.recv_bytes(EMBEDDING_MAX_MESSAGE_BYTES))
+            except (EOFError, OSError):
+                return
+            except ValueError as e:
+                conn.send_bytes(json.dumps({"status": "error", "error": f"Bad request: {e}"}).encode("utf-8"))
+                continue
+            try:
+                texts = request.get("texts")
+                dtype = request.get("dtype", "float32")
+                if request.get("command") != "encode":
+                    raise ValueError(f"Unknown command: {request.get('command')!r}")
+                if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                    raise ValueError("texts must be a list of strings")
+                if dtype not in WIRE_DTYPES:
+                    raise ValueError(f"Unsupported dtype: {dtype!r}")
+                with model_lock:
+                    embeddings = encode_texts(model, texts, int(request.get("batch_size", EMBEDDING_BATCH_SIZE)), dtype)
+            except Exception as e:
+                conn.send_bytes(json.dumps({"status": "error", "error": str(e)}).encode("utf-8"))
+                continue
+            send_array(conn, embeddings)
+
+
+def serve(address=EMBEDDING_SOCKET, model=None):
+    """Keeps the model resident and answers encode requests over a Unix socket."""
+    authkey = require_authkey(EMBEDDING_AUTHKEY)
+    ensure_private_dir(os.path.dirname(os.path.abspath(address)))
+    model = model or load_sentence_model()
+    model_lock = threading.Lock()
+    if os.path.exists(address):
+        os.unlink(address)
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    print(f"🚀 Embedding worker ({EMBEDDING_MODEL_NAME}) listening on {address}")
+    try:
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_handle_connection, args=(conn, model, model_lock), daemon=True).start()
+    except KeyboardInterrupt:
+        print("\n👋 Embedding worker stopped.")
+    finally:
+        listener.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-lived MiniLM embedding worker.")
+    parser.add_argument("--serve", action="store_true", help="Start the worker on EMBEDDING_SOCKET")
+    parser.add_argument("--socket", default=EMBEDDING_SOCKET,
+                        help="Socket path; its directory must be private to this user (mode 0700)")
+    args = parser.parse_args()
+    if not args.serve:
+        parser.print_help()
+        sys.exit(1)
+    try:
+        serve(args.socket)
+    except (RuntimeError, PermissionError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
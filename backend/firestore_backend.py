@@ -0,0 +1,651 @@
+import os
+import bisect
+import random
+import string
+import importlib
+import threading
+import queue
+from enum import Enum
+from functools import total_ordering
+from collections import namedtuple
+from datetime import datetime, timezone
+
+# --- CONFIGURATION ---
+# "firestore" talks to Google Cloud; "memory" keeps every collection in this
+# process (benchmarks, local runs without credentials).
+FIRESTORE_BACKEND = os.getenv("FIRESTORE_BACKEND", "firestore")
+DOCUMENT_ID = "__name__"  # What FieldPath.document_id() resolves to
+AUTO_ID_CHARS = string.ascii_letters + string.digits
+
+
+def use_memory_backend():
+    return FIRESTORE_BACKEND == "memory"
+
+
+# --- VALUE TYPES ---
+class _ServerTimestamp:
+    def __repr__(self):
+        return "SERVER_TIMESTAMP"
+
+
+MEMORY_SERVER_TIMESTAMP = _ServerTimestamp()
+
+
+class MemoryGeoPoint:
+    def __init__(self, latitude, longitude):
+        self.latitude = float(latitude)
+        self.longitude = float(longitude)
+
+    def __eq__(self, other):
+        return (isinstance(other, MemoryGeoPoint)
+                and (self.latitude, self.longitude) == (other.latitude, other.longitude))
+
+    def __hash__(self):
+        return hash((self.latitude, self.longitude))
+
+    def __repr__(self):
+        return f"GeoPoint({self.latitude}, {self.longitude})"
+
+
+class MemoryFieldFilter:
+    def __init__(self, field_path, op_string, value=None):
+        self.field_path = field_path
+        self.op_string = op_string
+        self.value = value
+
+
+class MemoryFieldPath:
+    @staticmethod
+    def document_id():
+        return DOCUMENT_ID
+
+
+# The names agents import from here resolve to the Google classes or to the
+# in-memory ones above, depending on FIRESTORE_BACKEND, on first access.
+_GOOGLE_NAMES = {
+    "FieldFilter": ("google.cloud.firestore_v1.base_query", "FieldFilter"),
+    "FieldPath": ("google.cloud.firestore_v1.field_path", "FieldPath"),
+    "GeoPoint": ("google.cloud.firestore", "GeoPoint"),
+    "SERVER_TIMESTAMP": ("google.cloud.firestore", "SERVER_TIMESTAMP"),
+}
+_MEMORY_NAMES = {
+    "FieldFilter": MemoryFieldFilter,
+    "FieldPath": MemoryFieldPath,
+    "GeoPoint": MemoryGeoPoint,
+    "SERVER_TIMESTAMP": MEMORY_SERVER_TIMESTAMP,
+}
+
+
+def __getattr__(name):
+    if name not in _GOOGLE_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if use_memory_backend():
+        return _MEMORY_NAMES[name]
+    module, attribute = _GOOGLE_NAMES[name]
+    return getattr(importlib.import_module(module), attribute)
+
+
+# --- VALUE HELPERS ---
+def _order_key(value):
+    """Sort key following Firestore's cross-type value ordering."""
+    if value is None:
+        return (0,)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp())
+    if isinstance(value, str):
+        return (4, value)
+    if isinstance(value, bytes):
+        return (5, value)
+    if isinstance(value, MemoryDocumentReference):
+        return (6, value.path)
+    if isinstance(value, MemoryGeoPoint):
+        return (7, value.latitude, value.longitude)
+    if isinstance(value, (list, tuple)):
+        return (8, tuple(_order_key(item) for item in value))
+    if isinstance(value, dict):
+        return (9, tuple(sorted((key, _order_key(item)) for key, item in value.items())))
+    return (10, repr(value))
+
+
+@total_ordering
+class _Descending:
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __lt__(self, other):
+        return self.key > other.key
+
+
+def _copy(value):
+    """Copies nested maps and arrays so callers never share state with the store."""
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value] if value and isinstance(value[0], (dict, list)) else value.copy()
+    return value
+
+
+def _resolve(value, now):
+    """Copies a value being written, replacing SERVER_TIMESTAMP with the commit time."""
+    if value is MEMORY_SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, dict):
+        return {key: _resolve(item, now) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_resolve(item, now) for item in value]
+    return value
+
+
+def _get_field(data, path):
+    """(found, value) for a dotted field path."""
+    for part in path.split("."):
+        if not isinstance(data, dict) or part not in data:
+            return False, None
+        data = data[part]
+    return True, data
+
+
+def _set_field(data, path, value):
+    """Returns a copy of `data` with the dotted path set, copying only the maps along the path."""
+    head, _, rest = path.partition(".")
+    data = dict(data)
+    data[head] = _set_field(data.get(head) if isinstance(data.get(head), dict) else {}, rest, value) if rest else value
+    return data
+
+
+def _merge(old, new):
+    merged = dict(old)
+    for key, value in new.items():
+        merged[key] = _merge(old[key], value) if isinstance(value, dict) and isinstance(old.get(key), dict) else value
+    return merged
+
+
+def _matches(doc_id, data, filters):
+    for field, op, value in filters:
+        if field == DOCUMENT_ID:
+            found, actual = True, doc_id
+            value = [getattr(v, "id", v) for v in value] if op in ("in", "not-in") else getattr(value, "id", value)
+        else:
+            found, actual = _get_field(data, field)
+        if not found:
+            return False
+        if op == "==":
+            ok = _order_key(actual) == _order_key(value)
+        elif op == "!=":
+            ok = actual is not None and _order_key(actual) != _order_key(value)
+        elif op in ("<", "<=", ">", ">="):
+            left, right = _order_key(actual), _order_key(value)
+            if left[0] != right[0]:
+                return False  # Range filters only match values of the same type
+            ok = {"<": left < right, "<=": left <= right, ">": left > right, ">=": left >= right}[op]
+        elif op == "in":
+            ok = any(_order_key(actual) == _order_key(v) for v in value)
+        elif op == "not-in":
+            ok = actual is not None and all(_order_key(actual) != _order_key(v) for v in value)
+        elif op == "array_contains" or op == "array-contains":
+            ok = isinstance(actual, list) and any(_order_key(item) == _order_key(value) for item in actual)
+        elif op == "array_contains_any" or op == "array-contains-any":
+            ok = isinstance(actual, list) and any(_order_key(item) == _order_key(v) for item in actual for v in value)
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        if not ok:
+            return False
+    return True
+
+
+class MemoryNotFound(Exception):
+    """Raised like google.api_core.exceptions.NotFound when updating a missing document."""
+
+
+# --- SNAPSHOTS AND REFERENCES ---
+class MemoryDocumentSnapshot:
+    def __init__(self, reference, data, create_time=None, update_time=None, read_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = read_time
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return _copy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        found, value = _get_field(self._data or {}, field_path)
+        if not found:
+            raise KeyError(field_path)
+        return _copy(value)
+
+
+class MemoryDocumentReference:
+    def __init__(self, client, collection_path, document_id):
+        self._client = client
+        self.id = document_id
+        self.path = f"{collection_path}/{document_id}"
+        self._collection_path = collection_path
+
+    def __eq__(self, other):
+        return isinstance(other, MemoryDocumentReference) and self.path == other.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return f"DocumentReference({self.path!r})"
+
+    @property
+    def parent(self):
+        return MemoryCollectionReference(self._client, self._collection_path)
+
+    def collection(self, name):
+        return MemoryCollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self):
+        return self._client._snapshot(self)
+
+    def set(self, data, merge=False):
+        return self._client._commit([("set", self, data, merge)])[0]
+
+    def update(self, data):
+        return self._client._commit([("update", self, data, None)])[0]
+
+    def delete(self):
+        return self._client._commit([("delete", self, None, None)])[0]
+
+
+class ChangeType(Enum):
+    ADDED = 1
+    MODIFIED = 2
+    REMOVED = 3
+
+
+DocumentChange = namedtuple("DocumentChange", ["type", "document", "old_index", "new_index"])
+
+
+# --- QUERIES ---
+class MemoryQuery:
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+    def __init__(self, client, collection_path, filters=(), orders=(), limit=None, cursor=None):
+        self._client = client
+        self._collection_path = collection_path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+
+    def _with(self, **changes):
+        state = {"filters": self._filters, "orders": self._orders, "limit": self._limit, "cursor": self._cursor}
+        state.update(changes)
+        return MemoryQuery(self._client, self._collection_path, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._with(filters=self._filters + ((str(field_path), op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._with(orders=self._orders + ((str(field_path), direction),))
+
+    def limit(self, count):
+        return self._with(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._with(cursor=document_fields_or_snapshot)
+
+    def _effective_orders(self):
+        orders = list(self._orders)
+        if not orders:
+            # Like Firestore, an inequality filter orders results by its field first
+            inequality = [f for f, op, _ in self._filters if op in ("<", "<=", ">", ">=", "!=", "not-in")]
+            if inequality:
+                orders.append((inequality[0], self.ASCENDING))
+        return tuple(orders)
+
+    def _sort_key(self, doc_id, data, orders):
+        parts = []
+        for field, direction in orders:
+            if field == DOCUMENT_ID:
+                key = (4, doc_id)
+            else:
+                found, value = _get_field(data, field)
+                if not found:
+                    return None  # Documents missing an order_by field are left out
+                key = _order_key(value)
+            parts.append(_Descending(key) if direction == self.DESCENDING else key)
+        parts.append(doc_id)
+        return tuple(parts)
+
+    def _cursor_key(self, orders):
+        cursor = self._cursor
+        if isinstance(cursor, MemoryDocumentSnapshot):
+            return self._sort_key(cursor.id, cursor._data or {}, orders)
+        if isinstance(cursor, dict):
+            name = cursor.get(DOCUMENT_ID)
+            doc_id = getattr(name, "id", name) or ""
+            return self._sort_key(doc_id, cursor, [(f, d) for f, d in orders if f == DOCUMENT_ID or f in cursor])
+        raise TypeError("start_after expects a document snapshot or a field mapping")
+
+    def stream(self, transaction=None):
+        return iter(self._client._run_query(self))
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        return self._client._watch(self, callback)
+
+
+class MemoryCollectionReference(MemoryQuery):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, document_id=None):
+        document_id = document_id or "".join(random.choices(AUTO_ID_CHARS, k=20))
+        return MemoryDocumentReference(self._client, self._collection_path, document_id)
+
+    def add(self, document_data, document_id=None):
+        reference = self.document(document_id)
+        result = reference.set(document_data)
+        return result.update_time, reference
+
+
+# --- WRITES ---
+WriteResult = namedtuple("WriteResult", ["update_time"])
+
+
+class MemoryWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(("set", reference, document_data, merge))
+
+    def update(self, reference, field_updates):
+        self._writes.append(("update", reference, field_updates, None))
+
+    def delete(self, reference):
+        self._writes.append(("delete", reference, None, None))
+
+    def commit(self):
+        return self._client._commit(self._writes)
+
+
+# --- STORE ---
+class _CollectionStore:
+    def __init__(self):
+        self.docs = {}  # id -> (data, create_time, update_time)
+        self.change_versions = []  # Parallel to change_ids, ascending
+        self.change_ids = []
+        self.version = 0
+        self.query_cache = {}
+        self.watches = []
+
+
+class _QueryIndex:
+    """
+    One query's matching documents as a sorted list of sort keys, kept up to
+    date from the collection's change log instead of rescanning. Keys of
+    documents that stop matching are dropped lazily, which keeps the
+    "processed == False" style scans that agents page through cheap while
+    they update the very documents they read.
+    """
+
+    def __init__(self):
+        self.version = -1
+        self.keys = []
+        self.by_id = {}
+        self.stale = 0
+
+
+class MemoryClient:
+    """
+    Firestore-compatible client that keeps everything in this process:
+    collections, where/FieldFilter, order_by, limit/start_after, stream,
+    get_all, batches with atomic commits, SERVER_TIMESTAMP and snapshot
+    listeners. Enough for every agent in this repo to run unmodified.
+    """
+
+    def __init__(self):
+        self._stores = {}
+        self._lock = threading.RLock()
+        self.stats = {"reads": 0, "writes": 0, "commits": 0, "queries": 0}
+
+    # --- Client API ---
+    def collection(self, path):
+        return MemoryCollectionReference(self, path)
+
+    def document(self, path):
+        collection_path, _, document_id = path.rpartition("/")
+        return MemoryDocumentReference(self, collection_path, document_id)
+
+    def batch(self):
+        return MemoryWriteBatch(self)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        for reference in references:
+            yield self._snapshot(reference)
+
+    def collection_sizes(self):
+        with self._lock:
+            return {path: len(store.docs) for path, store in self._stores.items()}
+
+    # --- Internals ---
+    def _store(self, path):
+        store = self._stores.get(path)
+        if store is None:
+            store = self._stores[path] = _CollectionStore()
+        return store
+
+    def _snapshot(self, reference):
+        with self._lock:
+            self.stats["reads"] += 1
+            entry = self._store(reference._collection_path).docs.get(reference.id)
+        data, create_time, update_time = entry or (None, None, None)
+        return MemoryDocumentSnapshot(reference, data, create_time, update_time, datetime.now(timezone.utc))
+
+    def _commit(self, writes):
+        now = datetime.now(timezone.utc)
+        changed = {}
+        with self._lock:
+            # Work out every new state first so a failing write leaves nothing applied
+            pending = {}
+            for method, reference, data, merge in writes:
+                store = self._store(reference._collection_path)
+                key = (reference._collection_path, reference.id)
+                current = pending[key] if key in pending else store.docs.get(reference.id)
+                if method == "set":
+                    value = _resolve(data, now)
+                    if merge and current is not None:
+                        value = _merge(current[0], value)
+                    pending[key] = (value, current[1] if current else now, now)
+                elif method == "update":
+                    if current is None:
+                        raise MemoryNotFound(f"404 No document to update: {reference.path}")
+                    value = current[0]
+                    for field, field_value in data.items():
+                        value = _set_field(value, field, _resolve(field_value, now))
+                    pending[key] = (value, current[1], now)
+                else:
+                    pending[key] = None
+
+            for (collection_path, document_id), entry in pending.items():
+                store = self._store(collection_path)
+                before = store.docs.get(document_id)
+                if entry is None:
+                    store.docs.pop(document_id, None)
+                else:
+                    store.docs[document_id] = entry
+                store.version += 1
+                store.change_versions.append(store.version)
+                store.change_ids.append(document_id)
+                if store.watches:
+                    changed.setdefault(collection_path, []).append((document_id, before, entry))
+            self.stats["writes"] += len(writes)
+            self.stats["commits"] += 1
+
+        for collection_path, changes in changed.items():
+            for watch in list(self._store(collection_path).watches):
+                watch.notify(changes, now)
+        return [WriteResult(now) for _ in writes]
+
+    def _refresh(self, query, store, orders):
+        signature = repr((query._filters, orders))
+        index = store.query_cache.get(signature)
+        if index is None:
+            index = store.query_cache[signature] = _QueryIndex()
+        if index.version == store.version:
+            return index
+        if index.version < 0:
+            for doc_id, (data, _, _) in store.docs.items():
+                if _matches(doc_id, data, query._filters):
+                    key = query._sort_key(doc_id, data, orders)
+                    if key is not None:
+                        index.by_id[doc_id] = key
+            index.keys = sorted(index.by_id.values())
+        else:
+            start = bisect.bisect_right(store.change_versions, index.version)
+            for doc_id in set(store.change_ids[start:]):
+                old_key = index.by_id.pop(doc_id, None)
+                if old_key is not None:
+                    index.stale += 1
+                entry = store.docs.get(doc_id)
+                if entry is None or not _matches(doc_id, entry[0], query._filters):
+                    continue
+                key = query._sort_key(doc_id, entry[0], orders)
+                if key is None:
+                    continue
+                index.by_id[doc_id] = key
+                position = bisect.bisect_left(index.keys, key)
+                if position < len(index.keys) and index.keys[position] == key:
+                    index.stale -= 1  # Same key still in the list; it is live again
+                else:
+                    index.keys.insert(position, key)
+            if index.stale > max(1024, len(index.by_id)):
+                index.keys = sorted(index.by_id.values())
+                index.stale = 0
+        index.version = store.version
+        return index
+
+    def _run_query(self, query):
+        orders = query._effective_orders()
+        with self._lock:
+            self.stats["queries"] += 1
+            store = self._store(query._collection_path)
+            index = self._refresh(query, store, orders)
+            position = 0
+            if query._cursor is not None:
+                cursor_key = query._cursor_key(orders)
+                position = bisect.bisect_right(index.keys, cursor_key) if cursor_key is not None else 0
+            results = []
+            limit = query._limit if query._limit is not None else len(index.keys)
+            read_time = datetime.now(timezone.utc)
+            while position < len(index.keys) and len(results) < limit:
+                key = index.keys[position]
+                position += 1
+                doc_id = key[-1]
+                if index.by_id.get(doc_id) != key:
+                    continue  # Stale entry for a document that changed
+                data, create_time, update_time = store.docs[doc_id]
+                reference = MemoryDocumentReference(self, query._collection_path, doc_id)
+                results.append(MemoryDocumentSnapshot(reference, data, create_time, update_time, read_time))
+            self.stats["reads"] += len(results)
+        return results
+
+    def _watch(self, query, callback):
+        watch = _Watch(self, query, callback)
+        with self._lock:
+            self._store(query._collection_path).watches.append(watch)
+            initial = self._run_query(query)
+        watch.start(initial)
+        return watch
+
+
+class _Watch:
+    """Delivers query snapshots on a background thread, like the real listener."""
+
+    def __init__(self, client, query, callback):
+        self._client = client
+        self._query = query
+        self._callback = callback
+        self._events = queue.Queue()
+        self._matching = {}
+        self._lock = threading.Lock()  # Commits from BatchWriter threads can notify concurrently
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self, initial):
+        changes = []
+        for index, snapshot in enumerate(initial):
+            self._matching[snapshot.id] = snapshot
+            changes.append(DocumentChange(ChangeType.ADDED, snapshot, -1, index))
+        self._events.put((list(self._matching.values()), changes, datetime.now(timezone.utc)))
+        self._thread.start()
+
+    def notify(self, writes, read_time):
+        with self._lock:
+            self._notify(writes, read_time)
+
+    def _notify(self, writes, read_time):
+        changes = []
+        for doc_id, _, entry in writes:
+            was_matching = doc_id in self._matching
+            reference = MemoryDocumentReference(self._client, self._query._collection_path, doc_id)
+            matches = entry is not None and _matches(doc_id, entry[0], self._query._filters)
+            snapshot = MemoryDocumentSnapshot(reference, entry[0] if entry else None,
+                                              entry[1] if entry else None, entry[2] if entry else None, read_time)
+            if matches:
+                self._matching[doc_id] = snapshot
+                change_type = ChangeType.MODIFIED if was_matching else ChangeType.ADDED
+                changes.append(DocumentChange(change_type, snapshot, -1, -1))
+            elif was_matching:
+                del self._matching[doc_id]
+                changes.append(DocumentChange(ChangeType.REMOVED, snapshot, -1, -1))
+        if changes:
+            self._events.put((list(self._matching.values()), changes, read_time))
+
+    def _run(self):
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+            self._callback(*event)
+
+    def unsubscribe(self):
+        with self._client._lock:
+            watches = self._client._store(self._query._collection_path).watches
+            if self in watches:
+                watches.remove(self)
+        self._events.put(None)
+
+
+# --- CLIENT ACCESS ---
+_memory_client = None
+_memory_client_lock = threading.Lock()
+
+
+def memory_client():
+    """The process-wide in-memory client, shared by every agent so their writes see each other."""
+    global _memory_client
+    with _memory_client_lock:
+        if _memory_client is None:
+            _memory_client = MemoryClient()
+        return _memory_client
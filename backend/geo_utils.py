@@ -0,0 +1,202 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+
+# --- CONSTANTS ---
+EARTH_RADIUS_M = 6371008.8  # Mean Earth radius, as used by BigQuery geography functions
+METERS_PER_DEGREE_LAT = np.pi * EARTH_RADIUS_M / 180.0
+GEOHASH_PRECISION = 9  # ~4.8 m x 4.8 m cells
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+# --- DISTANCES ---
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters; all arguments may be NumPy arrays (broadcast)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def spherical_centroid(lats, lons):
+    """Centroid of points on the sphere (mean of unit vectors), like ST_CENTROID_AGG."""
+    lat_r, lon_r = np.radians(lats), np.radians(lons)
+    x = np.mean(np.cos(lat_r) * np.cos(lon_r))
+    y = np.mean(np.cos(lat_r) * np.sin(lon_r))
+    z = np.mean(np.sin(lat_r))
+    return float(np.degrees(np.arctan2(z, np.hypot(x, y)))), float(np.degrees(np.arctan2(y, x)))
+
+
+# --- LOCATION PARSING ---
+def _coordinate_pair(lat, lng):
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(lat) or math.isnan(lng) or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+def parse_location(data):
+    """
+    Returns (lat, lng) from a submission or issue document, or None.
+
+    Accepts every shape found in the collections: a "lat, lng" string,
+    {lat, lng} or {latitude, longitude} maps, a Firestore GeoPoint, and
+    top-level lat/lng or latitude/longitude fields.
+    """
+    location = data.get("location")
+    if isinstance(location, str):
+        parts = location.split(",")
+        if len(parts) == 2:
+            return _coordinate_pair(parts[0].strip(), parts[1].strip())
+    elif isinstance(location, dict):
+        if location.get("lat") is not None and location.get("lng") is not None:
+            return _coordinate_pair(location["lat"], location["lng"])
+        if location.get("latitude") is not None and location.get("longitude") is not None:
+            return _coordinate_pair(location["latitude"], location["longitude"])
+    elif location is not None and hasattr(location, "latitude") and hasattr(location, "longitude"):
+        return _coordinate_pair(location.latitude, location.longitude)  # firestore.GeoPoint
+
+    if data.get("lat") is not None and data.get("lng") is not None:
+        return _coordinate_pair(data["lat"], data["lng"])
+    if data.get("latitude") is not None and data.get("longitude") is not None:
+        return _coordinate_pair(data["latitude"], data["longitude"])
+    return None
+
+
+def normalize_location(data, precision=GEOHASH_PRECISION):
+    """Canonical {"latitude", "longitude", "geohash"} for a document, or None if it has no location."""
+    location = parse_location(data)
+    if location is None:
+        return None
+    return {"latitude": location[0], "longitude": location[1], "geohash": geohash_encode(*location, precision)}
+
+
+# --- GEOHASH ---
+def geohash_encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def geohash_bounds(geohash):
+    """Returns (lat_min, lat_max, lng_min, lng_max) of a geohash cell."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            interval = lng_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            interval[0 if (value >> shift) & 1 else 1] = middle
+            even = not even
+    return lat_range[0], lat_range[1], lng_range[0], lng_range[1]
+
+
+def _geohash_cell_m(precision, lat):
+    lat_bits, lng_bits = (5 * precision) // 2, (5 * precision + 1) // 2
+    height = 180.0 / (1 << lat_bits) * METERS_PER_DEGREE_LAT
+    width = 360.0 / (1 << lng_bits) * METERS_PER_DEGREE_LAT * math.cos(math.radians(min(abs(lat), 89.0)))
+    return min(height, width)
+
+
+def geohash_cover(lat, lng, radius_m):
+    """
+    Geohash prefixes whose cells cover every point within radius_m: the cell
+    around the point and its eight neighbours, at the finest precision whose
+    cells are still at least radius_m across.
+    """
+    precision = 1
+    while precision < GEOHASH_PRECISION and _geohash_cell_m(precision + 1, lat) >= radius_m:
+        precision += 1
+    lat_min, lat_max, lng_min, lng_max = geohash_bounds(geohash_encode(lat, lng, precision))
+    center_lat, center_lng = (lat_min + lat_max) / 2, (lng_min + lng_max) / 2
+    height, width = lat_max - lat_min, lng_max - lng_min
+    prefixes = set()
+    for d_lat in (-1, 0, 1):
+        for d_lng in (-1, 0, 1):
+            neighbour_lat = min(89.999999, max(-89.999999, center_lat + d_lat * height))
+            neighbour_lng = (center_lng + d_lng * width + 180.0) % 360.0 - 180.0
+            prefixes.add(geohash_encode(neighbour_lat, neighbour_lng, precision))
+    return sorted(prefixes)
+
+
+def geohash_ranges(prefixes):
+    """[start, end) string ranges for Firestore `geohash >= start` / `geohash < end` range scans."""
+    return [(prefix, prefix + "~") for prefix in prefixes]  # "~" sorts after every base32 character
+
+
+# --- SPATIAL INDEX ---
+class GridIndex:
+    """
+    Buckets points into roughly `cell_m`-sized lat/lon cells, optionally per
+    key (e.g. subcategory), and answers radius queries with a true haversine
+    check against only the neighbouring cells.
+    """
+
+    def __init__(self, cell_m):
+        self.cell_m = cell_m
+        self.lat_step = cell_m / METERS_PER_DEGREE_LAT
+        self._cells = defaultdict(list)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _lon_step(self, row):
+        # Use the row edge closest to the pole so no cell in the row is narrower than cell_m
+        edge_lat = min(89.0, max(abs(row * self.lat_step), abs((row + 1) * self.lat_step)))
+        return self.lat_step / math.cos(math.radians(edge_lat))
+
+    def cell_of(self, lat, lon):
+        """Returns the (row, col) cell containing the point."""
+        row = math.floor(lat / self.lat_step)
+        return row, math.floor(lon / self._lon_step(row))
+
+    def neighbor_cells(self, lat, lon, radius_m):
+        """Returns every (row, col) cell that may hold points within radius_m of the point."""
+        reach = max(1, math.ceil(radius_m / self.cell_m))
+        center_row = math.floor(lat / self.lat_step)
+        cells = []
+        for row in range(center_row - reach, center_row + reach + 1):
+            center_col = math.floor(lon / self._lon_step(row))
+            cells.extend((row, col) for col in range(center_col - reach, center_col + reach + 1))
+        return cells
+
+    def add(self, lat, lon, item, key=None):
+        row, col = self.cell_of(lat, lon)
+        self._cells[(key, row, col)].append((lat, lon, item))
+        self._size += 1
+
+    def query(self, lat, lon, radius_m, key=None):
+        """Returns [(item, distance_m)] within radius_m of the point, nearest first."""
+        candidates = []
+        for row, col in self.neighbor_cells(lat, lon, radius_m):
+            candidates.extend(self._cells.get((key, row, col), ()))
+        if not candidates:
+            return []
+        lats = np.array([c[0] for c in candidates])
+        lons = np.array([c[1] for c in candidates])
+        distances = haversine_m(lat, lon, lats, lons)
+        hits = np.flatnonzero(distances <= radius_m)
+        hits = hits[np.argsort(distances[hits], kind="stable")]
+        return [(candidates[i][2], float(distances[i])) for i in hits]
+
+    def has_nearby(self, lat, lon, radius_m, key=None):
+        return bool(self.query(lat, lon, radius_m, key))
@@ -1,38 +1,51 @@
 import os
 import sys
-from datetime import datetime, timedelta
-from google.cloud import bigquery, firestore
-from shapely import wkt
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from metrics import get_logger, run_agent, timer
+
+log = get_logger("geospatial")
 
 # --- CONFIGURATION ---
 try:
     from dotenv import load_dotenv
     load_dotenv()
-    print("✅ Local .env file loaded.")
+    log.debug("✅ Local .env file loaded.")
 except ImportError:
-    print("ℹ️ dotenv not found, assuming production environment.")
+    log.info("ℹ️ dotenv not found, assuming production environment.")
 
 PROJECT_ID = os.getenv("PROJECT_ID")
 BQ_DATASET = os.getenv("BQ_DATASET", "issue_data")
 BQ_TABLE = os.getenv("BQ_TABLE", "historical_issues")
 BQ_REGION = os.getenv("BQ_REGION", "asia-south1")
 ISSUES_COLLECTION = "issues"
-
-if not PROJECT_ID:
-    print("❌ FATAL: Missing PROJECT_ID environment variable.")
-    sys.exit(1)
+# "bigquery" clusters in BigQuery; "local" clusters in-process with hotspot_engine;
+# "incremental" keeps cluster state between runs and only applies new issues
+HOTSPOT_BACKEND = os.getenv("HOTSPOT_BACKEND", "bigquery")
 
 
 # --- CLIENT INITIALIZATION ---
-def initialize_clients():
-    """Initializes and returns BigQuery and Firestore clients."""
+def initialize_clients(use_bigquery=True):
+    """Initializes and returns BigQuery (or None) and Firestore clients."""
+    # Checked here rather than at import time so the module can be imported without credentials.
+    if not PROJECT_ID:
+        log.critical("❌ FATAL: Missing PROJECT_ID environment variable.")
+        sys.exit(1)
+
+    from firestore_backend import use_memory_backend, memory_client
     try:
-        bq_client = bigquery.Client(project=PROJECT_ID, location=BQ_REGION)
+        if use_bigquery:
+            from google.cloud import bigquery
+        bq_client = bigquery.Client(project=PROJECT_ID, location=BQ_REGION) if use_bigquery else None
+        if use_memory_backend():
+            return bq_client, memory_client()
+        from google.cloud import firestore
         firestore_client = firestore.Client(project=PROJECT_ID)
-        print("✅ Google Cloud clients initialized successfully.")
+        log.info("✅ Google Cloud clients initialized successfully.")
         return bq_client, firestore_client
     except Exception as e:
-        print(f"❌ FATAL: Could not initialize Google Cloud clients: {e}")
+        log.critical("❌ FATAL: Could not initialize Google Cloud clients: %s", e)
         sys.exit(1)
 
 
@@ -62,90 +75,198 @@ def get_prediction_query(table_id: str) -> str:
 
 
 # --- COOLDOWN LOGIC ---
-def check_for_recent_prediction(db, subcategory, point):
-    """Checks if a similar prediction was made recently to avoid duplicates."""
-    from google.cloud.firestore_v1.base_query import FieldFilter
-    
-    seven_days_ago = datetime.utcnow() - timedelta(days=7)
-    lat_offset = 0.01
-    lon_offset = 0.01
-
-    # ✅ FIXED: Using modern FieldFilter syntax to remove warnings
-    query = db.collection(ISSUES_COLLECTION) \
-        .where(filter=FieldFilter("type", "==", "predicted")) \
-        .where(filter=FieldFilter("subcategory", "==", subcategory)) \
-        .where(filter=FieldFilter("created_at", ">=", seven_days_ago)) \
-        .where(filter=FieldFilter("location", ">=", firestore.GeoPoint(point.y - lat_offset, point.x - lon_offset))) \
-        .where(filter=FieldFilter("location", "<=", firestore.GeoPoint(point.y + lat_offset, point.x + lon_offset)))
+COOLDOWN_DAYS = 7
+COOLDOWN_RADIUS_M = 1000  # Replaces the old ±0.01° bounding box with a true distance check
+# Scan only the geohash cells around each hotspot instead of every predicted issue.
+# Requires the geohash field on older issues (python location_backfill.py).
+COOLDOWN_GEOHASH_SCAN = os.getenv("COOLDOWN_GEOHASH_SCAN", "0") == "1"
+
+
+def _geohash_scan(db, points):
+    """Streams the issues whose geohash falls in the cells covering each (lat, lng)."""
+    from firestore_backend import FieldFilter
+    from geo_utils import geohash_cover, geohash_ranges
+
+    prefixes = sorted({prefix for lat, lng in points for prefix in geohash_cover(lat, lng, COOLDOWN_RADIUS_M)})
+    seen = set()
+    for start, end in geohash_ranges(prefixes):
+        query = (db.collection(ISSUES_COLLECTION)
+                 .where(filter=FieldFilter("geohash", ">=", start))
+                 .where(filter=FieldFilter("geohash", "<", end)))
+        for doc in query.stream():
+            if doc.id not in seen:
+                seen.add(doc.id)
+                yield doc
+
+
+def load_recent_predictions(db, points=None):
+    """
+    Fetches every predicted issue from the last COOLDOWN_DAYS once and returns
+    a GridIndex keyed by subcategory for in-memory cooldown checks.
+
+    Only the single-field "created_at" range runs in Firestore, so the read
+    is bounded by the window rather than the whole prediction history and no
+    composite index is required; the "type" filter is applied in memory. With
+    COOLDOWN_GEOHASH_SCAN and the candidate hotspot `points`, only geohash
+    range scans around those points are read instead.
+    """
+    from firestore_backend import FieldFilter
+    from embedding_index import to_epoch
+    from geo_utils import GridIndex, parse_location
+
+    cutoff_time = datetime.now(timezone.utc) - timedelta(days=COOLDOWN_DAYS)
+    cutoff = cutoff_time.timestamp()
+    cooldown = GridIndex(COOLDOWN_RADIUS_M)
 
     try:
-        results = query.limit(1).stream()
-        return len(list(results)) > 0
+        if COOLDOWN_GEOHASH_SCAN and points is not None:
+            docs = _geohash_scan(db, points)
+        else:
+            docs = db.collection(ISSUES_COLLECTION).where(filter=FieldFilter("created_at", ">=", cutoff_time)).stream()
+        for doc in docs:
+            data = doc.to_dict()
+            location = parse_location(data)
+            if data.get("type") != "predicted" or location is None or to_epoch(data.get("created_at")) < cutoff:
+                continue
+            cooldown.add(location[0], location[1], doc.id, key=data.get("subcategory"))
     except Exception as e:
-        print(f"⚠️  Warning: Could not check for recent predictions. Have you created the Firestore index? {e}")
-        return False
+        log.warning("⚠️  Warning: Could not load recent predictions for the cooldown check: %s", e)
+
+    log.info("🧊 Loaded %d recent prediction(s) for the cooldown check.", len(cooldown))
+    return cooldown
+
+
+def check_for_recent_prediction(cooldown, subcategory, point):
+    """Checks if a similar prediction was made recently to avoid duplicates."""
+    return cooldown.has_nearby(point.y, point.x, COOLDOWN_RADIUS_M, key=subcategory)
+
+
+# --- LOCAL CLUSTERING ---
+def find_hotspots_locally(bq_client, table_id, source):
+    """Runs the same per-subcategory DBSCAN + risk scoring in-process; returns BigQuery-shaped rows."""
+    import hotspot_engine
+
+    if source == "bigquery":
+        log.info("📥 Streaming %s from BigQuery for local clustering...", table_id)
+        points = hotspot_engine.load_points_bigquery(bq_client, table_id)
+    else:
+        source = source or hotspot_engine.DEFAULT_SOURCE
+        log.info("📂 Loading historical issues from %s...", source)
+        points = hotspot_engine.load_points(source)
+
+    log.info("🧮 Clustering %d issues locally...", len(points['latitude']))
+    return hotspot_engine.find_hotspots(points)
+
+
+def find_hotspots_incrementally(bq_client, table_id, source):
+    """Applies only the issues since the saved watermark; returns hotspots that newly crossed the threshold."""
+    import hotspot_engine
+    from incremental_hotspots import IncrementalHotspots
+
+    state = IncrementalHotspots()
+    try:
+        if source == "bigquery":
+            log.info("📥 Streaming new rows of %s since the last run...", table_id)
+            points = hotspot_engine.load_points_bigquery(bq_client, table_id, since=state.watermark)
+        else:
+            source = source or hotspot_engine.DEFAULT_SOURCE
+            log.info("📂 Loading historical issues from %s...", source)
+            points = hotspot_engine.load_points(source)
+        return state.apply(points)
+    finally:
+        state.close()
 
 
 # --- MAIN LOGIC ---
-def main():
+def main(backend=HOTSPOT_BACKEND, source=None):
     """Main function to execute the prediction workflow."""
-    bq_client, firestore_client = initialize_clients()
+    from firestore_backend import GeoPoint, SERVER_TIMESTAMP
+    from shapely import wkt
+    from geo_utils import geohash_encode
+    from batch_writer import BatchWriter
+
+    use_bigquery = backend == "bigquery" or source == "bigquery"
+    bq_client, firestore_client = initialize_clients(use_bigquery)
     table_id = f"{PROJECT_ID}.{BQ_DATASET}.{BQ_TABLE}"
-    query = get_prediction_query(table_id)
     
-    print(f"\n🛰️  Querying BigQuery for geospatial hotspots...")
-    print(f"   - Table: {table_id}")
-    try:
-        results = bq_client.query(query).result()
-        print("✅ BigQuery query completed successfully.")
-    except Exception as e:
-        print(f"❌ ERROR: BigQuery query failed: {e}")
-        return
+    if backend in ("local", "incremental"):
+        try:
+            if backend == "incremental":
+                results = find_hotspots_incrementally(bq_client, table_id, source)
+            else:
+                results = find_hotspots_locally(bq_client, table_id, source)
+            log.info("✅ Local clustering completed successfully.")
+        except Exception as e:
+            log.error("❌ ERROR: Local clustering failed: %s", e)
+            return
+    else:
+        query = get_prediction_query(table_id)
+        log.info("🛰️  Querying BigQuery for geospatial hotspots (table %s)...", table_id)
+        try:
+            with timer("bigquery_query", query="hotspots"):
+                results = bq_client.query(query).result()
+            log.info("✅ BigQuery query completed successfully.")
+        except Exception as e:
+            log.error("❌ ERROR: BigQuery query failed: %s", e)
+            return
 
-    batch = firestore_client.batch()
+    results = [(row, wkt.loads(row.predicted_location)) for row in results]
+    cooldown = load_recent_predictions(firestore_client, [(point.y, point.x) for _, point in results])
+    writer = BatchWriter(firestore_client, label="predicted issues")
+    predicted_docs = {}
     prediction_count = 0
     skipped_count = 0
     
-    print("\n✍️  Processing high-risk zones from query results...")
-    for row in results:
-        point = wkt.loads(row.predicted_location)
-        
-        if check_for_recent_prediction(firestore_client, row.subcategory, point):
-            print(f"  - Skipping duplicate hotspot: {row.subcategory} (found recent prediction)")
+    log.info("✍️  Processing high-risk zones from query results...")
+    for row, point in results:
+        if check_for_recent_prediction(cooldown, row.subcategory, point):
+            log.debug("  - Skipping duplicate hotspot: %s (found recent prediction)", row.subcategory)
             skipped_count += 1
             continue
 
         prediction_count += 1
-        print(f"  - Found new hotspot #{prediction_count}: {row.subcategory} (Risk: {row.final_risk_score:.2f})")
+        log.debug("  - Found new hotspot #%d: %s (Risk: %.2f)", prediction_count, row.subcategory, row.final_risk_score)
         
         issue_data = {
             "type": "predicted",
             "status": "new",
             "category": row.category,
             "subcategory": row.subcategory,
-            "location": firestore.GeoPoint(point.y, point.x),
+            "location": GeoPoint(point.y, point.x),
+            "geo_point": GeoPoint(point.y, point.x),
+            "geohash": geohash_encode(point.y, point.x),
             "prediction_meta": {
                 "risk_score": row.final_risk_score,
                 "source_issue_count": row.source_issue_count
             },
-            "created_at": firestore.SERVER_TIMESTAMP,
+            "created_at": SERVER_TIMESTAMP,
         }
         
         doc_ref = firestore_client.collection(ISSUES_COLLECTION).document()
-        batch.set(doc_ref, issue_data)
+        writer.set(doc_ref, issue_data)
+        predicted_docs[doc_ref.id] = issue_data
+        # Later rows in this run must also respect the cooldown for this hotspot
+        cooldown.add(point.y, point.x, doc_ref.id, key=row.subcategory)
     
     if prediction_count > 0:
-        print(f"\n🔥 Committing {prediction_count} new predicted issue(s) to Firestore...")
-        try:
-            batch.commit()
-            print(f"🎉 Successfully committed batch.")
-        except Exception as e:
-            print(f"❌ ERROR: Firestore batch commit failed: {e}")
+        log.info("🔥 Committing %d new predicted issue(s) to Firestore...", prediction_count)
+        writer.close()
+        failed = writer.failed_paths
+        if len(failed) < prediction_count:
+            log.info("🎉 Successfully committed %d predicted issue(s).", prediction_count - len(failed))
+        from tile_aggregator import record_tile_updates
+        record_tile_updates(ISSUES_COLLECTION, documents={
+            doc_id: data for doc_id, data in predicted_docs.items() if f"{ISSUES_COLLECTION}/{doc_id}" not in failed})
     else:
-        print("\n✅ No new high-risk zones found to predict.")
+        writer.close()
+        log.info("✅ No new high-risk zones found to predict.")
 
     if skipped_count > 0:
-        print(f"ℹ️  Skipped {skipped_count} duplicate predictions.")
+        log.info("ℹ️  Skipped %d duplicate predictions.", skipped_count)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Predict issue hotspots and create predicted issues.")
+    parser.add_argument("--backend", choices=["bigquery", "local", "incremental"], default=HOTSPOT_BACKEND)
+    parser.add_argument("--source", help="Local/incremental backend input: a .csv/.parquet file or 'bigquery' to stream the table")
+    args = parser.parse_args()
+    run_agent("geospatial_agent", main, args.backend, args.source)
\ No newline at end of file
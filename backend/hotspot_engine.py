@@ -0,0 +1,297 @@
+import os
+import sys
+import csv
+import math
+import time
+import argparse
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from geo_utils import EARTH_RADIUS_M, METERS_PER_DEGREE_LAT, haversine_m, spherical_centroid
+from metrics import get_logger
+
+# --- CONFIGURATION ---
+# Mirrors geospatial_agent.get_prediction_query: ST_CLUSTERDBSCAN(point, 1000, 2)
+HOTSPOT_EPS_M = 1000.0
+HOTSPOT_MIN_POINTS = 2
+HOTSPOT_RISK_THRESHOLD = 0.7
+HOTSPOT_LIMIT = 10
+DEFAULT_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "historical_data.csv")
+
+# Grid cells are this fraction of eps wide so any two points sharing a cell are within eps
+CELL_FRACTION = 0.7
+BROADCAST_PAIR_LIMIT = 4096  # Above this many point pairs, use a BallTree instead of a distance matrix
+
+log = get_logger("hotspots")
+
+# Same attribute names as the BigQuery result rows consumed by geospatial_agent.main()
+HotspotRow = namedtuple("HotspotRow", ["category", "subcategory", "source_issue_count", "final_risk_score", "predicted_location"])
+
+
+# --- LOADING ---
+def _parse_timestamp(value):
+    if not value:
+        return np.nan
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return np.nan
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _build_points(rows):
+    """Turns an iterable of dict-like rows into column arrays, dropping rows without coordinates."""
+    columns = {"latitude": [], "longitude": [], "category": [], "subcategory": [], "risk_score": [], "timestamp": []}
+    for row in rows:
+        lat, lon = _to_float(row.get("latitude")), _to_float(row.get("longitude"))
+        if np.isnan(lat) or np.isnan(lon):
+            continue
+        columns["latitude"].append(lat)
+        columns["longitude"].append(lon)
+        columns["category"].append(row.get("category") or "")
+        columns["subcategory"].append(row.get("subcategory") or "")
+        columns["risk_score"].append(_to_float(row.get("risk_score")))
+        columns["timestamp"].append(_parse_timestamp(row.get("timestamp")))
+    return {
+        "latitude": np.asarray(columns["latitude"], dtype=np.float64),
+        "longitude": np.asarray(columns["longitude"], dtype=np.float64),
+        "category": np.asarray(columns["category"], dtype=object),
+        "subcategory": np.asarray(columns["subcategory"], dtype=object),
+        "risk_score": np.asarray(columns["risk_score"], dtype=np.float64),
+        "timestamp": np.asarray(columns["timestamp"], dtype=np.float64),
+    }
+
+
+def load_points_csv(path):
+    with open(path, newline="") as f:
+        return _build_points(csv.DictReader(f))
+
+
+def load_points_parquet(path):
+    try:
+        import pandas as pd
+    except ImportError:
+        log.critical("❌ Reading Parquet requires pandas and pyarrow (pip install pandas pyarrow).")
+        sys.exit(1)
+    return _build_points(pd.read_parquet(path).to_dict("records"))
+
+
+def load_points_bigquery(bq_client, table_id, page_size=100_000, since=None):
+    """Streams the historical table page by page instead of clustering it in BigQuery."""
+    # `since` (epoch seconds) limits the read to rows after an incremental watermark
+    since_filter = f"AND timestamp > TIMESTAMP_MICROS({int(since * 1_000_000)})" if since is not None else ""
+    query = f"""
+    SELECT latitude, longitude, category, subcategory, risk_score, CAST(timestamp AS STRING) AS timestamp
+    FROM `{table_id}`
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL {since_filter}
+    """
+    from metrics import timer
+    with timer("bigquery_query", query="points"):
+        rows = bq_client.query(query).result(page_size=page_size)
+        return _build_points(dict(row.items()) for row in rows)
+
+
+def load_points(source):
+    """Loads issue points from a .csv or .parquet file."""
+    if source.endswith(".parquet"):
+        return load_points_parquet(source)
+    return load_points_csv(source)
+
+
+# --- CLUSTERING ---
+class _UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+
+def _within_eps(lats, lons, a, b, eps_m, trees, b_key):
+    """True if any point of index set `a` is within eps of any point of index set `b`."""
+    if len(a) * len(b) <= BROADCAST_PAIR_LIMIT:
+        distances = haversine_m(lats[a][:, None], lons[a][:, None], lats[b][None, :], lons[b][None, :])
+        return bool((distances <= eps_m).any())
+    from sklearn.neighbors import BallTree
+    if b_key not in trees:
+        trees[b_key] = BallTree(np.radians(np.column_stack([lats[b], lons[b]])), metric="haversine")
+    nearest, _ = trees[b_key].query(np.radians(np.column_stack([lats[a], lons[a]])), k=1)
+    return bool((nearest[:, 0] * EARTH_RADIUS_M <= eps_m).any())
+
+
+def dbscan_haversine(lats, lons, eps_m=HOTSPOT_EPS_M, min_points=HOTSPOT_MIN_POINTS):
+    """
+    DBSCAN on great-circle distance; returns one label per point (-1 = noise).
+
+    Points are bucketed into grid cells smaller than eps, so any two points
+    sharing a cell are neighbours. Every point in a cell holding at least
+    `min_points` points is therefore core without a distance test; only
+    points in sparse cells get a haversine BallTree neighbour count. Each
+    cell's core points are connected internally, so clusters are found by
+    union-find over cells, testing only neighbouring cell pairs instead of
+    materialising neighbour lists (which explodes for dense data). Border
+    points join the cluster of their nearest core point.
+    """
+    from sklearn.neighbors import BallTree
+
+    n = len(lats)
+    labels = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return labels
+
+    coords = np.radians(np.column_stack([lats, lons]))
+    eps_rad = eps_m / EARTH_RADIUS_M
+
+    # --- Bucket points into cells no wider than CELL_FRACTION * eps ---
+    cell_m = eps_m * CELL_FRACTION
+    abs_lat = np.abs(lats)
+    cos_min, cos_max = math.cos(math.radians(abs_lat.min())), math.cos(math.radians(min(abs_lat.max(), 89.0)))
+    lat_step = cell_m / METERS_PER_DEGREE_LAT
+    lon_step = cell_m / (METERS_PER_DEGREE_LAT * cos_min)
+    reach_y = math.ceil(eps_m / cell_m)
+    reach_x = math.ceil(eps_m / (lon_step * METERS_PER_DEGREE_LAT * cos_max))
+    cell_xy = np.column_stack([np.floor(lons / lon_step), np.floor(lats / lat_step)]).astype(np.int64)
+
+    # --- Core points: dense cells are core outright, sparse cells need a neighbour count ---
+    _, cell_of_point, cell_sizes = np.unique(cell_xy, axis=0, return_inverse=True, return_counts=True)
+    is_core = cell_sizes[cell_of_point.reshape(-1)] >= min_points
+    sparse = np.flatnonzero(~is_core)
+    counts = np.zeros(n, dtype=np.int64)
+    if sparse.size:
+        counts[sparse] = BallTree(coords, metric="haversine").query_radius(coords[sparse], eps_rad, count_only=True)
+        is_core[sparse] = counts[sparse] >= min_points
+    core = np.flatnonzero(is_core)
+    if core.size == 0:
+        return labels
+
+    cell_keys, cell_of_core = np.unique(cell_xy[core], axis=0, return_inverse=True)
+    cell_of_core = cell_of_core.reshape(-1)
+    order = np.argsort(cell_of_core, kind="stable")
+    members = np.split(core[order], np.cumsum(np.bincount(cell_of_core, minlength=len(cell_keys)))[:-1])
+    lookup = {(int(x), int(y)): i for i, (x, y) in enumerate(cell_keys)}
+
+    # --- Union neighbouring cells that share a core pair within eps ---
+    offsets = [(dx, dy) for dx in range(-reach_x, reach_x + 1) for dy in range(-reach_y, reach_y + 1)
+               if (dx, dy) > (0, 0)]
+    cells = _UnionFind(len(cell_keys))
+    trees = {}
+    for i, (x, y) in enumerate(cell_keys):
+        for dx, dy in offsets:
+            j = lookup.get((int(x) + dx, int(y) + dy))
+            if j is None or cells.find(i) == cells.find(j):
+                continue
+            if _within_eps(lats, lons, members[i], members[j], eps_m, trees, j):
+                cells.union(i, j)
+
+    roots = np.array([cells.find(i) for i in range(len(cell_keys))])
+    _, cluster_of_cell = np.unique(roots, return_inverse=True)
+    labels[core] = cluster_of_cell[cell_of_core]
+
+    # --- Border points: non-core points with a core point within eps ---
+    border = sparse[(counts[sparse] > 1) & (labels[sparse] == -1)]
+    if border.size:
+        core_tree = BallTree(coords[core], metric="haversine")
+        distances, nearest = core_tree.query(coords[border], k=1)
+        within = distances[:, 0] <= eps_rad
+        labels[border[within]] = labels[core[nearest[within, 0]]]
+    return labels
+
+
+# --- HOTSPOTS ---
+def score_clusters(points, indexes, labels, risk_threshold=HOTSPOT_RISK_THRESHOLD):
+    """Aggregates clustered points per (category, cluster) like the BigQuery GROUP BY."""
+    rows = []
+    clustered = labels >= 0
+    indexes, labels = indexes[clustered], labels[clustered]
+    if indexes.size == 0:
+        return rows
+    categories = points["category"][indexes]
+    group_keys = np.array([f"{category}\x00{label}" for category, label in zip(categories, labels)], dtype=object)
+    order = np.argsort(group_keys, kind="stable")
+    unique_keys, starts = np.unique(group_keys[order], return_index=True)
+    for group in np.split(indexes[order], starts[1:]):
+        risks = points["risk_score"][group]
+        if np.isnan(risks).all():
+            continue  # AVG(NULL) makes the BigQuery score NULL, so the row never passes HAVING
+        score = len(group) * 0.5 + float(np.nanmean(risks)) * 0.5
+        if score <= risk_threshold:
+            continue
+        lat, lon = spherical_centroid(points["latitude"][group], points["longitude"][group])
+        first = group[0]
+        rows.append(HotspotRow(points["category"][first], points["subcategory"][first], len(group), score,
+                               f"POINT({lon} {lat})"))
+    return rows
+
+
+def find_hotspots(points, eps_m=HOTSPOT_EPS_M, min_points=HOTSPOT_MIN_POINTS,
+                  risk_threshold=HOTSPOT_RISK_THRESHOLD, limit=HOTSPOT_LIMIT):
+    """Local equivalent of geospatial_agent.get_prediction_query(); returns HotspotRow tuples."""
+    rows = []
+    subcategories = points["subcategory"]
+    for subcategory in np.unique(subcategories):
+        indexes = np.flatnonzero(subcategories == subcategory)
+        labels = dbscan_haversine(points["latitude"][indexes], points["longitude"][indexes], eps_m, min_points)
+        rows.extend(score_clusters(points, indexes, labels, risk_threshold))
+    rows.sort(key=lambda row: row.final_risk_score, reverse=True)
+    return rows[:limit] if limit else rows
+
+
+# --- BENCHMARK ---
+def synthetic_points(count, seed=42, center=(24.5854, 73.7125), spread_km=40.0):
+    """Clustered synthetic issues around a city centre plus ~20% uniform noise."""
+    rng = np.random.default_rng(seed)
+    subcategories = np.array(["pothole", "streetlight", "garbage", "water leakage", "traffic signal"], dtype=object)
+    spread_deg = spread_km / 111.32
+    clustered = int(count * 0.8)
+    centers = rng.uniform(-spread_deg / 2, spread_deg / 2, size=(max(1, count // 200), 2)) + center
+    owner = rng.integers(0, len(centers), clustered)
+    lats = np.concatenate([centers[owner, 0] + rng.normal(0, 0.003, clustered),
+                           center[0] + rng.uniform(-spread_deg / 2, spread_deg / 2, count - clustered)])
+    lons = np.concatenate([centers[owner, 1] + rng.normal(0, 0.003, clustered),
+                           center[1] + rng.uniform(-spread_deg / 2, spread_deg / 2, count - clustered)])
+    subcategory = subcategories[rng.integers(0, len(subcategories), count)]
+    return {
+        "latitude": lats, "longitude": lons,
+        "category": np.full(count, "civic", dtype=object), "subcategory": subcategory,
+        "risk_score": rng.uniform(0, 1, count), "timestamp": np.full(count, time.time()),
+    }
+
+
+def run_benchmark(count):
+    print(f"🧪 Generating {count:,} synthetic issue points...")
+    points = synthetic_points(count)
+    start = time.perf_counter()
+    rows = find_hotspots(points, limit=None)
+    elapsed = time.perf_counter() - start
+    print(f"📊 Clustered {count:,} points into {len(rows):,} hotspots in {elapsed:.2f}s "
+          f"({count / elapsed:,.0f} points/sec)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local DBSCAN hotspot engine.")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="CSV or Parquet file of historical issues")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="Benchmark on N synthetic points instead")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(args.benchmark)
+    else:
+        for hotspot in find_hotspots(load_points(args.source)):
+            print(f"🔥 {hotspot.subcategory} ({hotspot.category}): {hotspot.source_issue_count} issues, "
+                  f"risk {hotspot.final_risk_score:.2f} at {hotspot.predicted_location}")
@@ -2,64 +2,83 @@ import os
 import sys
 import json
 from datetime import datetime, timedelta
-from PIL import Image
-from PIL.ExifTags import TAGS
-import imagehash
-import firebase_admin
-from firebase_admin import credentials, firestore
 from dotenv import load_dotenv
 
+from metrics import get_logger, run_agent, timer
+
+# Pillow, imagehash, NumPy and firebase_admin are imported on the code paths
+# that need them; a `--validate <id> <path>` call for a 'dummy' submission never
+# touches Firebase at all.
+
 # Load environment variables
 load_dotenv()
 
 # --- CONFIGURATION ---
 SERVICE_ACCOUNT_FILE = os.getenv("SERVICE_ACCOUNT_FILE")
 RAW_SUBMISSIONS_COLLECTION = "raw_submissions"
-MAX_AGE_HOURS = 12  # Maximum age of image in hours (12 hours - stricter)
-MIN_IMAGE_SIZE = 100 * 1024  # 100KB minimum
-MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB maximum
+IMAGE_HASH_THRESHOLD = 5  # Max Hamming distance for two images to count as duplicates
+DUPLICATE_WINDOW_DAYS = 7  # How far back duplicate detection looks
+
+log = get_logger("image_validator")
 
 # --- INITIALIZATION ---
 def initialize_firebase():
     """Initialize Firebase connection."""
+    from firestore_backend import use_memory_backend, memory_client
+    if use_memory_backend():
+        return memory_client()
+    import firebase_admin
+    from firebase_admin import credentials, firestore
     try:
         cred = credentials.Certificate(SERVICE_ACCOUNT_FILE)
         if not firebase_admin._apps:
             firebase_admin.initialize_app(cred)
         db = firestore.client()
-        print("✅ Firebase Initialized Successfully.")
+        log.info("✅ Firebase Initialized Successfully.")
         return db
     except Exception as e:
-        print(f"❌ FATAL: Could not initialize Firebase: {e}")
+        log.critical("❌ FATAL: Could not initialize Firebase: %s", e)
         sys.exit(1)
 
 # --- IMAGE METADATA EXTRACTION ---
 def extract_image_metadata(image_path):
     """Extract metadata from image file."""
     if not os.path.exists(image_path):
-        print(f"❌ Image file does not exist: {image_path}")
+        log.warning("❌ Image file does not exist: %s", image_path)
         return None
-    
+    content = read_image_content(image_path)
+    return with_file_metadata(content, image_path) if content else None
+
+def read_image_content(image_path):
+    """
+    The metadata that depends only on the image bytes: format, dimensions,
+    EXIF (creation_time is the EXIF date or None) and phash. This is the
+    expensive part, and what validation_cache stores.
+    """
+    from PIL import Image
+    from PIL.ExifTags import TAGS
+    from phash_index import compute_phash
     try:
         with Image.open(image_path) as img:
+            # Format, dimensions and EXIF come from the header; no pixels are decoded for them
             metadata = {
                 'format': img.format,
                 'mode': img.mode,
                 'size': img.size,
-                'file_size': os.path.getsize(image_path),
-                'file_name': os.path.basename(image_path),
                 'exif_data': {},
                 'creation_time': None,
-                'modification_time': None,
-                'image_hash': str(imagehash.phash(img))
+                'image_hash': None
             }
+            exif = img._getexif()
+            # Reduced-resolution decode; must run after size/mode are read
+            with timer("phash"):
+                metadata['image_hash'] = str(compute_phash(img))
             
-            print(f"📸 Image loaded: {img.format} {img.size} {metadata['file_size']} bytes")
+            log.debug("📸 Image loaded: %s %s", img.format, metadata['size'])
             
             # Extract EXIF data
-            exif = img._getexif()
             if exif:
-                print(f"📋 EXIF data found: {len(exif)} tags")
+                log.debug("📋 EXIF data found: %d tags", len(exif))
                 for tag_id in exif:
                     tag = TAGS.get(tag_id, tag_id)
                     data = exif.get(tag_id)
@@ -69,30 +88,57 @@ def extract_image_metadata(image_path):
                     if tag in ['DateTime', 'DateTimeOriginal', 'DateTimeDigitized']:
                         try:
                             metadata['creation_time'] = datetime.strptime(str(data), '%Y:%m:%d %H:%M:%S')
-                            print(f"📅 EXIF creation time: {metadata['creation_time']}")
+                            log.debug("📅 EXIF creation time: %s", metadata['creation_time'])
                         except Exception as e:
-                            print(f"⚠️ Could not parse EXIF date: {data} - {e}")
+                            log.debug("⚠️ Could not parse EXIF date: %s - %s", data, e)
             else:
-                print("⚠️ No EXIF data found in image")
-            
-            # Get file modification time
-            metadata['modification_time'] = datetime.fromtimestamp(os.path.getmtime(image_path))
-            print(f"📅 File modification time: {metadata['modification_time']}")
-            
-            # If no EXIF creation time, use file modification time as fallback
-            if not metadata['creation_time']:
-                metadata['creation_time'] = metadata['modification_time']
-                print(f"📅 Using file modification time as creation time: {metadata['creation_time']}")
+                log.debug("⚠️ No EXIF data found in image")
             
             return metadata
             
     except Exception as e:
-        print(f"❌ Error extracting metadata from {image_path}: {e}")
+        log.error("❌ Error extracting metadata from %s: %s", image_path, e)
         return None
 
+def with_file_metadata(content, image_path):
+    """Adds the fields that belong to this file rather than its bytes: name, size and timestamps."""
+    metadata = dict(content)
+    metadata['file_size'] = os.path.getsize(image_path)
+    metadata['file_name'] = os.path.basename(image_path)
+    
+    # Get file modification time
+    metadata['modification_time'] = datetime.fromtimestamp(os.path.getmtime(image_path))
+    log.debug("📅 File modification time: %s", metadata['modification_time'])
+    
+    # If no EXIF creation time, use file modification time as fallback
+    if not metadata['creation_time']:
+        metadata['creation_time'] = metadata['modification_time']
+        log.debug("📅 Using file modification time as creation time: %s", metadata['creation_time'])
+    
+    return metadata
+
+def load_image_metadata(image_path, submission_id, cache):
+    """
+    extract_image_metadata through the content-addressed validation cache:
+    bytes seen before skip the decode and phash. Returns (metadata,
+    duplicate_of), where duplicate_of names the earlier submission (or file)
+    with identical bytes.
+    """
+    if cache is None or not os.path.exists(image_path):
+        return extract_image_metadata(image_path), None
+    from validation_cache import file_digest
+    digest = file_digest(image_path)
+    entry = cache.get(digest)
+    if entry is None:
+        content = read_image_content(image_path)
+        if not content:
+            return None, None
+        entry = cache.put(digest, content, image_path, submission_id)
+    return with_file_metadata(entry.content, image_path), cache.duplicate_of(digest, entry, image_path, submission_id)
+
 # --- IMAGE VALIDATION ---
 def validate_image_metadata(metadata):
-    """Validate image metadata for authenticity and recency."""
+    """Validate image metadata for authenticity and recency (see validation_rules.RULES)."""
     if not metadata:
         return {
             'is_valid': False,
@@ -100,177 +146,82 @@ def validate_image_metadata(metadata):
             'errors': ['No metadata found'],
             'metadata': None
         }
-    
-    validation_results = {
-        'is_valid': True,
-        'warnings': [],
-        'errors': [],
-        'metadata': metadata
-    }
-    
-    # Check file size
-    if metadata['file_size'] < MIN_IMAGE_SIZE:
-        validation_results['errors'].append(f"Image too small: {metadata['file_size']} bytes")
-        validation_results['is_valid'] = False
-    
-    if metadata['file_size'] > MAX_IMAGE_SIZE:
-        validation_results['errors'].append(f"Image too large: {metadata['file_size']} bytes")
-        validation_results['is_valid'] = False
-    
-    # Check image format
-    if metadata['format'] not in ['JPEG', 'JPG', 'PNG', 'WEBP']:
-        validation_results['warnings'].append(f"Unusual format: {metadata['format']}")
-    
-    # Check image dimensions
-    width, height = metadata['size']
-    if width < 200 or height < 200:
-        validation_results['warnings'].append(f"Small image dimensions: {width}x{height}")
-    
-    # Check creation time
-    creation_time = metadata.get('creation_time')
-    modification_time = metadata.get('modification_time')
-    
-    if creation_time:
-        age_hours = (datetime.now() - creation_time).total_seconds() / 3600
-        if age_hours > MAX_AGE_HOURS:
-            validation_results['errors'].append(f"Image too old: {age_hours:.1f} hours old (max 12 hours)")
-            validation_results['is_valid'] = False
-        elif age_hours > 6:
-            validation_results['warnings'].append(f"Image is {age_hours:.1f} hours old")
-        
-        # Additional check for very recent images (suspicious if too new)
-        if age_hours < 0.1:  # Less than 6 minutes old
-            validation_results['warnings'].append("Image created very recently (may be suspicious)")
-    
-    # Check modification time
-    if modification_time:
-        mod_age_hours = (datetime.now() - modification_time).total_seconds() / 3600
-        if mod_age_hours > MAX_AGE_HOURS:
-            validation_results['warnings'].append(f"File modified {mod_age_hours:.1f} hours ago")
-        
-        # Check if file was modified very recently
-        if mod_age_hours < 0.1:  # Less than 6 minutes ago
-            validation_results['warnings'].append("File modified very recently (suspicious)")
-    
-    # Check for future timestamps (impossible)
-    if creation_time and creation_time > datetime.now():
-        validation_results['errors'].append("Image has future timestamp (impossible)")
-        validation_results['is_valid'] = False
-    
-    # Check for suspicious EXIF data
-    exif_data = metadata.get('exif_data', {})
-    
-    # Check for GPS data (should be present for recent photos)
-    has_gps = any('GPS' in str(key) for key in exif_data.keys())
-    if not has_gps:
-        validation_results['warnings'].append("No GPS data found (may be edited)")
-    
-    # Check for camera make/model
-    has_camera_info = any(key in str(exif_data.keys()) for key in ['Make', 'Model'])
-    if not has_camera_info:
-        validation_results['warnings'].append("No camera information found")
-    
-    # Check for software editing (indicates manipulation)
-    if 'Software' in exif_data:
-        software = str(exif_data['Software']).lower()
-        if any(editor in software for editor in ['photoshop', 'gimp', 'paint', 'canva', 'pixlr']):
-            validation_results['errors'].append("Image appears to be edited with image software")
-            validation_results['is_valid'] = False
-    
-    # Check for suspicious file names (downloaded images)
-    file_name = metadata.get('file_name', '').lower()
-    if any(indicator in file_name for indicator in ['download', 'screenshot', 'copy', 'img_', 'photo_']):
-        validation_results['warnings'].append("Suspicious filename (may be downloaded)")
-    
-    # Check for very recent modification (suspicious)
-    if modification_time:
-        time_diff = abs((modification_time - creation_time).total_seconds())
-        if time_diff < 60:  # Less than 1 minute difference
-            validation_results['warnings'].append("File modified very recently (suspicious)")
-    
-    # Check for missing EXIF data (common in downloaded images)
-    if len(exif_data) < 5:
-        validation_results['warnings'].append("Very little EXIF data (may be downloaded)")
-    
-    # Check for specific image dimensions (screenshots)
-    if width == 1920 and height == 1080:
-        validation_results['warnings'].append("Common screenshot resolution detected")
-    elif width == 1366 and height == 768:
-        validation_results['warnings'].append("Common laptop screenshot resolution detected")
-    
-    # Check for suspicious patterns in image data
-    if metadata.get('file_size', 0) < 50000:  # Less than 50KB
-        validation_results['warnings'].append("Very small file size (may be compressed/edited)")
-    
-    # Check for common fake image indicators
-    if 'Software' in exif_data:
-        software = str(exif_data['Software']).lower()
-        if any(editor in software for editor in ['screenshot', 'snip', 'printscreen']):
-            validation_results['errors'].append("Image appears to be a screenshot")
-            validation_results['is_valid'] = False
-    
-    # Check for suspicious file modification patterns
-    if modification_time and creation_time:
-        time_diff = abs((modification_time - creation_time).total_seconds())
-        if time_diff < 30:  # Less than 30 seconds difference
-            validation_results['warnings'].append("File created and modified almost simultaneously (suspicious)")
-    
-    # Check for image quality indicators
-    if width < 800 or height < 600:
-        validation_results['warnings'].append("Low resolution image (may be poor quality)")
-    
-    # Check for excessive compression
-    if metadata.get('file_size', 0) > 0:
-        compression_ratio = (width * height * 3) / metadata['file_size']  # Rough estimate
-        if compression_ratio > 50:  # Very high compression
-            validation_results['warnings'].append("Image appears heavily compressed")
-    
-    # Check for common fake image file patterns
-    file_name = metadata.get('file_name', '').lower()
-    suspicious_patterns = ['screenshot', 'snip', 'capture', 'print', 'copy', 'download', 'save']
-    if any(pattern in file_name for pattern in suspicious_patterns):
-        validation_results['warnings'].append("Suspicious filename detected")
-    
-    # Check for image format consistency
-    if metadata.get('format') == 'PNG' and 'Software' in exif_data:
-        software = str(exif_data['Software']).lower()
-        if 'screenshot' in software or 'snip' in software:
-            validation_results['errors'].append("PNG image appears to be a screenshot")
-            validation_results['is_valid'] = False
-    
-    return validation_results
+    from validation_rules import get_rule_set
+    return get_rule_set().validate(metadata)
 
 # --- DUPLICATE DETECTION ---
-def check_for_duplicates(db, image_hash, submission_id):
-    """Check if similar image already exists."""
+def get_stored_image_hash(data):
+    """Returns the phash stored on a submission by either the validator or the perception agent."""
+    return data.get('image_hash') or (data.get('image_metadata') or {}).get('image_hash')
+
+def load_phash_index(db, snapshot_path=None):
+    """
+    Builds the near-duplicate index for the last DUPLICATE_WINDOW_DAYS.
+
+    Restores the on-disk snapshot when one exists and only reads submissions
+    created after it from Firestore; otherwise falls back to a full window scan.
+    A single range filter on created_at is used, so no composite index is needed.
+    """
+    from phash_index import PHashIndex, PHASH_SNAPSHOT_PATH
+
+    snapshot_path = snapshot_path or PHASH_SNAPSHOT_PATH
+    window_seconds = DUPLICATE_WINDOW_DAYS * 24 * 3600
+    since = datetime.utcnow() - timedelta(days=DUPLICATE_WINDOW_DAYS)
+    phash_index = PHashIndex(window_seconds=window_seconds)
+
+    if snapshot_path and os.path.exists(snapshot_path):
+        try:
+            phash_index = PHashIndex.load(snapshot_path, window_seconds=window_seconds)
+            if phash_index.latest_timestamp:
+                since = max(since, datetime.utcfromtimestamp(phash_index.latest_timestamp))
+            log.info("📦 Restored %d image hashes from %s", len(phash_index), snapshot_path)
+        except Exception as e:
+            log.warning("⚠️ Could not restore phash snapshot, rebuilding from Firestore: %s", e)
+            phash_index = PHashIndex(window_seconds=window_seconds)
+
     try:
-        # Query for similar images in the last 7 days
-        seven_days_ago = datetime.now() - timedelta(days=7)
-        
-        query = db.collection(RAW_SUBMISSIONS_COLLECTION).where(
-            'image_hash', '==', image_hash
-        ).where('created_at', '>=', seven_days_ago)
-        
-        similar_docs = query.stream()
-        
-        for doc in similar_docs:
-            if doc.id != submission_id:
-                return True, doc.id
-        
-        return False, None
-        
+        known_ids = set(phash_index.ids)
+        query = db.collection(RAW_SUBMISSIONS_COLLECTION).where('created_at', '>=', since)
+        for doc in query.stream():
+            data = doc.to_dict()
+            image_hash = get_stored_image_hash(data)
+            if image_hash and doc.id not in known_ids:
+                phash_index.add(doc.id, image_hash, data.get('created_at'))
     except Exception as e:
-        print(f"❌ Error checking for duplicates: {e}")
-        return False, None
+        log.error("❌ Error loading recent image hashes: %s", e)
+
+    log.info("🧮 Duplicate index ready with %d image hashes", len(phash_index))
+    return phash_index
+
+def flag_exact_duplicate(validation_results, duplicate_of):
+    """Marks the result as a byte-for-byte copy of an earlier upload."""
+    validation_results['errors'].append(f"Duplicate image found (exact copy of {duplicate_of})")
+    validation_results['is_valid'] = False
+
+def apply_duplicate_check(phash_index, submission_id, metadata, validation_results, exact_duplicate=False):
+    """Flags the result as a duplicate if needed and adds the image to the index."""
+    if not exact_duplicate:  # An exact copy is already flagged; the phash match would only repeat it
+        is_duplicate, duplicate_id = check_for_duplicates(phash_index, metadata['image_hash'], submission_id)
+        if is_duplicate:
+            validation_results['errors'].append(f"Duplicate image found (ID: {duplicate_id})")
+            validation_results['is_valid'] = False
+    phash_index.add(submission_id, metadata['image_hash'])
+
+def check_for_duplicates(phash_index, image_hash, submission_id):
+    """Check if a similar image (within IMAGE_HASH_THRESHOLD bits) already exists."""
+    for match_id, distance in phash_index.search(image_hash, IMAGE_HASH_THRESHOLD):
+        if match_id != submission_id:
+            return True, match_id
+    return False, None
 
 # --- MAIN VALIDATION FUNCTION ---
-def validate_submission_image(db, submission_id, image_path):
+def validate_submission_image(db, submission_id, image_path, phash_index=None):
     """Main function to validate an uploaded image."""
-    print(f"\n🔍 Validating image for submission: {submission_id}")
-    print(f"📁 Image path: {image_path}")
+    from validation_cache import get_validation_cache
+    log.debug("🔍 Validating image for submission %s (%s)", submission_id, image_path)
     
-    # Extract metadata
-    metadata = extract_image_metadata(image_path)
+    # Extract metadata; repeat uploads of the same bytes come from the cache
+    metadata, duplicate_of = load_image_metadata(image_path, submission_id, get_validation_cache())
     if not metadata:
         return {
             'is_valid': False,
@@ -281,95 +232,247 @@ def validate_submission_image(db, submission_id, image_path):
     
     # Validate metadata
     validation_results = validate_image_metadata(metadata)
+    if duplicate_of:
+        flag_exact_duplicate(validation_results, duplicate_of)
     
-    # Skip duplicate detection for now to avoid Firestore index issues
-    # is_duplicate, duplicate_id = check_for_duplicates(db, metadata['image_hash'], submission_id)
-    # if is_duplicate:
-    #     validation_results['errors'].append(f"Duplicate image found (ID: {duplicate_id})")
-    #     validation_results['is_valid'] = False
+    # Near-duplicate detection runs only when the caller has loaded a phash index
+    if phash_index is not None:
+        apply_duplicate_check(phash_index, submission_id, metadata, validation_results, bool(duplicate_of))
     
     # Update Firestore with validation results (only if submission_id is not 'dummy')
     if submission_id != 'dummy':
+        from firestore_backend import SERVER_TIMESTAMP
         try:
             doc_ref = db.collection(RAW_SUBMISSIONS_COLLECTION).document(submission_id)
             doc_ref.update({
                 'image_validation': validation_results,
                 'image_metadata': metadata,
-                'validated_at': firestore.SERVER_TIMESTAMP
+                'validated_at': SERVER_TIMESTAMP
             })
-            print("✅ Validation results saved to Firestore")
+            log.debug("✅ Validation results saved to Firestore")
         except Exception as e:
-            print(f"⚠️ Could not save validation results (document may not exist yet): {e}")
-    
-    # Print results
-    print(f"\n📊 Validation Results:")
-    print(f"   Valid: {validation_results['is_valid']}")
-    print(f"   Errors: {len(validation_results['errors'])}")
-    print(f"   Warnings: {len(validation_results['warnings'])}")
-    
-    if validation_results['errors']:
-        print("   ❌ Errors:")
-        for error in validation_results['errors']:
-            print(f"      - {error}")
+            log.warning("⚠️ Could not save validation results for %s (document may not exist yet): %s", submission_id, e)
     
-    if validation_results['warnings']:
-        print("   ⚠️  Warnings:")
-        for warning in validation_results['warnings']:
-            print(f"      - {warning}")
+    # Log results
+    log.debug("📊 Validation results for %s: valid=%s, errors=%s, warnings=%s", submission_id,
+              validation_results['is_valid'], validation_results['errors'], validation_results['warnings'])
     
     return validation_results
 
 # --- BATCH VALIDATION ---
-def validate_pending_images():
-    """Validate all pending images in the database."""
+def commit_updates_in_chunks(db, updates):
+    """Writes (doc_ref, data) updates in concurrent, individually retried 500-write chunks."""
+    from batch_writer import BatchWriter
+    with BatchWriter(db, label="validation results") as writer:
+        for doc_ref, data in updates:
+            writer.update(doc_ref, data)
+
+def read_contents_in_parallel(pending, workers, cache):
+    """
+    Image content for every (doc, image_path) in `pending`, in order, with
+    the earlier upload each one exactly duplicates (or None). Only the first
+    copy of bytes that are not cached yet is decoded, in a process pool.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from validation_cache import file_digest
+
+    digests = [None] * len(pending)
+    entries, first_index = {}, {}
+    if cache is not None:
+        for i, (_, image_path) in enumerate(pending):
+            try:
+                digests[i] = file_digest(image_path)
+            except OSError:
+                continue
+            if digests[i] not in first_index:
+                first_index[digests[i]] = i
+                entries[digests[i]] = cache.get(digests[i])
+    to_read = [i for i, digest in enumerate(digests)
+               if digest is None or (first_index[digest] == i and entries[digest] is None)]
+
+    read = {}
+    if to_read:
+        chunksize = max(1, len(to_read) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            read = dict(zip(to_read, executor.map(read_image_content, [pending[i][1] for i in to_read],
+                                                  chunksize=chunksize)))
+
+    contents = []
+    for i, (doc, image_path) in enumerate(pending):
+        digest = digests[i]
+        if i in read:
+            if digest is not None and read[i]:
+                entries[digest] = cache.put(digest, read[i], image_path, doc.id)
+                contents.append((read[i], cache.duplicate_of(digest, entries[digest], image_path, doc.id)))
+            else:
+                contents.append((read[i], None))
+        elif entries.get(digest) is None:
+            contents.append((None, None))  # The first copy of these bytes could not be read
+        else:
+            entry = entries[digest]
+            contents.append((entry.content, cache.duplicate_of(digest, entry, image_path, doc.id)))
+    return contents
+
+def validate_images_in_parallel(db, pending, phash_index, workers):
+    """
+    Fans metadata extraction and hashing out to a process pool (skipping
+    bytes already in the validation cache), evaluates the rules over all the
+    extracted metadata in one vectorized pass, then writes results in
+    chunked batches.
+    """
+    from firestore_backend import SERVER_TIMESTAMP
+    from validation_cache import get_validation_cache
+    from validation_rules import get_rule_set
+
+    validated_count = 0
+    error_count = 0
+    updates = []
+
+    # Results arrive in submission order, so duplicate detection stays deterministic
+    analysed = []
+    for (doc, image_path), (content, duplicate_of) in zip(
+            pending, read_contents_in_parallel(pending, workers, get_validation_cache())):
+        if not content:
+            log.warning("❌ Could not extract image metadata for %s", doc.id)
+            error_count += 1
+            continue
+        analysed.append((doc, with_file_metadata(content, image_path), duplicate_of))
+    results, _ = get_rule_set().validate_many([metadata for _, metadata, _ in analysed])
+
+    for (doc, metadata, duplicate_of), validation_results in zip(analysed, results):
+        if duplicate_of:
+            flag_exact_duplicate(validation_results, duplicate_of)
+        apply_duplicate_check(phash_index, doc.id, metadata, validation_results, bool(duplicate_of))
+        updates.append((doc.reference, {
+            'image_validation': validation_results,
+            'image_metadata': metadata,
+            'validated_at': SERVER_TIMESTAMP
+        }))
+        validated_count += 1
+        if not validation_results['is_valid']:
+            error_count += 1
+
+    try:
+        commit_updates_in_chunks(db, updates)
+    except Exception as e:
+        log.error("❌ Could not save validation results: %s", e)
+
+    return validated_count, error_count
+
+def validate_pending_images(workers=1):
+    """Validate all pending images in the database, optionally across `workers` processes."""
+    import time
     db = initialize_firebase()
     
-    print("\n🚀 Starting batch image validation...")
+    log.info("🚀 Starting batch image validation...")
+    phash_index = load_phash_index(db)
     
     # Query for submissions with images that haven't been validated
     query = db.collection(RAW_SUBMISSIONS_COLLECTION).where(
         'image_path', '!=', None
     ).where('image_validation', '==', None)
     
-    pending_docs = query.stream()
+    from batch_writer import paginate
+    pending = []
+    for doc in paginate(query):
+        image_path = doc.to_dict().get('image_path')
+        if image_path and os.path.exists(image_path):
+            pending.append((doc, image_path))
+        else:
+            log.warning("⚠️  Image path not found for %s: %s", doc.id, image_path)
     
     validated_count = 0
     error_count = 0
+    start_time = time.perf_counter()
     
-    for doc in pending_docs:
-        data = doc.to_dict()
-        image_path = data.get('image_path')
-        
-        if image_path and os.path.exists(image_path):
+    if workers > 1 and len(pending) > 1:
+        log.info("⚙️  Validating %d images with %d worker processes...", len(pending), workers)
+        validated_count, error_count = validate_images_in_parallel(db, pending, phash_index, workers)
+    else:
+        for doc, image_path in pending:
             try:
-                validation_results = validate_submission_image(db, doc.id, image_path)
+                validation_results = validate_submission_image(db, doc.id, image_path, phash_index)
                 validated_count += 1
                 
                 if not validation_results['is_valid']:
                     error_count += 1
                     
             except Exception as e:
-                print(f"❌ Error validating {doc.id}: {e}")
+                log.error("❌ Error validating %s: %s", doc.id, e)
                 error_count += 1
-        else:
-            print(f"⚠️  Image path not found for {doc.id}: {image_path}")
     
-    print(f"\n✅ Batch validation complete!")
-    print(f"   Total validated: {validated_count}")
-    print(f"   Errors found: {error_count}")
-    print(f"   Success rate: {((validated_count - error_count) / validated_count * 100):.1f}%" if validated_count > 0 else "N/A")
+    elapsed = time.perf_counter() - start_time
+    
+    from validation_cache import get_validation_cache
+    cache = get_validation_cache()
+    if cache is not None:
+        cache.flush()
+        log.info("🗃️  Validation cache: %d hit(s), %d miss(es), %d evicted", cache.stats['hits'],
+                 cache.stats['misses'], cache.stats['evicted'])
+    
+    from phash_index import PHASH_SNAPSHOT_PATH
+    try:
+        phash_index.save(PHASH_SNAPSHOT_PATH)
+        log.info("💾 Saved phash snapshot to %s", PHASH_SNAPSHOT_PATH)
+    except Exception as e:
+        log.warning("⚠️ Could not save phash snapshot: %s", e)
+    
+    log.info("✅ Batch validation complete: %d validated, %d with errors%s%s", validated_count, error_count,
+             f", {(validated_count - error_count) / validated_count * 100:.1f}% valid" if validated_count > 0 else "",
+             f", {len(pending) / elapsed:.1f} images/sec ({elapsed:.2f}s)" if elapsed > 0 and pending else "")
+
+def check_phash_equivalence(image_dir):
+    """Compares fast (draft-mode) and full-decode phashes for every image in a directory."""
+    from PIL import Image
+    from phash_index import compute_phash, PHASH_DRAFT_TOLERANCE
+    import time
+    
+    distances = []
+    full_seconds = fast_seconds = 0.0
+    for name in sorted(os.listdir(image_dir)):
+        path = os.path.join(image_dir, name)
+        try:
+            start = time.perf_counter()
+            with Image.open(path) as img:
+                full_hash = compute_phash(img, fast=False)
+            full_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+            with Image.open(path) as img:
+                fast_hash = compute_phash(img, fast=True)
+            fast_seconds += time.perf_counter() - start
+        except Exception as e:
+            print(f"⚠️ Skipping {name}: {e}")
+            continue
+        distance = full_hash - fast_hash
+        distances.append(distance)
+        if distance > PHASH_DRAFT_TOLERANCE:
+            print(f"❌ {name}: fast hash differs by {distance} bits")
+    
+    if not distances:
+        print("⚠️ No images found.")
+        return True
+    print(f"\n📊 Compared {len(distances)} images: max distance {max(distances)}, mean {sum(distances) / len(distances):.2f}")
+    print(f"   Full decode: {full_seconds:.2f}s, draft decode: {fast_seconds:.2f}s ({full_seconds / max(fast_seconds, 1e-9):.1f}x faster)")
+    return max(distances) <= PHASH_DRAFT_TOLERANCE
 
 # --- COMMAND LINE ARGUMENTS ---
 def validate_single_image(submission_id, image_path):
     """Validate a single image."""
-    db = initialize_firebase()
+    # 'dummy' submissions are never written back, so skip the Firebase start-up cost
+    db = initialize_firebase() if submission_id != 'dummy' else None
     result = validate_submission_image(db, submission_id, image_path)
-    
+    print(json.dumps(to_json_result(result)))
+    return result
+
+def to_json_result(result):
+    """Converts a validation result into a JSON-serializable dict."""
     # Convert datetime objects to strings for JSON serialization
     json_result = {
         'is_valid': result['is_valid'],
         'warnings': result['warnings'],
         'errors': result['errors'],
+        'authenticity_score': result.get('authenticity_score'),
+        'failed_rules': result.get('failed_rules', []),
         'metadata': {}
     }
     
@@ -381,20 +484,30 @@ def validate_single_image(submission_id, image_path):
             metadata['modification_time'] = metadata['modification_time'].isoformat()
         json_result['metadata'] = metadata
     
-    print(json.dumps(json_result))
-    return result
+    return json_result
 
 # --- MAIN EXECUTION ---
 if __name__ == "__main__":
     import sys
     
-    if len(sys.argv) > 1 and sys.argv[1] == '--validate':
+    if len(sys.argv) > 1 and sys.argv[1] == '--check-phash':
+        image_dir = sys.argv[2] if len(sys.argv) > 2 else 'uploads'
+        sys.exit(0 if check_phash_equivalence(image_dir) else 1)
+    elif len(sys.argv) > 1 and sys.argv[1] == '--validate':
         if len(sys.argv) >= 4:
             submission_id = sys.argv[2]
             image_path = sys.argv[3]
-            print(f"🔍 Validating single image: {submission_id}")
+            log.debug("🔍 Validating single image: %s", submission_id)
             validate_single_image(submission_id, image_path)
         else:
             print("❌ Usage: python image_validator.py --validate <submission_id> <image_path>")
     else:
-        validate_pending_images() 
\ No newline at end of file
+        # Optional: --workers N validates pending images across N processes
+        workers = 1
+        if '--workers' in sys.argv:
+            try:
+                workers = int(sys.argv[sys.argv.index('--workers') + 1])
+            except (IndexError, ValueError):
+                print("❌ Usage: python image_validator.py [--workers N]")
+                sys.exit(1)
+        run_agent("image_validator", validate_pending_images, workers) 
\ No newline at end of file
@@ -0,0 +1,409 @@
+import os
+import math
+import time
+import sqlite3
+import argparse
+
+import numpy as np
+
+from geo_utils import EARTH_RADIUS_M, GridIndex
+from metrics import get_logger
+from hotspot_engine import (
+    CELL_FRACTION, DEFAULT_SOURCE, HOTSPOT_EPS_M, HOTSPOT_LIMIT, HOTSPOT_MIN_POINTS, HOTSPOT_RISK_THRESHOLD,
+    HotspotRow, dbscan_haversine, load_points, synthetic_points,
+)
+
+# --- CONFIGURATION ---
+HOTSPOT_STATE_PATH = os.getenv("HOTSPOT_STATE_PATH", "hotspot_state.sqlite3")
+# Issues older than this are expired from the clusters; 0 keeps the whole history like the BigQuery query
+HOTSPOT_WINDOW_DAYS = float(os.getenv("HOTSPOT_WINDOW_DAYS", "0"))
+
+log = get_logger("hotspots")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    id INTEGER PRIMARY KEY,
+    point_key TEXT NOT NULL UNIQUE,
+    subcategory TEXT NOT NULL,
+    category TEXT NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    risk_score REAL,
+    timestamp REAL,
+    cell_row INTEGER NOT NULL,
+    cell_col INTEGER NOT NULL,
+    cluster_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_points_cell ON points (subcategory, cell_row, cell_col);
+CREATE INDEX IF NOT EXISTS idx_points_timestamp ON points (timestamp);
+CREATE INDEX IF NOT EXISTS idx_points_cluster ON points (cluster_id);
+CREATE TABLE IF NOT EXISTS clusters (
+    cluster_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    subcategory TEXT NOT NULL,
+    point_count INTEGER NOT NULL,
+    risk_sum REAL NOT NULL,
+    risk_count INTEGER NOT NULL,
+    sum_x REAL NOT NULL,
+    sum_y REAL NOT NULL,
+    sum_z REAL NOT NULL,
+    score REAL,
+    PRIMARY KEY (cluster_id, category)
+);
+CREATE INDEX IF NOT EXISTS idx_clusters_score ON clusters (score);
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def _point_key(subcategory, category, lat, lon, timestamp):
+    # The historical table has no issue id, so a row is identified by its content
+    return f"{subcategory}|{category}|{lat:.7f}|{lon:.7f}|{timestamp}"
+
+
+def _nullable(value):
+    return None if value is None or (isinstance(value, float) and math.isnan(value)) else float(value)
+
+
+def _unit_vectors(lats, lons):
+    lat_r, lon_r = np.radians(lats), np.radians(lons)
+    return np.cos(lat_r) * np.cos(lon_r), np.cos(lat_r) * np.sin(lon_r), np.sin(lat_r)
+
+
+# --- REGION EXPANSION ---
+class _SubcategoryView:
+    """Lazily loads one subcategory's stored points cell by cell and answers eps-neighbour queries."""
+
+    def __init__(self, conn, subcategory, grid, eps_m):
+        self.conn = conn
+        self.subcategory = subcategory
+        self.grid = grid
+        self.eps_m = eps_m
+        self.points = {}  # id -> (lat, lon, category, risk_score, cluster_id)
+        self._loaded_cells = set()
+        self._cell_neighbours = {}
+        self._neighbours = {}
+
+    def _load(self, rows):
+        ids = []
+        for point_id, lat, lon, category, risk, cluster_id in rows:
+            self.points[point_id] = (lat, lon, category, risk, cluster_id)
+            ids.append(point_id)
+        return ids
+
+    def _cells_around(self, lat, lon):
+        # Any point sharing this point's cell is within two cell widths of it,
+        # so one widened lookup per cell covers the eps-neighbourhood of all of them
+        cell = self.grid.cell_of(lat, lon)
+        if cell not in self._cell_neighbours:
+            self._cell_neighbours[cell] = self.grid.neighbor_cells(lat, lon, self.eps_m + 2 * self.grid.cell_m)
+        return self._cell_neighbours[cell]
+
+    def _load_cells(self, coordinates):
+        missing = {c for lat, lon in coordinates for c in self._cells_around(lat, lon)} - self._loaded_cells
+        for row, col in missing:
+            self._load(self.conn.execute(
+                "SELECT id, latitude, longitude, category, risk_score, cluster_id FROM points "
+                "WHERE subcategory = ? AND cell_row = ? AND cell_col = ?", (self.subcategory, row, col)))
+        self._loaded_cells |= missing
+
+    def load_all(self):
+        return self._load(self.conn.execute(
+            "SELECT id, latitude, longitude, category, risk_score, cluster_id FROM points WHERE subcategory = ?",
+            (self.subcategory,)))
+
+    def cluster_members(self, cluster_id):
+        return self._load(self.conn.execute(
+            "SELECT id, latitude, longitude, category, risk_score, cluster_id FROM points WHERE cluster_id = ?",
+            (cluster_id,)))
+
+    def _query(self, coordinates):
+        """Ids of stored points within eps of each (lat, lon), in one vectorized pass."""
+        from sklearn.neighbors import BallTree
+
+        self._load_cells(coordinates)
+        ids = np.fromiter(self.points, dtype=np.int64, count=len(self.points))
+        if ids.size == 0:
+            return [[] for _ in coordinates]
+        stored = np.radians([self.points[p][:2] for p in ids])
+        tree = BallTree(stored, metric="haversine")
+        hits = tree.query_radius(np.radians(coordinates), self.eps_m / EARTH_RADIUS_M)
+        return [ids[h].tolist() for h in hits]
+
+    def near(self, coordinates):
+        return self._query(list(coordinates))
+
+    def neighbours(self, point_ids):
+        """Memoized eps-neighbours (including the point itself) of each stored point."""
+        missing = [p for p in point_ids if p not in self._neighbours]
+        if missing:
+            for point_id, hits in zip(missing, self._query([self.points[p][:2] for p in missing])):
+                self._neighbours[point_id] = hits
+        return [self._neighbours[p] for p in point_ids]
+
+
+def expand_region(view, seeds, stale_clusters, min_points):
+    """
+    Returns (region, halo): the ids whose DBSCAN label may have changed, and
+    their eps-neighbours outside it.
+
+    Inserting or deleting a point only changes the core status of points
+    within eps of it. Starting there, the region grows through every
+    neighbour of a core point, every core neighbour of a non-core point and
+    every member of a cluster it touches, so no cluster outside the region
+    can gain, lose or share a point with one inside. Reclustering region +
+    halo therefore reproduces a full DBSCAN for the region's points, at a cost
+    proportional to the clusters the delta touches rather than the table.
+    """
+    region, seen_clusters = set(), set()
+    frontier = {point_id for hits in view.near(seeds) for point_id in hits} if seeds else set()
+    stale = set(stale_clusters)
+
+    while frontier or stale:
+        for cluster_id in stale - seen_clusters:
+            frontier.update(view.cluster_members(cluster_id))
+        seen_clusters |= stale
+        frontier -= region
+        region |= frontier
+
+        reached, candidates = set(), set()
+        for neighbours in view.neighbours(list(frontier)):
+            (reached if len(neighbours) >= min_points else candidates).update(neighbours)
+        candidates = list(candidates - region - reached)
+        reached.update(p for p, hits in zip(candidates, view.neighbours(candidates)) if len(hits) >= min_points)
+
+        stale = {view.points[p][4] for p in frontier if view.points[p][4] is not None} - seen_clusters
+        frontier = reached - region
+
+    halo = {p for hits in view.neighbours(list(region)) for p in hits} - region
+    return region, halo
+
+
+# --- PERSISTENT STATE ---
+class IncrementalHotspots:
+    """
+    Keeps per-subcategory DBSCAN labels and per-(cluster, category) centroid
+    and risk-score aggregates in SQLite, so each run only reclusters the
+    neighbourhood of issues that arrived (or expired) since the watermark.
+    """
+
+    def __init__(self, path=HOTSPOT_STATE_PATH, eps_m=HOTSPOT_EPS_M, min_points=HOTSPOT_MIN_POINTS,
+                 risk_threshold=HOTSPOT_RISK_THRESHOLD, window_days=HOTSPOT_WINDOW_DAYS):
+        self.eps_m = eps_m
+        self.min_points = min_points
+        self.risk_threshold = risk_threshold
+        self.window_days = window_days
+        self.grid = GridIndex(eps_m * CELL_FRACTION)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+        params = f"{eps_m}:{min_points}"
+        if self._get_state("params", params) != params:
+            # Labels computed with other DBSCAN parameters are meaningless; start over
+            log.warning("⚠️  Clustering parameters changed. Rebuilding hotspot state from scratch.")
+            self.conn.executescript("DELETE FROM points; DELETE FROM clusters; DELETE FROM state;")
+        self._set_state("params", params)
+        self.conn.commit()
+
+    def _get_state(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_state(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, str(value)))
+
+    @property
+    def watermark(self):
+        value = self._get_state("watermark")
+        return float(value) if value is not None else None
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM points").fetchone()[0]
+
+    def _insert_new_points(self, points, seeds):
+        """Inserts rows newer than the watermark; returns (inserted count, newest timestamp seen)."""
+        watermark = self.watermark
+        timestamps = points["timestamp"]
+        fresh = np.flatnonzero(np.ones(len(timestamps), dtype=bool) if watermark is None else ~(timestamps <= watermark))
+
+        rows = {}
+        for i in fresh:
+            lat, lon = float(points["latitude"][i]), float(points["longitude"][i])
+            subcategory, category = points["subcategory"][i], points["category"][i]
+            timestamp = _nullable(timestamps[i])
+            key = _point_key(subcategory, category, lat, lon, timestamp)
+            rows[key] = (key, subcategory, category, lat, lon, _nullable(points["risk_score"][i]), timestamp,
+                         *self.grid.cell_of(lat, lon))
+
+        # Rows without a timestamp (or re-read at the watermark) may already be stored
+        keys = list(rows)
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            for (key,) in self.conn.execute(
+                    f"SELECT point_key FROM points WHERE point_key IN ({','.join('?' * len(chunk))})", chunk):
+                del rows[key]
+
+        self.conn.executemany(
+            "INSERT INTO points (point_key, subcategory, category, latitude, longitude, risk_score, timestamp, "
+            "cell_row, cell_col) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows.values())
+        for _, subcategory, _, lat, lon, *_ in rows.values():
+            seeds.setdefault(subcategory, []).append((lat, lon))
+
+        fresh_timestamps = timestamps[fresh]
+        newest = float(np.nanmax(fresh_timestamps)) if (~np.isnan(fresh_timestamps)).any() else None
+        return len(rows), newest
+
+    def _expire_old_points(self, now, seeds, stale_clusters):
+        if not self.window_days:
+            return 0
+        cutoff = now - self.window_days * 86400
+        expired = self.conn.execute(
+            "SELECT id, subcategory, latitude, longitude, cluster_id FROM points WHERE timestamp < ?",
+            (cutoff,)).fetchall()
+        for _, subcategory, lat, lon, cluster_id in expired:
+            seeds.setdefault(subcategory, []).append((lat, lon))
+            if cluster_id is not None:
+                stale_clusters.setdefault(subcategory, set()).add(cluster_id)
+        self.conn.execute("DELETE FROM points WHERE timestamp < ?", (cutoff,))
+        return len(expired)
+
+    def _recluster(self, subcategory, seeds, stale_clusters, full=False):
+        """Reclusters the region touched by the delta; returns HotspotRows that newly crossed the threshold."""
+        view = _SubcategoryView(self.conn, subcategory, self.grid, self.eps_m)
+        if full:
+            region, halo = set(view.load_all()), set()  # First run: everything is new, skip the expansion
+        else:
+            region, halo = expand_region(view, seeds, stale_clusters, self.min_points)
+
+        # Forget the old clusters of every region point; remember their scores to detect crossings
+        old_clusters = set(stale_clusters) | {view.points[p][4] for p in region if view.points[p][4] is not None}
+        old_scores = {}
+        for cluster_id in old_clusters:
+            for category, score in self.conn.execute(
+                    "SELECT category, score FROM clusters WHERE cluster_id = ?", (cluster_id,)):
+                old_scores[(cluster_id, category)] = score
+            self.conn.execute("DELETE FROM clusters WHERE cluster_id = ?", (cluster_id,))
+        if not region:
+            return []
+
+        region_ids = np.array(sorted(region), dtype=np.int64)
+        all_ids = np.concatenate([region_ids, np.array(sorted(halo), dtype=np.int64)])
+        lats = np.array([view.points[p][0] for p in all_ids])
+        lons = np.array([view.points[p][1] for p in all_ids])
+        labels = dbscan_haversine(lats, lons, self.eps_m, self.min_points)[:len(region_ids)]
+
+        next_id = int(self._get_state("next_cluster_id", 0))
+        new_ids = {label: next_id + i for i, label in enumerate(np.unique(labels[labels >= 0]))}
+        self._set_state("next_cluster_id", next_id + len(new_ids))
+        self.conn.executemany("UPDATE points SET cluster_id = ? WHERE id = ?", [
+            (new_ids.get(int(label)), int(point_id)) for point_id, label in zip(region_ids, labels)])
+
+        # Aggregate per (cluster, category) like the BigQuery GROUP BY
+        groups = {}
+        for point_id, label in zip(region_ids, labels):
+            if label >= 0:
+                groups.setdefault((new_ids[int(label)], view.points[point_id][2]), []).append(point_id)
+
+        crossed = []
+        for (cluster_id, category), members in groups.items():
+            member_lats = np.array([view.points[p][0] for p in members])
+            member_lons = np.array([view.points[p][1] for p in members])
+            risks = np.array([np.nan if view.points[p][3] is None else view.points[p][3] for p in members])
+            x, y, z = (float(v.sum()) for v in _unit_vectors(member_lats, member_lons))
+            risk_count = int((~np.isnan(risks)).sum())
+            risk_sum = float(np.nansum(risks))
+            score = len(members) * 0.5 + (risk_sum / risk_count) * 0.5 if risk_count else None
+            self.conn.execute(
+                "INSERT INTO clusters (cluster_id, category, subcategory, point_count, risk_sum, risk_count, "
+                "sum_x, sum_y, sum_z, score) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (cluster_id, category, subcategory, len(members), risk_sum, risk_count, x, y, z, score))
+
+            previous = [old_scores.get((view.points[p][4], category)) for p in members]
+            previous = [s for s in previous if s is not None]
+            was_hot = bool(previous) and max(previous) > self.risk_threshold
+            if score is not None and score > self.risk_threshold and not was_hot:
+                crossed.append(self._to_row(category, subcategory, len(members), score, x, y, z))
+        return crossed
+
+    @staticmethod
+    def _to_row(category, subcategory, count, score, x, y, z):
+        lat, lon = math.degrees(math.atan2(z, math.hypot(x, y))), math.degrees(math.atan2(y, x))
+        return HotspotRow(category, subcategory, count, score, f"POINT({lon} {lat})")
+
+    def apply(self, points, now=None):
+        """
+        Applies the issues newer than the watermark and expires those older
+        than the window, then returns the hotspots whose risk score crossed the
+        threshold in this run, highest first.
+        """
+        now = time.time() if now is None else now
+        seeds, stale_clusters = {}, {}
+        full = len(self) == 0
+        inserted, newest = self._insert_new_points(points, seeds)
+        expired = self._expire_old_points(now, seeds, stale_clusters)
+
+        crossed = []
+        for subcategory in sorted(seeds):
+            crossed.extend(self._recluster(subcategory, seeds[subcategory], stale_clusters.get(subcategory, set()),
+                                            full))
+
+        if newest is not None and (self.watermark is None or newest > self.watermark):
+            self._set_state("watermark", newest)
+        self.conn.commit()
+        log.info("🧮 Applied %d new and %d expired issue(s); %d hotspot(s) crossed the risk threshold.",
+                 inserted, expired, len(crossed))
+        crossed.sort(key=lambda row: row.final_risk_score, reverse=True)
+        return crossed
+
+    def hotspots(self, limit=HOTSPOT_LIMIT):
+        """Every current hotspot above the threshold, from the stored aggregates."""
+        query = ("SELECT category, subcategory, point_count, score, sum_x, sum_y, sum_z FROM clusters "
+                 "WHERE score > ? ORDER BY score DESC")
+        rows = self.conn.execute(query + (" LIMIT ?" if limit else ""),
+                                 (self.risk_threshold, limit) if limit else (self.risk_threshold,))
+        return [self._to_row(*row) for row in rows]
+
+    def close(self):
+        self.conn.close()
+
+
+# --- BENCHMARK ---
+def run_benchmark(count, delta, path, spread_km=200.0):
+    """Builds state for `count` synthetic issues, then times applying `delta` more."""
+    if os.path.exists(path):
+        os.remove(path)
+    points = synthetic_points(count + delta, spread_km=spread_km)
+    points["timestamp"] = np.arange(count + delta, dtype=np.float64)
+    initial = {key: values[:count] for key, values in points.items()}
+    latest = {key: values[count:] for key, values in points.items()}
+
+    state = IncrementalHotspots(path)
+    start = time.perf_counter()
+    state.apply(initial)
+    print(f"📊 Initial build of {count:,} issues took {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    state.apply(latest)
+    print(f"📊 Incremental update of {delta:,} issues took {time.perf_counter() - start:.3f}s")
+    state.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental hotspot detection over a sliding time window.")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="CSV or Parquet file of historical issues")
+    parser.add_argument("--state", default=HOTSPOT_STATE_PATH, help="SQLite file holding the cluster state")
+    parser.add_argument("--show", action="store_true", help="List all current hotspots instead of only new ones")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="Benchmark on N synthetic points instead")
+    parser.add_argument("--delta", type=int, default=100, help="New points applied after the benchmark build")
+    parser.add_argument("--spread-km", type=float, default=200.0, help="Width of the synthetic benchmark area")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(args.benchmark, args.delta, args.state, args.spread_km)
+    else:
+        hotspot_state = IncrementalHotspots(args.state)
+        new_hotspots = hotspot_state.apply(load_points(args.source))
+        for hotspot in (hotspot_state.hotspots() if args.show else new_hotspots):
+            print(f"🔥 {hotspot.subcategory} ({hotspot.category}): {hotspot.source_issue_count} issues, "
+                  f"risk {hotspot.final_risk_score:.2f} at {hotspot.predicted_location}")
+        hotspot_state.close()
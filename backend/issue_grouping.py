@@ -0,0 +1,87 @@
+import os
+import math
+import time
+import random
+import argparse
+
+from geo_utils import GridIndex
+
+# --- CONFIGURATION ---
+ISSUE_GROUP_RADIUS_M = float(os.getenv("ISSUE_GROUP_RADIUS_M", "50"))
+ISSUE_GROUP_WINDOW_HOURS = float(os.getenv("ISSUE_GROUP_WINDOW_HOURS", "72"))
+# Keeps a work order and all its member issue updates well inside one 500-write batch
+ISSUE_GROUP_MAX_SIZE = 100
+
+
+# --- GROUPING ---
+def group_issues(items, radius_m=ISSUE_GROUP_RADIUS_M, window_hours=ISSUE_GROUP_WINDOW_HOURS,
+                 max_size=ISSUE_GROUP_MAX_SIZE):
+    """
+    Groups reports of the same problem. `items` is a list of
+    (subcategory, lat, lng, timestamp) with lat/lng None when unknown and
+    timestamp in epoch seconds or None. Returns a list of index lists.
+
+    Items are taken oldest first. Each one joins the nearest group of the same
+    subcategory whose first report (the leader) is within `radius_m` and
+    `window_hours`; otherwise it starts a new group. Anchoring on the leader
+    rather than on any member keeps reports strung out along a road from
+    chaining into one group. Items without a location stay on their own.
+    """
+    window_s = window_hours * 3600
+    order = sorted(range(len(items)), key=lambda i: (items[i][3] is None, items[i][3] or 0.0))
+    index = GridIndex(radius_m)
+    groups = []
+    for i in order:
+        subcategory, lat, lng, timestamp = items[i]
+        if lat is None or lng is None:
+            groups.append([i])
+            continue
+        joined = False
+        for group_id, _ in index.query(lat, lng, radius_m, key=subcategory):
+            members = groups[group_id]
+            leader_time = items[members[0]][3]
+            if len(members) >= max_size:
+                continue
+            if timestamp is not None and leader_time is not None and abs(timestamp - leader_time) > window_s:
+                continue
+            members.append(i)
+            joined = True
+            break
+        if not joined:
+            index.add(lat, lng, len(groups), key=subcategory)
+            groups.append([i])
+    return groups
+
+
+# --- BENCHMARK ---
+def run_benchmark(count, duplicates):
+    rng = random.Random(5)
+    subcategories = ["pothole", "streetlight", "garbage", "water leakage", "traffic signal"]
+    spread = 10_000 / 111_195  # ~10 km around the centre
+    items = []
+    while len(items) < count:
+        subcategory = rng.choice(subcategories)
+        lat = 12.9716 + rng.uniform(-spread, spread)
+        lng = 77.5946 + rng.uniform(-spread, spread) / math.cos(math.radians(12.9716))
+        timestamp = rng.uniform(0, 30 * 86400)
+        for _ in range(1 + int(rng.expovariate(1 / duplicates))):
+            # Repeat reports land within ~20 m and a day of the first one
+            items.append((subcategory, lat + rng.gauss(0, 0.0001), lng + rng.gauss(0, 0.0001),
+                          timestamp + rng.uniform(0, 86400)))
+    items = items[:count]
+
+    start = time.perf_counter()
+    groups = group_issues(items)
+    elapsed = time.perf_counter() - start
+    # One work-order set plus one issue update per issue, versus one set per group
+    before, after = 2 * len(items), len(groups) + len(items)
+    print(f"✅ Grouped {len(items)} issues into {len(groups)} work orders in {elapsed * 1000:.0f} ms; "
+          f"writes {before} → {after}, crew visits {len(items)} → {len(groups)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Group duplicate issue reports before creating work orders.")
+    parser.add_argument("--benchmark", type=int, metavar="N", default=20000, help="Number of synthetic issues")
+    parser.add_argument("--duplicates", type=float, default=2.0, help="Mean extra reports per real problem")
+    args = parser.parse_args()
+    run_benchmark(args.benchmark, args.duplicates)
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from geo_utils import normalize_location
+from metrics import get_logger
+
+# --- CONFIGURATION ---
+BACKFILL_COLLECTIONS = ["raw_submissions", "issues"]
+BACKFILL_PAGE_SIZE = 500
+BACKFILL_CHECKPOINT_PATH = os.getenv("BACKFILL_CHECKPOINT_PATH", "location_backfill_checkpoint.json")
+
+log = get_logger("location_backfill")
+
+
+# --- NORMALIZATION ---
+def location_fields(data):
+    """
+    Canonical location fields for a document: a `geo_point` GeoPoint and a
+    `geohash` for range scans. Returns {} when the document has no location.
+    The original `location` field is left as written.
+    """
+    from firestore_backend import GeoPoint
+
+    location = normalize_location(data)
+    if location is None:
+        return {}
+    return {"geo_point": GeoPoint(location["latitude"], location["longitude"]), "geohash": location["geohash"]}
+
+
+def needs_backfill(data, fields):
+    point = data.get("geo_point")
+    return bool(fields) and (data.get("geohash") != fields["geohash"] or point is None
+                             or (point.latitude, point.longitude) != (fields["geo_point"].latitude,
+                                                                      fields["geo_point"].longitude))
+
+
+# --- CHECKPOINT ---
+class Checkpoint:
+    """Last processed document id and counters per collection, saved after every committed page."""
+
+    def __init__(self, path=BACKFILL_CHECKPOINT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.state = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+
+    def get(self, collection):
+        return self.state.get(collection, {"last_id": None, "done": False, "scanned": 0, "updated": 0, "skipped": 0})
+
+    def save(self, collection, progress):
+        with self._lock:
+            self.state[collection] = progress
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(temp_path, self.path)  # Never leave a half-written checkpoint behind
+
+
+# --- BACKFILL ---
+def backfill_collection(db, collection, checkpoint, page_size=BACKFILL_PAGE_SIZE, dry_run=False):
+    """Walks one collection in document-id order, checkpointing after each page's writes are committed."""
+    from firestore_backend import FieldPath
+    from batch_writer import BatchWriter, iter_pages
+
+    progress = dict(checkpoint.get(collection))
+    if progress["done"]:
+        log.info("⏭️  %s: already complete (remove %s to run again).", collection, checkpoint.path)
+        return progress
+
+    query = db.collection(collection).order_by(FieldPath.document_id())
+    cursor = db.collection(collection).document(progress["last_id"]).get() if progress["last_id"] else None
+    if cursor is not None and not cursor.exists:
+        cursor = {FieldPath.document_id(): db.collection(collection).document(progress["last_id"])}
+    start = time.perf_counter()
+
+    with BatchWriter(db, label=f"{collection} location updates") as writer:
+        for page in iter_pages(query, page_size, start_after=cursor):
+            pending = 0
+            for doc in page:
+                data = doc.to_dict()
+                fields = location_fields(data)
+                if not fields:
+                    progress["skipped"] += 1
+                elif needs_backfill(data, fields):
+                    if not dry_run:
+                        writer.update(doc.reference, fields)
+                    pending += 1
+
+            # Only checkpoint a page once its writes are committed
+            writer.flush()
+            if writer.failed:
+                raise RuntimeError(f"{writer.stats['failed_writes']} write(s) could not be committed")
+            progress["scanned"] += len(page)
+            progress["updated"] += pending
+            progress["last_id"] = page[-1].id
+            if not dry_run:
+                checkpoint.save(collection, progress)
+            log.info("  - %s: %d scanned, %d updated, %d without a location", collection, progress['scanned'],
+                     progress['updated'], progress['skipped'])
+
+    progress["done"] = True
+    if not dry_run:
+        checkpoint.save(collection, progress)
+    elapsed = time.perf_counter() - start
+    log.info("✅ %s: backfilled %d document(s) in %.1fs (%.0f docs/sec).", collection, progress['updated'],
+             elapsed, progress['scanned'] / max(elapsed, 1e-9))
+    return progress
+
+
+def run_backfill(collections=BACKFILL_COLLECTIONS, page_size=BACKFILL_PAGE_SIZE,
+                 checkpoint_path=BACKFILL_CHECKPOINT_PATH, dry_run=False):
+    """Backfills every collection in parallel; each one resumes from its own checkpoint."""
+    from geospatial_agent import initialize_clients
+
+    _, db = initialize_clients(use_bigquery=False)
+    checkpoint = Checkpoint(checkpoint_path)
+    log.info("🧭 Backfilling geo_point/geohash on %s%s...", ", ".join(collections), " (dry run)" if dry_run else "")
+    with ThreadPoolExecutor(max_workers=len(collections)) as executor:
+        futures = {collection: executor.submit(backfill_collection, db, collection, checkpoint, page_size, dry_run)
+                   for collection in collections}
+        for collection, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                log.error("❌ %s: backfill stopped (%s). Re-run to resume from the checkpoint.", collection, e)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill canonical geo_point and geohash fields on all documents.")
+    parser.add_argument("--collections", nargs="+", default=BACKFILL_COLLECTIONS)
+    parser.add_argument("--page-size", type=int, default=BACKFILL_PAGE_SIZE)
+    parser.add_argument("--checkpoint", default=BACKFILL_CHECKPOINT_PATH)
+    parser.add_argument("--dry-run", action="store_true", help="Count the documents that would change without writing")
+    args = parser.parse_args()
+    run_backfill(args.collections, args.page_size, args.checkpoint, args.dry_run)
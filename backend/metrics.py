@@ -0,0 +1,337 @@
+import os
+import sys
+import json
+import time
+import atexit
+import logging
+import threading
+from bisect import bisect_left
+from functools import wraps
+from contextlib import contextmanager
+
+# --- CONFIGURATION ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()  # DEBUG adds the per-document progress lines
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "json" writes one JSON object per log line
+METRICS_EXPORT = os.getenv("METRICS_EXPORT", "")  # "prometheus" or "jsonl"; written when the process exits
+METRICS_PATH = os.getenv("METRICS_PATH")  # Defaults to metrics.prom / metrics.jsonl
+METRICS_PREFIX = "civic_"
+AGENT_PROFILE = os.getenv("AGENT_PROFILE", "")  # "cprofile" or "pyinstrument"
+AGENT_PROFILE_DIR = os.getenv("AGENT_PROFILE_DIR", "profiles")
+LATENCY_BUCKETS_S = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# --- METRICS ---
+class Histogram:
+    """Cumulative-bucket latency histogram in seconds, as Prometheus expects it."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_S):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation (the max past the last bucket)."""
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max)
+        return 0.0
+
+    def bar_lines(self, width=30):
+        """One text bar per non-empty bucket, labelled in milliseconds."""
+        labels = [f"≤{bound * 1000:g} ms" for bound in self.buckets] + [f">{self.buckets[-1] * 1000:g} ms"]
+        widest = max(self.counts) or 1
+        return [f"{label:>10} | {'█' * max(1, round(width * count / widest))} {count}"
+                for label, count in zip(labels, self.counts) if count]
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms, keyed by metric name and label set."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def histogram(self, name, **labels):
+        """The histogram recorded for `name` and these labels, or None if nothing was observed."""
+        with self._lock:
+            return self.histograms.get((name, tuple(sorted(labels.items()))))
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    # --- Export ---
+    def prometheus_text(self):
+        """The registry in the Prometheus text exposition format (e.g. for node_exporter's textfile collector)."""
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{METRICS_PREFIX}{name}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{label_text(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            metric = f"{METRICS_PREFIX}{name}_seconds"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{metric}_bucket{label_text(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{metric}_sum{label_text(labels)} {histogram.sum:.6f}")
+            lines.append(f"{metric}_count{label_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def json_lines(self):
+        """One JSON object per counter and histogram, stamped with the export time."""
+        timestamp = time.time()
+        with self._lock:
+            counters = list(self.counters.items())
+            histograms = list(self.histograms.items())
+        lines = [json.dumps({"ts": timestamp, "type": "counter", "name": name, "labels": dict(labels), "value": value})
+                 for (name, labels), value in counters]
+        for (name, labels), histogram in histograms:
+            lines.append(json.dumps({
+                "ts": timestamp, "type": "histogram", "name": name, "labels": dict(labels),
+                "count": histogram.count, "sum": round(histogram.sum, 6),
+                "p50": histogram.quantile(0.5), "p95": histogram.quantile(0.95),
+                "buckets": dict(zip([f"{bound:g}" for bound in histogram.buckets] + ["+Inf"], histogram.counts)),
+            }))
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def export(self, fmt=METRICS_EXPORT, path=METRICS_PATH):
+        """Writes the registry to `path`: Prometheus text replaces the file, JSON lines are appended."""
+        if fmt == "prometheus":
+            path = path or "metrics.prom"
+            with open(f"{path}.tmp", "w") as f:
+                f.write(self.prometheus_text())
+            os.replace(f"{path}.tmp", path)  # Scrapers never see a half-written file
+        elif fmt == "jsonl":
+            path = path or "metrics.jsonl"
+            with open(path, "a") as f:
+                f.write(self.json_lines())
+        else:
+            raise ValueError(f"Unknown metrics format: {fmt!r}")
+        return path
+
+    def summary_lines(self):
+        """Human-readable one line per timer, slowest total first."""
+        with self._lock:
+            histograms = sorted(self.histograms.items(), key=lambda item: -item[1].sum)
+        lines = []
+        for (name, labels), histogram in histograms:
+            label = ",".join(f"{k}={v}" for k, v in labels)
+            lines.append(f"{name}{'{' + label + '}' if label else ''}: {histogram.count} call(s), "
+                         f"{histogram.sum:.2f}s total, p50 ≤{histogram.quantile(0.5) * 1000:g} ms, "
+                         f"p95 ≤{histogram.quantile(0.95) * 1000:g} ms")
+        return lines
+
+
+REGISTRY = MetricsRegistry()
+
+
+def count(name, value=1, **labels):
+    """Adds `value` to the counter `name` (exported as <name>_total)."""
+    REGISTRY.inc(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    """Records one latency in seconds for `name` (exported as <name>_seconds)."""
+    REGISTRY.observe(name, seconds, **labels)
+
+
+class timer:
+    """
+    Times a block, or every call when used as a decorator, into the
+    `<name>_seconds` histogram; a raised exception also counts
+    `<name>_errors`.
+
+        with timer("gemini_call"):
+            response = model.generate_content(prompt)
+
+        @timer("phash")
+        def image_phash(image_path): ...
+    """
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+        self.seconds = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._start
+        REGISTRY.observe(self.name, self.seconds, **self.labels)
+        if exc_type is not None:
+            REGISTRY.inc(f"{self.name}_errors", **self.labels)
+        return False
+
+    def __call__(self, function):
+        @wraps(function)
+        def timed(*args, **kwargs):
+            with timer(self.name, **self.labels):
+                return function(*args, **kwargs)
+        return timed
+
+
+def _export_at_exit():
+    if not REGISTRY.counters and not REGISTRY.histograms:
+        return
+    try:
+        path = REGISTRY.export()
+        get_logger("metrics").info("📈 Metrics written to %s", path)
+    except Exception as e:
+        print(f"⚠️ Could not export metrics: {e}")
+
+
+if METRICS_EXPORT:
+    atexit.register(_export_at_exit)
+
+
+# --- LOGGING ---
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Writes to whatever sys.stdout is at the time, so redirect_stdout still captures agent logs."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; fields passed with `extra=` become keys."""
+
+    def format(self, record):
+        entry = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name,
+                 "message": record.getMessage()}
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def get_logger(name):
+    """
+    Logger for one agent, writing to stdout at LOG_LEVEL. Per-document lines
+    go at DEBUG with %-style arguments, so when DEBUG is off they cost one
+    level check and are never formatted.
+    """
+    global _configured
+    root = logging.getLogger("civic")
+    if not _configured:
+        with _configure_lock:
+            if not _configured:
+                handler = _StdoutHandler()
+                handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter("%(message)s"))
+                root.addHandler(handler)
+                root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+                root.propagate = False
+                _configured = True
+    return root.getChild(name)
+
+
+# --- PROFILING ---
+@contextmanager
+def profiled(name):
+    """
+    Profiles the block when AGENT_PROFILE is "cprofile" (stats written to
+    AGENT_PROFILE_DIR/<name>.prof, top functions logged) or "pyinstrument"
+    (HTML report written next to it). Does nothing otherwise.
+    """
+    if AGENT_PROFILE not in ("cprofile", "pyinstrument"):
+        yield
+        return
+    log = get_logger("profile")
+    os.makedirs(AGENT_PROFILE_DIR, exist_ok=True)
+    if AGENT_PROFILE == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            log.warning("⚠️ AGENT_PROFILE=pyinstrument but pyinstrument is not installed; not profiling.")
+            yield
+            return
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            path = os.path.join(AGENT_PROFILE_DIR, f"{name}.html")
+            with open(path, "w") as f:
+                f.write(profiler.output_html())
+            log.info("🔬 pyinstrument report for %s written to %s\n%s", name, path, profiler.output_text())
+        return
+
+    import io
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        path = os.path.join(AGENT_PROFILE_DIR, f"{name}.prof")
+        profiler.dump_stats(path)
+        top = io.StringIO()
+        pstats.Stats(profiler, stream=top).sort_stats("cumulative").print_stats(15)
+        log.info("🔬 cProfile stats for %s written to %s\n%s", name, path, top.getvalue())
+
+
+def run_agent(name, function, *args, **kwargs):
+    """Runs an agent's entry point under `profiled` and logs the timer summary at DEBUG."""
+    with profiled(name):
+        result = function(*args, **kwargs)
+    log = get_logger(name)
+    if log.isEnabledFor(logging.DEBUG):
+        for line in REGISTRY.summary_lines():
+            log.debug("⏱️  %s", line)
+    return result
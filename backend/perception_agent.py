@@ -1,19 +1,13 @@
 import os
 import sys
-import json
 from datetime import datetime, timedelta
-import firebase_admin
 from dotenv import load_dotenv
-from firebase_admin import credentials, firestore
-from google.cloud.firestore_v1.base_query import FieldFilter
-import google.generativeai as genai
 
-# --- NEW IMPORTS for duplicate detection ---
-import imagehash
-from PIL import Image
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
+from metrics import get_logger, run_agent, timer
+
+# Heavy dependencies (Firebase, Gemini, PIL, NumPy, sentence-transformers) are
+# imported inside the functions that use them so that importing this module,
+# e.g. for FEW_SHOT_PROMPT, stays cheap.
 
 # Load environment variables from .env file
 load_dotenv()
@@ -21,35 +15,53 @@ load_dotenv()
 # --- CONFIGURATION CONSTANTS ---
 SERVICE_ACCOUNT_FILE = os.getenv("SERVICE_ACCOUNT_FILE")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", "gemini")  # "fake" runs the offline benchmark model
 RAW_SUBMISSIONS_COLLECTION = "raw_submissions"
 ISSUES_COLLECTION = "issues"
 INPUT_FIELD_KEYS = ["report", "raw_submissions", "doc", "description"]
 IMAGE_HASH_THRESHOLD = 5 # How similar images can be to be considered duplicates (lower is more similar)
 TEXT_SIMILARITY_THRESHOLD = 0.90 # How similar text can be (0.0 to 1.0)
+DUPLICATE_WINDOW_SECONDS = 24 * 3600 # Only submissions from the last day are considered
+
+log = get_logger("perception")
 
 # --- INITIALIZATION ---
 def initialize_services():
     """Initializes and returns all necessary clients and models."""
+    from classification_pipeline import FakeGeminiModel
+    from embedding_service import get_sentence_model
+    from firestore_backend import use_memory_backend, memory_client
+
     try:
         # Initialize Firebase
-        cred = credentials.Certificate(SERVICE_ACCOUNT_FILE)
-        if not firebase_admin._apps:
-            firebase_admin.initialize_app(cred)
-        db = firestore.client()
-        print("✅ Firebase Initialized Successfully.")
+        if use_memory_backend():
+            db = memory_client()
+            log.info("🧪 Using the in-memory Firestore backend.")
+        else:
+            import firebase_admin
+            from firebase_admin import credentials, firestore
+            cred = credentials.Certificate(SERVICE_ACCOUNT_FILE)
+            if not firebase_admin._apps:
+                firebase_admin.initialize_app(cred)
+            db = firestore.client()
+            log.info("✅ Firebase Initialized Successfully.")
 
         # Initialize Gemini
-        genai.configure(api_key=GEMINI_API_KEY)
-        gemini_model = genai.GenerativeModel("gemini-1.5-pro", generation_config={"response_mime_type": "application/json"})
-        print("✅ Gemini Model Initialized Successfully.")
+        if GEMINI_BACKEND == "fake":
+            gemini_model = FakeGeminiModel()
+            log.info("🧪 Using fake Gemini backend (no network calls).")
+        else:
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            gemini_model = genai.GenerativeModel("gemini-1.5-pro", generation_config={"response_mime_type": "application/json"})
+            log.info("✅ Gemini Model Initialized Successfully.")
 
-        # Initialize Sentence Transformer Model
-        sentence_model = SentenceTransformer('all-MiniLM-L6-v2')
-        print("✅ Sentence Transformer Model Loaded.")
+        # Initialize Sentence Transformer Model (served warm by embedding_service.py when running)
+        sentence_model = get_sentence_model()
         
         return db, gemini_model, sentence_model
     except Exception as e:
-        print(f"❌ FATAL: Initialization failed: {e}")
+        log.critical("❌ FATAL: Initialization failed: %s", e)
         sys.exit(1)
 
 # --- PROMPT TEMPLATE ---
@@ -70,104 +82,218 @@ def get_image_hash(image_path):
     """Calculates a perceptual hash for an image file."""
     if not image_path or not os.path.exists(image_path):
         return None
+    from phash_index import image_phash
     try:
-        with Image.open(image_path) as img:
-            return str(imagehash.phash(img))
+        return image_phash(image_path)
     except Exception as e:
-        print(f"⚠️  Could not process image {image_path}: {e}")
+        log.warning("⚠️  Could not process image %s: %s", image_path, e)
         return None
 
-def find_duplicates(db, sentence_model, new_doc_data):
-    """Checks for recent text or image duplicates in Firestore."""
+def load_recent_submissions(db):
+    """Loads the last day's submissions once and builds the duplicate-detection indexes."""
+    from firestore_backend import FieldFilter
+    from embedding_index import EmbeddingIndex
+    from phash_index import PHashIndex
+
     one_day_ago = datetime.utcnow() - timedelta(days=1)
-    
-    # Check for image hash duplicates
+    text_index = EmbeddingIndex(window_seconds=DUPLICATE_WINDOW_SECONDS)
+    image_index = PHashIndex(window_seconds=DUPLICATE_WINDOW_SECONDS)
+
+    with timer("firestore_read", op="recent_submissions"):
+        recent_docs = list(db.collection(RAW_SUBMISSIONS_COLLECTION).where(
+            filter=FieldFilter("created_at", ">=", one_day_ago)).stream())
+    for match_doc in recent_docs:
+        match_data = match_doc.to_dict()
+        if match_data.get("image_hash"):
+            image_index.add(match_doc.id, match_data["image_hash"], match_data.get("created_at"))
+        if match_data.get("text_embedding"):
+            text_index.add(match_doc.id, match_data["text_embedding"], match_data.get("created_at"))
+
+    log.info("📚 Loaded %d recent embeddings and %d image hashes.", len(text_index), len(image_index))
+    return text_index, image_index
+
+def find_duplicates(text_index, image_index, new_doc_data):
+    """Checks the preloaded recent submissions for text or image duplicates."""
+    # Check for image hash duplicates with one popcount pass over all recent hashes
     if new_doc_data.get("image_hash"):
-        potential_matches = db.collection(RAW_SUBMISSIONS_COLLECTION).where("created_at", ">=", one_day_ago).stream()
-        for match_doc in potential_matches:
-            match_data = match_doc.to_dict()
-            if match_data.get("image_hash"):
-                hash1 = imagehash.hex_to_hash(new_doc_data["image_hash"])
-                hash2 = imagehash.hex_to_hash(match_data["image_hash"])
-                if hash1 - hash2 <= IMAGE_HASH_THRESHOLD:
-                    return "image", match_doc.id
-
-    # Check for text embedding duplicates
+        match = image_index.nearest(new_doc_data["image_hash"], IMAGE_HASH_THRESHOLD)
+        if match:
+            return "image", match[0]
+
+    # Check for text embedding duplicates with one vectorized top-1 query
     if new_doc_data.get("text_embedding"):
-        new_embedding = np.array(new_doc_data["text_embedding"]).reshape(1, -1)
-        potential_matches = db.collection(RAW_SUBMISSIONS_COLLECTION).where("created_at", ">=", one_day_ago).stream()
-        for match_doc in potential_matches:
-            match_data = match_doc.to_dict()
-            if match_data.get("text_embedding"):
-                existing_embedding = np.array(match_data["text_embedding"]).reshape(1, -1)
-                similarity = cosine_similarity(new_embedding, existing_embedding)[0][0]
-                if similarity >= TEXT_SIMILARITY_THRESHOLD:
-                    return "text", match_doc.id
-    
+        match_id = text_index.find_match(new_doc_data["text_embedding"], TEXT_SIMILARITY_THRESHOLD)
+        if match_id:
+            return "text", match_id
+
     return None, None
 
+def remember_submission(text_index, image_index, doc_id, doc_data):
+    """Adds an accepted submission to the in-memory indexes so later docs in the batch see it."""
+    if doc_data.get("image_hash"):
+        image_index.add(doc_id, doc_data["image_hash"])
+    if doc_data.get("text_embedding"):
+        text_index.add(doc_id, doc_data["text_embedding"])
+
+def forget_submissions(text_index, image_index, doc_ids):
+    """Takes submissions that did not become issues back out of the in-memory indexes."""
+    if doc_ids:
+        text_index.remove(doc_ids)
+        image_index.remove(doc_ids)
+
+def open_classification_cache():
+    """The run's classification cache; opened once, since it loads every stored embedding."""
+    from classification_cache import ClassificationCache
+    return ClassificationCache(FEW_SHOT_PROMPT)
+
+def close_classification_cache(cache):
+    log.info("🗃️  Classification cache: %s", cache.stats)
+    cache.close()
+
+def classify_with_cache(gemini_model, cache, to_classify):
+    """Returns one classification per item, calling Gemini only for cache misses."""
+    from classification_pipeline import ClassificationPipeline
+    from classification_cache import normalize_text
+
+    results = [None] * len(to_classify)
+    pending = {}  # normalized text -> indexes of items waiting on the same Gemini call
+
+    for i, (_, user_input, update_data) in enumerate(to_classify):
+        cached = cache.get(user_input, update_data.get("text_embedding"))
+        if cached is not None:
+            results[i] = dict(cached, description=user_input)
+        else:
+            pending.setdefault(normalize_text(user_input), []).append(i)
+
+    if pending:
+        pipeline = ClassificationPipeline(gemini_model, FEW_SHOT_PROMPT)
+        log.info("🤖 Classifying %d unique report(s) with up to %d concurrent Gemini calls...",
+                 len(pending), pipeline.concurrency)
+        first_indexes = [indexes[0] for indexes in pending.values()]
+        fresh = pipeline.classify([to_classify[i][1] for i in first_indexes])
+        for indexes, structured_data in zip(pending.values(), fresh):
+            if isinstance(structured_data, dict):
+                _, user_input, update_data = to_classify[indexes[0]]
+                cache.put(user_input, structured_data, update_data.get("text_embedding"))
+            results[indexes[0]] = structured_data
+            for i in indexes[1:]:
+                results[i] = dict(structured_data, description=to_classify[i][1]) if isinstance(structured_data, dict) else structured_data
+
+    cache.flush()
+    return results
+
+def get_user_input(data):
+    """Returns the first non-empty text field of a submission."""
+    return next((data[key] for key in INPUT_FIELD_KEYS if key in data and data[key]), None)
+
 # --- MAIN LOGIC ---
 def process_submissions(db, gemini_model, sentence_model):
-    """Fetches, checks for duplicates, classifies, and stores submissions."""
-    print("\n🚀 Starting submission processing...")
+    """Fetches, checks for duplicates, classifies, and stores submissions, one page at a time."""
+    from firestore_backend import FieldFilter
+    from batch_writer import BatchWriter, iter_pages
+
+    log.info("🚀 Starting submission processing...")
     query = db.collection(RAW_SUBMISSIONS_COLLECTION).where(filter=FieldFilter("processed", "==", False))
-    docs_to_process = query.stream()
-    batch = db.batch()
+    text_index, image_index = load_recent_submissions(db)
+    cache = open_classification_cache()
+    try:
+        # Chunks of at most 500 writes are committed in the background while later pages are classified
+        with BatchWriter(db, label="submission writes") as writer:
+            for docs_to_process in iter_pages(query):
+                process_page(db, writer, docs_to_process, text_index, image_index, gemini_model, sentence_model,
+                             cache)
+    finally:
+        close_classification_cache(cache)
+
+
+def process_page(db, writer, docs_to_process, text_index, image_index, gemini_model, sentence_model, cache):
+    """Embeds, de-duplicates and classifies one page of submissions and queues their writes."""
+    from embedding_service import encode_texts, EMBEDDING_BATCH_SIZE, EMBEDDING_DTYPE
+    from location_backfill import location_fields
 
-    for doc in docs_to_process:
+    to_classify = []  # (doc, user_input, update_data) in stream order
+    duplicates = []  # (doc, original_id), written once the originals' classification is known
+
+    # --- Pass 1: Collect the page's texts and embed them in one batched call ---
+    inputs = [get_user_input(doc.to_dict()) for doc in docs_to_process]
+    texts = [user_input for user_input in inputs if user_input]
+    log.info("🧠 Encoding %d report(s) in batches of %d...", len(texts), EMBEDDING_BATCH_SIZE)
+    embeddings = iter(encode_texts(sentence_model, texts, EMBEDDING_BATCH_SIZE, EMBEDDING_DTYPE))
+
+    # --- Pass 2: Duplicate checks, in stream order ---
+    for doc, user_input in zip(docs_to_process, inputs):
         data = doc.to_dict()
-        print(f"\n📄 Processing Document ID: {doc.id}")
+        log.debug("📄 Processing document %s", doc.id)
 
-        # --- Step 1: Calculate Hashes and Embeddings ---
-        user_input = next((data[key] for key in INPUT_FIELD_KEYS if key in data and data[key]), None)
+        # --- Step 1: Attach Hashes and Embeddings ---
         image_path = data.get("image_path") # Assuming the document contains a path to the image
         
         update_data = {}
         if user_input:
-            update_data["text_embedding"] = sentence_model.encode(user_input).tolist()
+            update_data["text_embedding"] = next(embeddings).tolist()
         if image_path:
             update_data["image_hash"] = get_image_hash(image_path)
+        # Canonical geo_point/geohash, carried onto the issue so it can be mapped and range-scanned
+        update_data.update(location_fields(data))
         
         # --- Step 2: Check for Duplicates ---
-        duplicate_type, original_id = find_duplicates(db, sentence_model, update_data)
+        duplicate_type, original_id = find_duplicates(text_index, image_index, update_data)
         if duplicate_type:
-            print(f"🚫 Found duplicate ({duplicate_type}) of existing issue {original_id}. Flagging and skipping.")
-            batch.update(doc.reference, {"processed": True, "status": "duplicate", "original_issue_id": original_id})
+            log.debug("🚫 %s is a duplicate (%s) of existing issue %s. Flagging and skipping.",
+                      doc.id, duplicate_type, original_id)
+            duplicates.append((doc, original_id))
             continue
 
         # --- Step 3: Classify if Unique ---
         if not user_input:
-            print("⚠️ No usable text field found. Skipping.")
-            batch.update(doc.reference, {"processed": True, "status": "error", "error_message": "No text input"})
+            log.warning("⚠️ No usable text field in %s. Skipping.", doc.id)
+            writer.update(doc.reference, {"processed": True, "status": "error", "error_message": "No text input"})
             continue
 
-        prompt = FEW_SHOT_PROMPT.format(input=user_input)
-        print(f"🤖 Calling Gemini for: \"{user_input[:50]}...\"")
-        try:
-            response = gemini_model.generate_content(prompt)
-            structured_data = json.loads(response.text)
-            print("🔎 Gemini Response:", structured_data)
-
-            # Add hashes and embeddings to the final issue document
-            structured_data.update(update_data)
-            structured_data["original_submission_id"] = doc.id
-            
-            new_issue_ref = db.collection(ISSUES_COLLECTION).document()
-            batch.set(new_issue_ref, structured_data)
-            batch.update(doc.reference, {"processed": True, "status": "processed_ok"})
-            print(f"✅ Document {doc.id} classified and added to batch.")
-        except Exception as e:
-            print(f"❌ Error processing document {doc.id}: {e}")
-            batch.update(doc.reference, {"processed": True, "status": "error", "error_message": str(e)})
-            
-    # Commit all updates at once
-    try:
-        commit_results = batch.commit()
-        print(f"\n✨ Successfully committed batch with {len(commit_results)} writes.")
-    except Exception as e:
-        print(f"❌ Batch commit failed: {e}")
+        # Later docs in the page are checked against it; taken back out below if classification fails
+        remember_submission(text_index, image_index, doc.id, update_data)
+        to_classify.append((doc, user_input, update_data))
+
+    # --- Step 4: Classify, serving repeated reports from the cache ---
+    results = classify_with_cache(gemini_model, cache, to_classify)
+
+    # --- Step 5: Write results in the original order ---
+    failed_ids = set()
+    for (doc, user_input, update_data), structured_data in zip(to_classify, results):
+        if isinstance(structured_data, Exception) or not isinstance(structured_data, dict):
+            error = structured_data if isinstance(structured_data, Exception) else f"Unexpected response: {structured_data}"
+            log.error("❌ Error processing document %s: %s", doc.id, error)
+            writer.update(doc.reference, {"processed": True, "status": "error", "error_message": str(error)})
+            failed_ids.add(doc.id)
+            continue
+
+        log.debug("🔎 Gemini response for %s: %s", doc.id, structured_data)
+
+        # Add hashes and embeddings to the final issue document
+        structured_data.update(update_data)
+        structured_data["original_submission_id"] = doc.id
+        if "geo_point" in update_data:
+            structured_data["location"] = update_data["geo_point"]
+        
+        new_issue_ref = db.collection(ISSUES_COLLECTION).document()
+        # The issue and the processed flag land in the same batch, so a submission is never classified twice
+        with writer.group():
+            writer.set(new_issue_ref, structured_data)
+            # Keep the hash and embedding on the submission so future runs can index it
+            writer.update(doc.reference, {"processed": True, "status": "processed_ok", **update_data})
+        log.debug("✅ Document %s classified and queued.", doc.id)
+
+    # --- Step 6: Flag duplicates of the reports that became issues ---
+    forget_submissions(text_index, image_index, failed_ids)
+    for doc, original_id in duplicates:
+        if original_id in failed_ids:
+            # Left unprocessed, so the next run checks it again without the failed original
+            log.warning("⚠️ %s repeats %s, which failed classification. Leaving it for the next run.",
+                        doc.id, original_id)
+            continue
+        writer.update(doc.reference, {"processed": True, "status": "duplicate", "original_issue_id": original_id})
 
 # --- SCRIPT EXECUTION ---
 if __name__ == "__main__":
     db_client, gemini_client, sentence_client = initialize_services()
-    process_submissions(db_client, gemini_client, sentence_client)
\ No newline at end of file
+    run_agent("perception_agent", process_submissions, db_client, gemini_client, sentence_client)
\ No newline at end of file
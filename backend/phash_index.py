@@ -0,0 +1,175 @@
+import os
+import time
+
+import numpy as np
+
+from embedding_index import to_epoch
+from metrics import timer
+
+# --- CONFIGURATION ---
+INITIAL_CAPACITY = 4096
+PHASH_SNAPSHOT_PATH = os.getenv(
+    "PHASH_SNAPSHOT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "phash_index.npz"))
+# phash works on a 32x32 grayscale thumbnail, so JPEGs only need to be decoded
+# to at least this size (DCT scaling picks the nearest 1/2, 1/4 or 1/8 scale).
+PHASH_DRAFT_SIZE = 128
+PHASH_DRAFT_TOLERANCE = 2  # Max bits the fast path may differ from a full decode
+
+# Byte-wise popcount table for NumPy builds without np.bitwise_count (< 2.0)
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def hash_to_int(image_hash):
+    """Converts a hex string / ImageHash / int perceptual hash to a 64-bit integer."""
+    if isinstance(image_hash, (int, np.integer)):
+        return int(image_hash)
+    return int(str(image_hash), 16)
+
+
+def popcount64(values):
+    """Counts set bits in every element of a uint64 array."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+# --- HASHING ---
+def compute_phash(img, fast=True):
+    """
+    Returns the imagehash phash of an open PIL image.
+
+    With `fast`, JPEGs are decoded through Pillow's draft mode straight to a
+    reduced-resolution grayscale image instead of full size. Call this before
+    anything else loads the pixels, and read `img.size`/`img.mode` first since
+    draft() changes them.
+    """
+    import imagehash
+    if fast and img.format == "JPEG":
+        img.draft("L", (PHASH_DRAFT_SIZE, PHASH_DRAFT_SIZE))
+    return imagehash.phash(img)
+
+
+@timer("phash")
+def image_phash(image_path, fast=True):
+    """Opens an image file and returns its phash as a hex string."""
+    from PIL import Image
+    with Image.open(image_path) as img:
+        return str(compute_phash(img, fast))
+
+
+# --- HAMMING INDEX ---
+class PHashIndex:
+    """
+    Radius-search index over 64-bit perceptual hashes.
+
+    Hashes are packed into a contiguous uint64 array; a lookup XORs the query
+    against every entry and popcounts the result in one vectorized pass, which
+    keeps "within distance k" queries around a millisecond for several hundred
+    thousand images.
+    """
+
+    def __init__(self, window_seconds=None):
+        self.window_seconds = window_seconds
+        self._hashes = np.zeros(INITIAL_CAPACITY, dtype=np.uint64)
+        self._timestamps = np.zeros(INITIAL_CAPACITY, dtype=np.float64)
+        self._ids = []
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def ids(self):
+        """Document ids in insertion order."""
+        return list(self._ids)
+
+    @property
+    def latest_timestamp(self):
+        """Epoch seconds of the newest entry, or None when empty."""
+        return float(self._timestamps[:self._size].max()) if self._size else None
+
+    def _grow(self):
+        capacity = self._hashes.shape[0] * 2
+        hashes = np.zeros(capacity, dtype=np.uint64)
+        hashes[:self._size] = self._hashes[:self._size]
+        timestamps = np.zeros(capacity, dtype=np.float64)
+        timestamps[:self._size] = self._timestamps[:self._size]
+        self._hashes, self._timestamps = hashes, timestamps
+
+    def add(self, doc_id, image_hash, created_at=None):
+        """Adds one hash to the index."""
+        if self._size == self._hashes.shape[0]:
+            self._grow()
+        self._hashes[self._size] = np.uint64(hash_to_int(image_hash))
+        self._timestamps[self._size] = to_epoch(created_at)
+        self._ids.append(doc_id)
+        self._size += 1
+
+    def evict_expired(self, now=None):
+        """Drops entries that have fallen out of the time window."""
+        if not self._size or self.window_seconds is None:
+            return 0
+        cutoff = (now if now is not None else time.time()) - self.window_seconds
+        return self._compact(self._timestamps[:self._size] >= cutoff)
+
+    def remove(self, doc_ids):
+        """Drops the entries for `doc_ids`; returns how many were removed."""
+        doc_ids = set(doc_ids)
+        if not self._size or not doc_ids:
+            return 0
+        return self._compact(np.array([doc_id not in doc_ids for doc_id in self._ids], dtype=bool))
+
+    def _compact(self, keep):
+        """Keeps only the entries where `keep` is true, in order."""
+        kept = np.flatnonzero(keep)
+        removed = self._size - kept.size
+        if removed:
+            self._hashes[:kept.size] = self._hashes[kept]
+            self._timestamps[:kept.size] = self._timestamps[kept]
+            self._ids = [self._ids[i] for i in kept]
+            self._size = kept.size
+        return removed
+
+    def distances(self, image_hash):
+        """Returns the Hamming distance from the query to every indexed hash."""
+        query = np.uint64(hash_to_int(image_hash))
+        return popcount64(np.bitwise_xor(self._hashes[:self._size], query))
+
+    def search(self, image_hash, radius):
+        """Returns (doc_id, distance) pairs within `radius` bits, closest first."""
+        if not self._size:
+            return []
+        distances = self.distances(image_hash)
+        hits = np.flatnonzero(distances <= radius)
+        hits = hits[np.argsort(distances[hits], kind="stable")]
+        return [(self._ids[i], int(distances[i])) for i in hits]
+
+    def nearest(self, image_hash, radius):
+        """Returns the closest (doc_id, distance) within `radius`, else None."""
+        matches = self.search(image_hash, radius)
+        return matches[0] if matches else None
+
+    # --- PERSISTENCE ---
+    def save(self, path=PHASH_SNAPSHOT_PATH):
+        """Writes the index to an .npz snapshot."""
+        np.savez(
+            path,
+            hashes=self._hashes[:self._size],
+            timestamps=self._timestamps[:self._size],
+            ids=np.array(self._ids, dtype=str),
+        )
+
+    @classmethod
+    def load(cls, path=PHASH_SNAPSHOT_PATH, window_seconds=None):
+        """Restores an index from a snapshot written by save()."""
+        index = cls(window_seconds=window_seconds)
+        with np.load(path) as snapshot:
+            size = snapshot["hashes"].shape[0]
+            while index._hashes.shape[0] < size:
+                index._grow()
+            index._hashes[:size] = snapshot["hashes"]
+            index._timestamps[:size] = snapshot["timestamps"]
+            index._ids = snapshot["ids"].tolist()
+            index._size = size
+        index.evict_expired()
+        return index
@@ -0,0 +1,279 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import shutil
+import tempfile
+import platform
+import contextlib
+from collections import Counter
+from datetime import datetime, timezone
+
+# --- CONFIGURATION ---
+DEFAULT_SUBMISSIONS = 10000
+DEFAULT_CREWS = 100
+CITY_CENTER = (12.9716, 77.5946)
+SPREAD_KM = 15.0
+STAGES = ["seed", "validate", "perceive", "assign", "schedule", "hotspots"]
+FLOW_STAGES = ["validate", "perceive", "assign", "schedule", "orchestrate"]  # raw submission → scheduled work order
+ORCHESTRATED_STAGES = ["perceive", "assign", "schedule"]  # Replaced by one "orchestrate" stage with --orchestrator
+
+REPORT_TEMPLATES = {
+    "pothole": ["Big pothole on {street} near {landmark}", "Road is broken with a deep pothole at {street}"],
+    "streetlight": ["Streetlight not working on {street}", "Street lamp flickering near {landmark}"],
+    "garbage": ["Garbage piling up at {street}", "Overflowing garbage bin next to {landmark}"],
+    "water leakage": ["Water leak from a burst pipe on {street}", "Water leakage flooding {landmark}"],
+    "traffic signal": ["Traffic signal stuck on red at {street}", "Signal lights broken near {landmark}"],
+}
+STREETS = ["MG Road", "Brigade Road", "5th Cross", "Church Street", "Residency Road", "100 Feet Road"]
+LANDMARKS = ["the metro station", "City Market", "the bus depot", "Block C", "the park", "Sector 14 crossing"]
+
+
+# --- ENVIRONMENT ---
+def configure_environment(workdir, crews_path):
+    """Points every agent at the in-memory backend, the offline models and scratch files."""
+    os.environ["FIRESTORE_BACKEND"] = "memory"
+    os.environ["GEMINI_BACKEND"] = "fake"
+    os.environ["EMBEDDING_BACKEND"] = "fake"
+    os.environ["GEMINI_REQUESTS_PER_MINUTE"] = "0"  # The fake model has no quota
+    os.environ["CLASSIFICATION_CACHE_PATH"] = os.path.join(workdir, "classification_cache.sqlite3")
+    os.environ["PHASH_SNAPSHOT_PATH"] = os.path.join(workdir, "phash_index.npz")
+    os.environ["VALIDATION_CACHE_PATH"] = os.path.join(workdir, "validation_cache.sqlite3")
+    os.environ["TILE_STORE_PATH"] = os.path.join(workdir, "tile_store.sqlite3")
+    os.environ["CREWS_PATH"] = crews_path
+
+
+# --- SYNTHETIC DATA ---
+def make_image(directory, index, rng):
+    """Writes one noisy JPEG with its own perceptual hash so validation and hashing do real work."""
+    import numpy as np
+    from PIL import Image
+
+    pixels = rng.integers(0, 256, size=(240, 320, 3), dtype=np.uint8)
+    path = os.path.join(directory, f"synthetic_{index:07d}.jpg")
+    Image.fromarray(pixels).save(path, quality=90)
+    return path
+
+
+def write_crews(path, count, seed):
+    from crew_scheduler import synthetic_problem
+
+    crews, _ = synthetic_problem(0, count, center=CITY_CENTER, spread_km=SPREAD_KM, seed=seed)
+    with open(path, "w") as f:
+        json.dump([{"crew_id": c.crew_id, "name": c.name, "skills": sorted(c.skills),
+                    "home": {"lat": c.lat, "lng": c.lng}, "daily_hours": c.daily_hours} for c in crews], f)
+
+
+def seed_submissions(db, count, image_dir, max_images, duplicate_rate, seed):
+    """
+    Writes raw submissions shaped like server.js uploads, in 500-write batches.
+    Each new report gets its own photo; repeat reports reuse the original's
+    text, location and photo, as a second citizen reporting the same problem
+    would. Reports past `max_images` photos are submitted without one.
+    """
+    import math
+    import numpy as np
+    from batch_writer import BatchWriter
+    from perception_agent import RAW_SUBMISSIONS_COLLECTION
+
+    rng = random.Random(seed)
+    image_rng = np.random.default_rng(seed)
+    images = 0
+    spread = SPREAD_KM / 111.195
+    previous = []
+    now = datetime.now(timezone.utc)
+    with BatchWriter(db, label="seeded submissions") as writer:
+        for i in range(count):
+            if previous and rng.random() < duplicate_rate:
+                description, location, image_path = rng.choice(previous)  # A repeat report of an earlier problem
+            else:
+                subcategory = rng.choice(list(REPORT_TEMPLATES))
+                description = rng.choice(REPORT_TEMPLATES[subcategory]).format(
+                    street=rng.choice(STREETS), landmark=rng.choice(LANDMARKS)) + f" (#{i})"
+                lat = CITY_CENTER[0] + rng.gauss(0, spread / 2)
+                lng = CITY_CENTER[1] + rng.gauss(0, spread / 2) / math.cos(math.radians(CITY_CENTER[0]))
+                location = f"{lat:.6f}, {lng:.6f}"
+                image_path = None
+                if max_images is None or images < max_images:
+                    image_path = make_image(image_dir, images, image_rng)
+                    images += 1
+                previous.append((description, location, image_path))
+            writer.set(db.collection(RAW_SUBMISSIONS_COLLECTION).document(f"sub-{i:07d}"), {
+                "title": description[:40],
+                "description": description,
+                "category": "Uncategorized",
+                "severity": rng.randint(1, 5),
+                "location": location,
+                "imageUrl": None,
+                "image_path": image_path,
+                "processed": False,
+                "status": "submitted",
+                "created_at": now,
+                # Explicitly unset, as when the upload-time validator was unavailable
+                "image_validation": None,
+            })
+
+
+# --- STAGES ---
+def run_stage(name, function, verbose):
+    """Runs one stage with the agents' per-document logging silenced unless `verbose`."""
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.perf_counter()
+    try:
+        with output:
+            function()
+    except ImportError as e:
+        return {"name": name, "skipped": f"missing dependency: {e.name or e}"}
+    return {"name": name, "seconds": round(time.perf_counter() - start, 3)}
+
+
+def collection_counts(db):
+    counts = {}
+    for collection in ("raw_submissions", "issues", "work_orders"):
+        statuses = Counter((doc.to_dict() or {}).get("status") for doc in db.collection(collection).stream())
+        counts[collection] = {"total": sum(statuses.values()), "by_status": dict(statuses)}
+    return counts
+
+
+def run_benchmark(args):
+    """Runs the benchmark in a scratch directory, removed afterwards unless --keep-workdir."""
+    workdir = tempfile.mkdtemp(prefix="pipeline_benchmark_")
+    try:
+        return run_benchmark_in(workdir, args)
+    finally:
+        if args.keep_workdir:
+            print(f"📁 Working directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_benchmark_in(workdir, args):
+    crews_path = os.path.join(workdir, "crews.json")
+    configure_environment(workdir, crews_path)
+
+    # Imported only after the environment points everything at the offline backends
+    from firestore_backend import memory_client
+    from classification_pipeline import FakeGeminiModel
+    from embedding_service import FakeSentenceModel
+    import perception_agent
+    import image_validator
+    import assignment_agent
+    import scheduling_agent
+
+    random.seed(args.seed)  # Auto-generated document ids, so counts and firestore_ops repeat run to run
+    db = memory_client()
+    write_crews(crews_path, args.crews, args.seed)
+    image_dir = os.path.join(workdir, "images")
+    os.makedirs(image_dir)
+
+    def seed():
+        seed_submissions(db, args.submissions, image_dir, args.max_images, args.duplicate_rate, args.seed)
+
+    def hotspots():
+        import geospatial_agent
+        from hotspot_engine import DEFAULT_SOURCE
+        geospatial_agent.main(backend="local", source=DEFAULT_SOURCE)
+
+    stage_functions = {
+        "seed": seed,
+        "validate": lambda: image_validator.validate_pending_images(workers=args.workers),
+        "perceive": lambda: perception_agent.process_submissions(
+            db, FakeGeminiModel(latency=args.gemini_latency), FakeSentenceModel()),
+        "assign": assignment_agent.prioritize_and_assign,
+        "schedule": scheduling_agent.schedule_proposed_work_orders,
+        "hotspots": hotspots,
+    }
+    run_order = [name for name in STAGES if name == "seed" or name in args.stages]
+    if args.orchestrator:
+        from pipeline_orchestrator import run_pipeline
+        stage_functions["orchestrate"] = lambda: run_pipeline(
+            db, FakeGeminiModel(latency=args.gemini_latency), FakeSentenceModel())
+        run_order = [name for name in run_order if name not in ORCHESTRATED_STAGES]
+        run_order.insert(run_order.index("hotspots") if "hotspots" in run_order else len(run_order), "orchestrate")
+
+    print(f"🧪 Pipeline benchmark: {args.submissions} submissions, {args.crews} crews "
+          f"(in-memory Firestore, fake Gemini and embeddings)")
+    results = []
+    for name in run_order:
+        writes_before = db.stats["writes"]
+        result = run_stage(name, stage_functions[name], args.verbose)
+        result["writes"] = db.stats["writes"] - writes_before
+        if "seconds" in result:
+            result["submissions_per_sec"] = round(args.submissions / max(result["seconds"], 1e-9), 1)
+            print(f"  ⏱️  {name:<11} {result['seconds']:>8.2f}s  {result['submissions_per_sec']:>10,.0f} submissions/sec  "
+                  f"{result['writes']:>8} writes")
+        else:
+            print(f"  ⏭️  {name:<11} skipped ({result['skipped']})")
+        results.append(result)
+
+    timed = {r["name"]: r["seconds"] for r in results if "seconds" in r}
+    flow_seconds = sum(timed.get(name, 0.0) for name in FLOW_STAGES)
+    counts = collection_counts(db)
+    report = {
+        "benchmark": "pipeline",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": {"submissions": args.submissions, "max_images": args.max_images, "crews": args.crews,
+                   "duplicate_rate": args.duplicate_rate, "workers": args.workers,
+                   "gemini_latency": args.gemini_latency, "orchestrator": args.orchestrator,
+                   "seed": args.seed},
+        "stages": results,
+        "flow_seconds": round(flow_seconds, 3),
+        "flow_submissions_per_sec": round(args.submissions / max(flow_seconds, 1e-9), 1),
+        "counts": counts,
+        "firestore_ops": dict(db.stats),
+    }
+    print(f"✅ raw → issue → work order → scheduled: {flow_seconds:.2f}s "
+          f"({report['flow_submissions_per_sec']:,.0f} submissions/sec); "
+          f"{counts['issues']['total']} issues, {counts['work_orders']['total']} work orders "
+          f"({counts['work_orders']['by_status'].get('scheduled', 0)} scheduled)")
+    return report
+
+
+def compare_with_baseline(report, baseline_path):
+    """Prints the change in each stage's time against an earlier JSON report."""
+    with open(baseline_path) as f:
+        baseline = {stage["name"]: stage for stage in json.load(f)["stages"] if "seconds" in stage}
+    print(f"📈 Compared with {baseline_path}:")
+    for stage in report["stages"]:
+        before = baseline.get(stage["name"])
+        if before and "seconds" in stage:
+            change = (stage["seconds"] - before["seconds"]) / max(before["seconds"], 1e-9) * 100
+            print(f"   {stage['name']:<11} {before['seconds']:>8.2f}s → {stage['seconds']:>8.2f}s ({change:+.0f}%)")
+
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="Time every pipeline stage end to end on synthetic data, offline.")
+    parser.add_argument("--submissions", type=int, default=DEFAULT_SUBMISSIONS,
+                        help="Synthetic submissions to seed (1M needs several GB of RAM for the embeddings)")
+    parser.add_argument("--max-images", type=int, help="Cap on distinct photos written (default: one per new report)")
+    parser.add_argument("--crews", type=int, default=DEFAULT_CREWS)
+    parser.add_argument("--duplicate-rate", type=float, default=0.1, help="Share of submissions repeating an earlier one")
+    parser.add_argument("--workers", type=int, default=1, help="Image validator worker processes")
+    parser.add_argument("--gemini-latency", type=float, default=0.0, help="Seconds per fake Gemini call")
+    parser.add_argument("--stages", nargs="+", choices=STAGES[1:], default=STAGES[1:])
+    parser.add_argument("--orchestrator", action="store_true",
+                        help="Run perceive/assign/schedule as one streaming pipeline (pipeline_orchestrator.py)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier --output file to compare stage times against")
+    parser.add_argument("--verbose", action="store_true", help="Show the agents' own logging")
+    parser.add_argument("--keep-workdir", action="store_true",
+                        help="Keep the scratch directory (images, caches, crews) for debugging")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+    if args.baseline:
+        compare_with_baseline(report, args.baseline)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
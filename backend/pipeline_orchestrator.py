@@ -0,0 +1,311 @@
+import os
+import time
+import queue
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from metrics import get_logger, run_agent
+
+# --- CONFIGURATION ---
+# Pages waiting between two stages; a full queue blocks the stage upstream of it
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))
+PIPELINE_PAGE_SIZE = int(os.getenv("PIPELINE_PAGE_SIZE", "500"))
+RAW_SUBMISSIONS_COLLECTION = "raw_submissions"
+ISSUES_COLLECTION = "issues"
+WORK_ORDERS_COLLECTION = "work_orders"
+
+log = get_logger("pipeline")
+
+
+# --- STAGED WRITES ---
+class StagedSnapshot:
+    """A document staged in this run, readable like a DocumentSnapshot before it exists in Firestore."""
+
+    def __init__(self, reference, data, create_time):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = True
+        self.create_time = create_time
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class StagedWrites:
+    """
+    Stands in for a BatchWriter while a page moves through the stages. Writes
+    are merged per document in memory instead of being sent, so a submission
+    that becomes an issue, a work order and a schedule is written once.
+    Documents written inside the same `group()` stay linked, and commit()
+    writes each linked set in one batch.
+    """
+
+    def __init__(self):
+        self.docs = {}  # path -> [doc_ref, method, data]
+        self.created = {}  # path -> when it was first staged
+        self._links = {}  # Union-find over paths written in the same group
+        self._in_group = False
+        self._group_root = None
+        self.failed_paths = set()  # Nothing is committed here; kept for BatchWriter callers
+
+    # --- BatchWriter interface ---
+    def set(self, doc_ref, data, merge=False):
+        entry = self.docs.get(doc_ref.path)
+        if entry and merge:
+            entry[2].update(data)
+        else:
+            self.docs[doc_ref.path] = [doc_ref, "merge" if merge else "set", dict(data)]
+            self.created.setdefault(doc_ref.path, datetime.now(timezone.utc))
+        self._link(doc_ref.path)
+
+    def update(self, doc_ref, data):
+        entry = self.docs.get(doc_ref.path)
+        if entry:
+            entry[2].update(data)  # An update on a staged set folds into the set
+        else:
+            self.docs[doc_ref.path] = [doc_ref, "update", dict(data)]
+        self._link(doc_ref.path)
+
+    @contextmanager
+    def group(self):
+        self._in_group, self._group_root = True, None
+        try:
+            yield self
+        finally:
+            self._in_group, self._group_root = False, None
+
+    def _find(self, path):
+        root = self._links.setdefault(path, path)
+        while root != self._links[root]:
+            self._links[root] = self._links[self._links[root]]
+            root = self._links[root]
+        return root
+
+    def _link(self, path):
+        root = self._find(path)
+        if not self._in_group:
+            return
+        if self._group_root is None:
+            self._group_root = root
+        elif root != self._find(self._group_root):
+            self._links[root] = self._find(self._group_root)
+
+    # --- Reads ---
+    def documents(self, collection):
+        """Snapshots of the documents created (set) in `collection` so far, in staging order."""
+        prefix = f"{collection}/"
+        for path, (doc_ref, method, data) in self.docs.items():
+            if method == "set" and path.startswith(prefix):
+                yield StagedSnapshot(doc_ref, data, self.created[path])
+
+    # --- Commit ---
+    def commit(self, writer):
+        """Queues one write per document on `writer`, each linked set inside one write group."""
+        components = {}
+        for path in self.docs:
+            components.setdefault(self._find(path), []).append(path)
+        for paths in components.values():
+            with writer.group():
+                for path in paths:
+                    doc_ref, method, data = self.docs[path]
+                    if method == "update":
+                        writer.update(doc_ref, data)
+                    else:
+                        writer.set(doc_ref, data, merge=method == "merge")
+        return len(self.docs)
+
+
+class Page:
+    """One page of raw submissions on its way through the stages, with everything staged for it so far."""
+
+    def __init__(self, index, docs):
+        self.index = index
+        self.docs = docs
+        self.staged = StagedWrites()
+        self.statuses = {}  # issue_id -> status reached in this run
+        self.routed_days = set()
+
+
+# --- STAGES ---
+class PipelineStages:
+    """
+    The perception → assignment → scheduling chain for one run. Each stage
+    keeps its own state across pages (duplicate indexes, crew capacity), so
+    each runs on one thread and takes pages in order; concurrency inside a
+    stage comes from the existing knobs (GEMINI_CONCURRENCY for
+    classification, BATCH_WRITER_CONCURRENCY for commits).
+    """
+
+    def __init__(self, db, gemini_model, sentence_model):
+        from perception_agent import load_recent_submissions, open_classification_cache
+        from crew_scheduler import load_crews
+
+        self.db = db
+        self.gemini_model = gemini_model
+        self.sentence_model = sentence_model
+        self.text_index, self.image_index = load_recent_submissions(db)
+        self.classification_cache = open_classification_cache()  # Used only by the perceive stage
+        # One clock for the whole run, so day indexes and carried-over crew hours line up across pages
+        self.now = datetime.utcnow()
+        self.crews = load_crews() or None
+        self.booked_hours = None  # Read from Firestore by the first page, then carried forward
+
+    def perceive(self, page):
+        from perception_agent import process_page
+        process_page(self.db, page.staged, page.docs, self.text_index, self.image_index,
+                     self.gemini_model, self.sentence_model, self.classification_cache)
+
+    def assign(self, page):
+        from assignment_agent import queue_assignments
+        issues = list(page.staged.documents(ISSUES_COLLECTION))
+        if issues:
+            page.statuses.update(queue_assignments(self.db, page.staged, issues))
+
+    def schedule(self, page):
+        from geo_utils import parse_location
+        from scheduling_agent import schedule_work_orders
+
+        work_orders = {doc.id: doc.to_dict() for doc in page.staged.documents(WORK_ORDERS_COLLECTION)}
+        if not work_orders:
+            return
+        locations = {doc.id: parse_location(doc.to_dict()) for doc in page.staged.documents(ISSUES_COLLECTION)}
+        plan = schedule_work_orders(self.db, page.staged, work_orders, self.now, crews=self.crews,
+                                    booked_hours=self.booked_hours, locations=locations)
+        self.crews, self.booked_hours = plan.crews, plan.committed_hours
+        page.statuses.update(plan.status_updates)
+        page.routed_days |= plan.routed_days
+
+
+def _stage_worker(name, function, inbox, outbox, timings, aborted):
+    """
+    Applies `function` to every page from `inbox` and passes it on; None marks
+    the end of the stream. After any stage fails, pages are drained without
+    being processed: perception has already remembered the failed page's
+    submissions in the duplicate indexes, so later pages could otherwise be
+    committed as duplicates of reports that were never written.
+    """
+    while True:
+        page = inbox.get()
+        if page is None:
+            outbox.put(None)
+            return
+        if aborted.is_set():
+            continue
+        start = time.perf_counter()
+        try:
+            function(page)
+        except Exception as e:
+            # Nothing of this page or any later one is written, so their submissions are picked up again next run
+            log.error("❌ Stage '%s' failed on page %d: %s; stopping the run, its %d submission(s) and "
+                      "those of later pages stay unprocessed.", name, page.index, e, len(page.docs))
+            aborted.set()
+            page = None
+        timings[name] += time.perf_counter() - start
+        if page is not None:
+            outbox.put(page)
+
+
+def run_pipeline(db, gemini_model, sentence_model, page_size=PIPELINE_PAGE_SIZE, queue_size=PIPELINE_QUEUE_SIZE):
+    """
+    Streams unprocessed submissions through perception, assignment and
+    scheduling in one process. Pages are handed between stage threads over
+    bounded queues, so a slow stage holds back the ones before it instead of
+    buffering the backlog. Each document is written once, when its page
+    leaves the last stage: the submission with its processed flag, the issue
+    and work order in their final state, all linked documents in one batch.
+    Routes for the crew-days that gained orders are re-sequenced at the end.
+    Returns a summary dict.
+    """
+    from firestore_backend import FieldFilter
+    from batch_writer import BatchWriter, iter_pages
+
+    start = time.perf_counter()
+    stages = PipelineStages(db, gemini_model, sentence_model)
+    steps = [("perceive", stages.perceive), ("assign", stages.assign), ("schedule", stages.schedule)]
+    timings = {name: 0.0 for name, _ in steps}
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(steps) + 1)]
+    aborted = threading.Event()
+    threads = [threading.Thread(target=_stage_worker,
+                                args=(name, function, queues[i], queues[i + 1], timings, aborted),
+                                name=f"pipeline-{name}", daemon=True)
+               for i, (name, function) in enumerate(steps)]
+    for thread in threads:
+        thread.start()
+
+    def read_pages():
+        query = db.collection(RAW_SUBMISSIONS_COLLECTION).where(filter=FieldFilter("processed", "==", False))
+        try:
+            for index, docs in enumerate(iter_pages(query, page_size=page_size)):
+                if aborted.is_set():
+                    break
+                queues[0].put(Page(index, docs))  # Blocks while the perception stage is behind
+        except Exception as e:
+            log.error("❌ Reading submissions failed: %s", e)
+        finally:
+            queues[0].put(None)
+
+    reader = threading.Thread(target=read_pages, name="pipeline-read", daemon=True)
+    reader.start()
+
+    summary = {"pages": 0, "submissions": 0, "documents_written": 0}
+    statuses, new_issues, routed_days = {}, {}, set()
+    with BatchWriter(db, label="pipeline writes") as writer:
+        while True:
+            page = queues[-1].get()
+            if page is None:
+                break
+            summary["pages"] += 1
+            summary["submissions"] += len(page.docs)
+            summary["documents_written"] += page.staged.commit(writer)
+            statuses.update(page.statuses)
+            new_issues.update((doc.id, doc.to_dict()) for doc in page.staged.documents(ISSUES_COLLECTION))
+            routed_days |= page.routed_days
+            log.info("📦 Page %d: %d submission(s) → %d document write(s) queued.",
+                     page.index, len(page.docs), len(page.staged.docs))
+    reader.join()
+    for thread in threads:
+        thread.join()
+    from perception_agent import close_classification_cache
+    close_classification_cache(stages.classification_cache)
+
+    failed = writer.failed_paths
+    committed = {issue_id: data for issue_id, data in new_issues.items()
+                 if f"{ISSUES_COLLECTION}/{issue_id}" not in failed}
+    if committed:
+        from tile_aggregator import record_tile_updates
+        record_tile_updates(ISSUES_COLLECTION, documents=committed)
+    if routed_days:
+        from route_optimizer import reoptimize_routes
+        reoptimize_routes(db, keys=routed_days, crews=stages.crews)
+
+    summary.update({
+        "issues": len(new_issues),
+        "scheduled_issues": sum(1 for status in statuses.values() if status == "scheduled"),
+        "failed_writes": writer.stats["failed_writes"],
+        "aborted": aborted.is_set(),
+        "stage_seconds": {name: round(seconds, 3) for name, seconds in timings.items()},
+        "seconds": round(time.perf_counter() - start, 3),
+    })
+    busy = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+    log.info("🎉 Pipeline finished in %.2fs: %d submission(s) → %d issue(s), %d scheduled; "
+             "%d document write(s). Stage busy time: %s.", summary['seconds'], summary['submissions'],
+             summary['issues'], summary['scheduled_issues'], summary['documents_written'], busy)
+    return summary
+
+
+# --- SCRIPT EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run perception, assignment and scheduling as one streaming pipeline.")
+    parser.add_argument("--page-size", type=int, default=PIPELINE_PAGE_SIZE, help="Submissions per page")
+    parser.add_argument("--queue-size", type=int, default=PIPELINE_QUEUE_SIZE,
+                        help="Pages buffered between stages before the upstream stage waits")
+    args = parser.parse_args()
+
+    from perception_agent import initialize_services
+    db_client, gemini_client, sentence_client = initialize_services()
+    run_agent("pipeline_orchestrator", run_pipeline, db_client, gemini_client, sentence_client,
+              args.page_size, args.queue_size)
@@ -0,0 +1,308 @@
+import time
+import random
+import argparse
+import itertools
+from collections import defaultdict
+
+import numpy as np
+
+from geo_utils import haversine_m
+from metrics import get_logger, observe
+
+# --- CONFIGURATION ---
+ROAD_FACTOR = 1.3  # Same allowance for road distance as crew_scheduler
+OR_OPT_SEGMENT_LENGTHS = (1, 2, 3)
+EXACT_MAX_STOPS = 8  # Routes this short are solved exactly (Held-Karp, 2^n * n states)
+IMPROVEMENT_EPS_KM = 1e-6
+
+log = get_logger("routing")
+
+
+# --- DISTANCES ---
+def distance_matrix(lats, lngs):
+    """Pairwise haversine distances in km, computed in one broadcast."""
+    lats, lngs = np.asarray(lats, dtype=np.float64), np.asarray(lngs, dtype=np.float64)
+    return haversine_m(lats[:, None], lngs[:, None], lats[None, :], lngs[None, :]) / 1000.0
+
+
+def tour_length(tour, D):
+    tour = np.asarray(tour)
+    return float(D[tour[:-1], tour[1:]].sum())
+
+
+# --- EXACT ---
+def held_karp(D):
+    """
+    Shortest tour from the depot (index 0) through every other index and
+    back, by dynamic programming over subsets of stops. Each subset size is
+    one vectorized step: best[mask, j] is the shortest path from the depot
+    through `mask` ending at stop j.
+    """
+    n = len(D) - 1
+    full = (1 << n) - 1
+    best = np.full((full + 1, n), np.inf)
+    parent = np.full((full + 1, n), -1, dtype=np.int64)
+    masks = np.arange(full + 1)
+    sizes = np.array([bin(mask).count("1") for mask in masks])
+    best[1 << np.arange(n), np.arange(n)] = D[0, 1:]
+    legs = D[1:, 1:]
+    for size in range(2, n + 1):
+        layer = masks[sizes == size]
+        for j in range(n):
+            ending = layer[(layer >> j) & 1 == 1]
+            costs = best[ending ^ (1 << j)] + legs[:, j]
+            parent[ending, j] = np.argmin(costs, axis=1)
+            best[ending, j] = costs[np.arange(len(ending)), parent[ending, j]]
+    last = int(np.argmin(best[full] + D[1:, 0]))
+    tour, mask = [], full
+    while last >= 0:
+        tour.append(last + 1)
+        mask, last = mask ^ (1 << last), int(parent[mask, last])
+    return np.array([0] + tour[::-1] + [0])
+
+
+# --- CONSTRUCTION AND IMPROVEMENT ---
+def nearest_neighbour(D):
+    """Tour from the depot (index 0) that always visits the closest unvisited stop, then returns."""
+    n = len(D)
+    visited = np.zeros(n, dtype=bool)
+    visited[0] = True
+    tour = [0]
+    for _ in range(n - 1):
+        distances = np.where(visited, np.inf, D[tour[-1]])
+        following = int(np.argmin(distances))
+        visited[following] = True
+        tour.append(following)
+    tour.append(0)
+    return np.array(tour)
+
+
+def two_opt(tour, D):
+    """
+    Applies the best segment reversal until none shortens the tour. All
+    candidate moves are scored at once: reversing tour[i+1..j] swaps edges
+    (a_i, b_i) and (a_j, b_j) for (a_i, a_j) and (b_i, b_j).
+    """
+    tour = np.array(tour)
+    n = len(tour) - 1  # Number of edges
+    if n < 4:
+        return tour
+    upper = np.triu(np.ones((n, n), dtype=bool), k=2)
+    while True:
+        a, b = tour[:-1], tour[1:]
+        edges = D[a, b]
+        delta = D[a[:, None], a[None, :]] + D[b[:, None], b[None, :]] - edges[:, None] - edges[None, :]
+        delta = np.where(upper, delta, np.inf)
+        best = int(np.argmin(delta))
+        if delta.flat[best] >= -IMPROVEMENT_EPS_KM:
+            return tour
+        i, j = divmod(best, n)
+        tour[i + 1:j + 1] = tour[i + 1:j + 1][::-1]
+
+
+def or_opt(tour, D):
+    """
+    Moves runs of 1-3 consecutive stops (either way round) to the position
+    where they fit best, as long as that shortens the tour. For each run the
+    cost of every insertion edge is scored at once.
+    """
+    tour = list(tour)
+    improved = True
+    while improved:
+        improved = False
+        for length in OR_OPT_SEGMENT_LENGTHS:
+            start = 1
+            while start + length < len(tour):
+                segment = tour[start:start + length]
+                previous, following = tour[start - 1], tour[start + length]
+                removal = D[previous, segment[0]] + D[segment[-1], following] - D[previous, following]
+                rest = np.array(tour[:start] + tour[start + length:])
+                c, d = rest[:-1], rest[1:]
+                forward = D[c, segment[0]] + D[segment[-1], d] - D[c, d]
+                backward = D[c, segment[-1]] + D[segment[0], d] - D[c, d]
+                costs = np.minimum(forward, backward)
+                costs[start - 1] = np.inf  # Putting it back where it was
+                position = int(np.argmin(costs))
+                if costs[position] < removal - IMPROVEMENT_EPS_KM:
+                    moved = segment if forward[position] <= backward[position] else segment[::-1]
+                    tour = list(rest[:position + 1]) + moved + list(rest[position + 1:])
+                    improved = True
+                else:
+                    start += 1
+    return np.array(tour)
+
+
+def optimize_route(home, stops):
+    """
+    Visiting order for one crew-day. `home` is (lat, lng) or None (then the
+    stops' centroid stands in for the depot); `stops` is a list of
+    (stop_id, lat, lng). Returns ([(stop_id, sequence, leg_km)], total_km),
+    with road-adjusted distances.
+    """
+    if not stops:
+        return [], 0.0
+    lats = np.array([lat for _, lat, _ in stops])
+    lngs = np.array([lng for _, _, lng in stops])
+    depot = home if home is not None else (float(lats.mean()), float(lngs.mean()))
+    D = distance_matrix(np.concatenate([[depot[0]], lats]), np.concatenate([[depot[1]], lngs])) * ROAD_FACTOR
+
+    if len(stops) <= 2:
+        tour = nearest_neighbour(D)  # Either order is the same loop
+    elif len(stops) <= EXACT_MAX_STOPS:
+        tour = held_karp(D)
+    else:
+        tour = or_opt(two_opt(nearest_neighbour(D), D), D)
+        tour = two_opt(tour, D)  # Or-opt moves can open up new reversals
+    ordered = []
+    for sequence, (previous, stop) in enumerate(zip(tour[:-2], tour[1:-1]), start=1):
+        ordered.append((stops[stop - 1][0], sequence, round(float(D[previous, stop]), 3)))
+    return ordered, tour_length(tour, D)
+
+
+def optimize_routes(routes):
+    """Optimizes every route in {key: (home, stops)}; returns {key: (ordered stops, total_km)}."""
+    return {key: optimize_route(home, stops) for key, (home, stops) in routes.items()}
+
+
+# --- FIRESTORE ---
+def reoptimize_routes(db, keys=None, crews=None):
+    """
+    Re-sequences scheduled work orders per (crew id, date) and writes
+    `route_sequence`, `estimated_travel_km` (leg from the previous stop) and
+    `route_travel_km` (whole day) back to each order. With `keys`, only those
+    (crew id, "YYYY-MM-DD") days are touched, which is what the scheduler
+    passes after inserting new orders.
+    """
+    from datetime import datetime, timedelta
+    from firestore_backend import FieldFilter, SERVER_TIMESTAMP
+    from batch_writer import BatchWriter, paginate
+    from crew_scheduler import load_crews
+    from geo_utils import parse_location
+    from scheduling_agent import WORK_ORDERS_COLLECTION, load_locations
+
+    start = time.perf_counter()
+    first_day = min((date for _, date in keys), default=None) if keys else \
+        (datetime.utcnow() + timedelta(days=1)).date().isoformat()
+    homes = {crew.crew_id: (crew.lat, crew.lng) for crew in (crews or load_crews() or [])}
+
+    # Same single-field range query as the scheduler's booked-hours scan
+    query = db.collection(WORK_ORDERS_COLLECTION).where(filter=FieldFilter("scheduled_date", ">=", first_day))
+    day_orders = defaultdict(list)
+    for work_order in paginate(query):
+        data = work_order.to_dict()
+        if data.get("status") != "scheduled" or not data.get("assigned_crew_id"):
+            continue
+        key = (data["assigned_crew_id"], str(data.get("scheduled_date", ""))[:10])
+        if keys is None or key in keys:
+            day_orders[key].append((work_order.id, data))
+
+    missing = {data["issue_id"] for orders in day_orders.values() for _, data in orders
+               if parse_location(data) is None and data.get("issue_id")}
+    issue_locations = load_locations(db, missing) if missing else {}
+    routes = {}
+    for key, orders in day_orders.items():
+        stops = []
+        for work_order_id, data in orders:
+            location = parse_location(data) or issue_locations.get(data.get("issue_id"))
+            if location is not None:
+                stops.append((work_order_id, *location))
+        routes[key] = (homes.get(key[0]), stops)
+    loaded = time.perf_counter()
+
+    results = optimize_routes(routes)
+    optimized = time.perf_counter()
+
+    current = {work_order_id: data for orders in day_orders.values() for work_order_id, data in orders}
+    with BatchWriter(db, label="route updates") as writer:
+        for ordered, total_km in results.values():
+            for work_order_id, sequence, leg_km in ordered:
+                data = current[work_order_id]
+                if (data.get("route_sequence") == sequence and data.get("estimated_travel_km") == leg_km
+                        and data.get("route_travel_km") == round(total_km, 3)):
+                    continue  # Unchanged; skip the write
+                writer.update(db.collection(WORK_ORDERS_COLLECTION).document(work_order_id), {
+                    "route_sequence": sequence,
+                    "estimated_travel_km": leg_km,
+                    "route_travel_km": round(total_km, 3),
+                    "last_updated": SERVER_TIMESTAMP,
+                })
+    observe("route_optimize", optimized - loaded)
+    log.info("🗺️  Re-sequenced %d crew-day route(s) (%d order(s)): load %.2fs, optimize %.0f ms.",
+             len(routes), len(current), loaded - start, (optimized - loaded) * 1000)
+    return results
+
+
+# --- BENCHMARK ---
+def synthetic_routes(crew_count, stops_per_route, center=(12.9716, 77.5946), spread_km=15.0, seed=11):
+    rng = random.Random(seed)
+    spread = spread_km / 111.195
+    routes = {}
+    for c in range(crew_count):
+        home = (center[0] + rng.gauss(0, spread / 2), center[1] + rng.gauss(0, spread / 2))
+        stops = [(f"wo-{c}-{s}", home[0] + rng.gauss(0, spread / 4), home[1] + rng.gauss(0, spread / 4))
+                 for s in range(max(1, int(rng.gauss(stops_per_route, 2))))]
+        routes[(f"crew-{c + 1}", "day-0")] = (home, stops)
+    return routes
+
+
+def brute_force_length(D):
+    """Shortest tour length over every visiting order; only for a handful of stops."""
+    orders = np.array(list(itertools.permutations(range(1, len(D)))))
+    tours = np.hstack([np.zeros((len(orders), 1), dtype=int), orders, np.zeros((len(orders), 1), dtype=int)])
+    return float(D[tours[:, :-1], tours[:, 1:]].sum(axis=1).min())
+
+
+def check_exact(count=300, seed=5):
+    """Compares optimize_route against brute force on random routes of up to EXACT_MAX_STOPS stops."""
+    rng = random.Random(seed)
+    worst = 0.0
+    for _ in range(count):
+        home = (12.97 + rng.gauss(0, 0.05), 77.59 + rng.gauss(0, 0.05))
+        stops = [(f"wo-{s}", home[0] + rng.gauss(0, 0.03), home[1] + rng.gauss(0, 0.03))
+                 for s in range(rng.randint(1, EXACT_MAX_STOPS))]
+        _, total = optimize_route(home, stops)
+        lats = np.array([home[0]] + [lat for _, lat, _ in stops])
+        lngs = np.array([home[1]] + [lng for _, _, lng in stops])
+        optimum = brute_force_length(distance_matrix(lats, lngs) * ROAD_FACTOR)
+        worst = max(worst, (total - optimum) / optimum if optimum else 0.0)
+    status = "✅" if worst < 1e-9 else "❌"
+    print(f"{status} {count} random routes of 1-{EXACT_MAX_STOPS} stops: worst gap to brute force {worst:.2%}")
+    return worst < 1e-9
+
+
+def run_benchmark(crew_count, stops_per_route):
+    routes = synthetic_routes(crew_count, stops_per_route)
+    stop_count = sum(len(stops) for _, stops in routes.values())
+    print(f"🧪 Optimizing {crew_count} crew routes ({stop_count} stops)...")
+
+    # Baseline: stops in the order they were scheduled
+    baseline = 0.0
+    for home, stops in routes.values():
+        lats = np.array([home[0]] + [lat for _, lat, _ in stops])
+        lngs = np.array([home[1]] + [lng for _, _, lng in stops])
+        D = distance_matrix(lats, lngs) * ROAD_FACTOR
+        baseline += tour_length(np.r_[0:len(stops) + 1, 0], D)
+
+    start = time.perf_counter()
+    results = optimize_routes(routes)
+    elapsed = time.perf_counter() - start
+    optimized = sum(total for _, total in results.values())
+    print(f"✅ {elapsed * 1000:.0f} ms for all crews ({elapsed * 1e6 / len(routes):.0f} µs per route): "
+          f"{baseline:.0f} km → {optimized:.0f} km ({100 * (1 - optimized / baseline):.0f}% shorter)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-crew, per-day route sequencing for scheduled work orders.")
+    parser.add_argument("--benchmark", type=int, metavar="CREWS", help="Optimize synthetic routes for this many crews")
+    parser.add_argument("--stops", type=int, default=8, help="Average stops per synthetic route")
+    parser.add_argument("--check", action="store_true",
+                        help=f"Verify routes of up to {EXACT_MAX_STOPS} stops against brute force")
+    args = parser.parse_args()
+
+    if args.check:
+        raise SystemExit(0 if check_exact() else 1)
+    elif args.benchmark:
+        run_benchmark(args.benchmark, args.stops)
+    else:
+        from scheduling_agent import initialize_firestore_client
+        reoptimize_routes(initialize_firestore_client())
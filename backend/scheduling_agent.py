@@ -1,8 +1,11 @@
 import os
 import sys
+from collections import namedtuple
 from datetime import datetime, timedelta
-from google.cloud import firestore
-from google.cloud.firestore_v1.base_query import FieldFilter
+
+from metrics import get_logger, run_agent, timer
+
+log = get_logger("scheduling")
 
 # --- CONFIGURATION ---
 # Load configuration from environment variables for security and flexibility.
@@ -10,7 +13,7 @@ try:
     from dotenv import load_dotenv
     load_dotenv()
 except ImportError:
-    print("dotenv not found, assuming production environment.")
+    log.info("dotenv not found, assuming production environment.")
 
 PROJECT_ID = os.getenv("PROJECT_ID", "civicresolve-hackathon-466511")
 ISSUES_COLLECTION = "issues"
@@ -18,7 +21,7 @@ WORK_ORDERS_COLLECTION = "work_orders"
 
 # Basic validation to ensure the environment is set up correctly.
 if not PROJECT_ID:
-    print("❌ FATAL: Missing PROJECT_ID environment variable.")
+    log.critical("❌ FATAL: Missing PROJECT_ID environment variable.")
     sys.exit(1)
 
 # --- MAPPING & LOGIC ---
@@ -32,80 +35,192 @@ PRIORITY_SCHEDULE_MAP = {
 # --- CLIENT INITIALIZATION ---
 def initialize_firestore_client():
     """Initializes and returns a Firestore client."""
+    # Imported here so that loading this module stays cheap.
+    from firestore_backend import use_memory_backend, memory_client
+    if use_memory_backend():
+        return memory_client()
+    from google.cloud import firestore
     try:
         client = firestore.Client(project=PROJECT_ID)
-        print("✅ Firestore client initialized successfully.")
+        log.info("✅ Firestore client initialized successfully.")
         return client
     except Exception as e:
-        print(f"❌ FATAL: Could not initialize Firestore client: {e}")
+        log.critical("❌ FATAL: Could not initialize Firestore client: %s", e)
         sys.exit(1)
 
+# --- SCHEDULING INPUTS ---
+def load_locations(db, issue_ids):
+    """Looks up issue locations in batched reads; proposed work orders do not carry one themselves."""
+    from batch_writer import PAGE_SIZE
+    from geo_utils import parse_location
+
+    issue_ids = list(issue_ids)
+    locations = {}
+    for i in range(0, len(issue_ids), PAGE_SIZE):
+        refs = [db.collection(ISSUES_COLLECTION).document(issue_id) for issue_id in issue_ids[i:i + PAGE_SIZE]]
+        with timer("firestore_read", op="get_all"):
+            snapshots = list(db.get_all(refs))
+        for snapshot in snapshots:
+            if snapshot.exists:
+                locations[snapshot.id] = parse_location(snapshot.to_dict())
+    return locations
+
+
+def load_booked_hours(db, first_day):
+    """Hours already scheduled per (crew_id, day index) from earlier runs, so crews are not double-booked."""
+    from firestore_backend import FieldFilter
+    from batch_writer import paginate
+
+    booked = {}
+    # A single-field range filter needs no composite index; the status is checked here instead
+    query = db.collection(WORK_ORDERS_COLLECTION).where(
+        filter=FieldFilter("scheduled_date", ">=", first_day.isoformat()))
+    for work_order in paginate(query):
+        data = work_order.to_dict()
+        if data.get("status") != "scheduled" or not data.get("assigned_crew_id"):
+            continue
+        try:
+            day = (datetime.fromisoformat(data["scheduled_date"].rstrip("Z")).date() - first_day).days
+        except (TypeError, ValueError):
+            continue
+        key = (data["assigned_crew_id"], day)
+        booked[key] = booked.get(key, 0.0) + float(data.get("estimated_hours") or 0.0)
+    return booked
+
+
 # --- MAIN APPLICATION LOGIC ---
+SchedulePlan = namedtuple("SchedulePlan", [
+    "assignments", "unassigned", "status_updates", "routed_days", "committed_hours", "crews"])
+
+
+def schedule_work_orders(db, writer, work_orders, now, crews=None, booked_hours=None, locations=None):
+    """
+    Assigns each of `work_orders` ({work_order_id: data}) a crew and a day
+    with crew_scheduler (respecting skills, daily capacity, travel and priority
+    deadlines) and queues the "scheduled" updates for each order and its
+    issues on `writer`. `booked_hours` and `locations` are read from Firestore
+    unless the caller already has them. Returns a SchedulePlan.
+    """
+    from firestore_backend import SERVER_TIMESTAMP
+    from crew_scheduler import CrewScheduler, Job, load_crews, default_crews
+
+    # Day 0 of the plan is tomorrow, so a "high" order (1 day) is due on day 0
+    first_day = (now + timedelta(days=1)).date()
+    if locations is None:
+        locations = load_locations(db, {data["issue_id"] for data in work_orders.values()})
+    jobs = []
+    for work_order_id, data in work_orders.items():
+        location = locations.get(data["issue_id"])
+        priority = data.get("priority", "low")
+        jobs.append(Job(
+            job_id=work_order_id,
+            department=data.get("assigned_department") or "General Dept (Uncategorized)",
+            priority=priority,
+            deadline_day=PRIORITY_SCHEDULE_MAP.get(priority, 7) - 1,
+            lat=location[0] if location else None,
+            lng=location[1] if location else None,
+            service_hours=float(data.get("estimated_service_hours") or 1.5),
+        ))
+
+    crews = crews or load_crews()
+    if not crews:
+        log.warning("⚠️  No crews file found (set CREWS_PATH); using one default crew per department.")
+        crews = default_crews(jobs)
+    if booked_hours is None:
+        booked_hours = load_booked_hours(db, first_day)
+    scheduler = CrewScheduler(crews, booked_hours=booked_hours)
+    assignments, unassigned, stats = scheduler.solve(jobs)
+    log.info("🧮 Planned %d order(s) over %d crew(s) in %.2fs: %.0f km of travel, %d past their priority deadline.",
+             stats['assigned'], len(crews), stats['seconds'], stats['travel_km'], stats['late'])
+
+    status_updates = {}
+    routed_days = set()
+    for work_order_id, assignment in assignments.items():
+        issue_id = work_orders[work_order_id]["issue_id"]
+        # Grouped work orders cover several duplicate reports
+        issue_ids = work_orders[work_order_id].get("issue_ids") or [issue_id]
+        scheduled_date = now + timedelta(days=assignment.day + 1)
+        update = {
+            "status": "scheduled",
+            "scheduled_date": scheduled_date.isoformat() + "Z",
+            "assigned_crew": assignment.crew_name,
+            "assigned_crew_id": assignment.crew_id,
+            "estimated_hours": assignment.estimated_hours,
+            "last_updated": SERVER_TIMESTAMP
+        }
+        location = locations.get(issue_id)
+        if location:
+            # Copied so the routing stage can sequence stops without reading the issues again
+            update["location"] = {"lat": location[0], "lng": location[1]}
+        with writer.group():
+            # --- Update the Work Order ---
+            work_order_ref = db.collection(WORK_ORDERS_COLLECTION).document(work_order_id)
+            writer.update(work_order_ref, update)
+            log.debug("✅ Work order %s → %s on %s. Queued.", work_order_id, assignment.crew_name, scheduled_date.date())
+
+            # --- Update the original Issues in the same batch ---
+            for member_id in issue_ids:
+                issue_ref = db.collection(ISSUES_COLLECTION).document(member_id)
+                writer.update(issue_ref, {
+                    "status": "scheduled",
+                    "last_updated": SERVER_TIMESTAMP
+                })
+                status_updates[member_id] = "scheduled"
+        routed_days.add((assignment.crew_id, scheduled_date.date().isoformat()))
+
+    if unassigned:
+        log.warning("⚠️  %d work order(s) did not fit in the next %d days; left as 'proposed'.",
+                    len(unassigned), scheduler.horizon)
+    return SchedulePlan(assignments, unassigned, status_updates, routed_days, scheduler.committed_hours(), crews)
+
+
 def schedule_proposed_work_orders():
     """
-    Finds "proposed" work orders, assigns a schedule based on priority,
-    and updates their status to "scheduled" in a batch.
+    Collects "proposed" work orders, schedules them with schedule_work_orders
+    and commits the updates in chunked batches. Orders that do not fit within
+    the horizon stay "proposed" for the next run.
     """
+    from firestore_backend import FieldFilter
+    from batch_writer import BatchWriter, paginate
+
     db = initialize_firestore_client()
     
-    print(f"🔎 Scanning for 'proposed' work orders in collection '{WORK_ORDERS_COLLECTION}'...")
+    log.info("🔎 Scanning for 'proposed' work orders in collection '%s'...", WORK_ORDERS_COLLECTION)
     
     # Query for work orders that are ready to be scheduled.
     query = db.collection(WORK_ORDERS_COLLECTION).where(filter=FieldFilter("status", "==", "proposed"))
-    
+
     try:
-        proposed_work_orders = query.stream()
+        work_orders = {}
+        for work_order in paginate(query):
+            data = work_order.to_dict()
+            if not data.get("issue_id"):
+                log.warning("⚠️  Skipping work order %s due to missing 'issue_id'.", work_order.id)
+                continue
+            work_orders[work_order.id] = data
     except Exception as e:
-        print(f"❌ ERROR: Query failed for work orders: {e}")
+        log.error("❌ ERROR: Query failed for work orders: %s", e)
         return
 
-    batch = db.batch()
-    scheduled_count = 0
+    if not work_orders:
+        log.info("✅ No 'proposed' work orders found to schedule.")
+        return
 
-    for work_order in proposed_work_orders:
-        data = work_order.to_dict()
-        work_order_id = work_order.id
-        issue_id = data.get("issue_id") # Get the original issue ID
-        
-        if not issue_id:
-            print(f"⚠️  Skipping work order {work_order_id} due to missing 'issue_id'.")
-            continue
-            
-        print(f"\n📄 Processing Proposed Work Order → {work_order_id}")
-        
-        priority = data.get("priority", "low")
-        days_to_schedule = PRIORITY_SCHEDULE_MAP.get(priority, 7)
-        scheduled_date = datetime.utcnow() + timedelta(days=days_to_schedule)
-        
-        # --- Update the Work Order ---
-        work_order_ref = db.collection(WORK_ORDERS_COLLECTION).document(work_order_id)
-        batch.update(work_order_ref, {
-            "status": "scheduled",
-            "scheduled_date": scheduled_date.isoformat() + "Z",
-            "assigned_crew": "Crew B-42", # Placeholder for a real crew assignment logic
-            "last_updated": firestore.SERVER_TIMESTAMP
-        })
-        print(f"✅ Work Order {work_order_id} scheduled for {scheduled_date.date()}. Added to batch.")
-        
-        # --- Update the original Issue ---
-        issue_ref = db.collection(ISSUES_COLLECTION).document(issue_id)
-        batch.update(issue_ref, {
-            "status": "scheduled",
-            "last_updated": firestore.SERVER_TIMESTAMP
-        })
-        print(f"🔁 Original Issue {issue_id} status updated to 'scheduled'. Added to batch.")
-        
-        scheduled_count += 1
-
-    # Commit the batch to Firestore if any work orders were scheduled.
-    if scheduled_count > 0:
-        try:
-            batch.commit()
-            print(f"\n🎉 Successfully committed batch with {scheduled_count} scheduled work orders.")
-        except Exception as e:
-            print(f"❌ ERROR: Firestore batch commit failed: {e}")
-    else:
-        print("✅ No 'proposed' work orders found to schedule.")
+    # Commit in chunks of at most 500 writes; each order lands with its issues
+    with BatchWriter(db, label="scheduling writes") as writer:
+        plan = schedule_work_orders(db, writer, work_orders, datetime.utcnow())
+
+    if plan.status_updates:
+        log.info("🎉 Scheduled %d work order(s) covering %d issue(s).", len(plan.assignments), len(plan.status_updates))
+        failed = writer.failed_paths
+        from tile_aggregator import record_tile_updates
+        record_tile_updates(ISSUES_COLLECTION, statuses={
+            issue_id: status for issue_id, status in plan.status_updates.items()
+            if f"{ISSUES_COLLECTION}/{issue_id}" not in failed})
+
+        # --- Routing stage: re-sequence every crew-day that gained orders ---
+        from route_optimizer import reoptimize_routes
+        reoptimize_routes(db, keys=plan.routed_days, crews=plan.crews)
 
 if __name__ == "__main__":
-    schedule_proposed_work_orders()
\ No newline at end of file
+    run_agent("scheduling_agent", schedule_proposed_work_orders)
\ No newline at end of file
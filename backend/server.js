@@ -10,6 +10,13 @@ const cors = require('cors');
 
 // --- Configuration ---
 const port = 3001;
+// Optional warm Python validator (python validation_server.py), e.g. http://127.0.0.1:3002
+const imageValidatorUrl = process.env.IMAGE_VALIDATOR_URL;
+// Optional map tile server (python tile_aggregator.py --serve), e.g. http://127.0.0.1:3003
+const tileServerUrl = process.env.TILE_SERVER_URL;
+// Per-document output (full JSON dumps, parsed locations) only with LOG_LEVEL=debug; the
+// JSON.stringify calls behind it are skipped entirely otherwise
+const debugLogging = (process.env.LOG_LEVEL || 'info').toLowerCase() === 'debug';
 
 // --- Directory Setup ---
 const uploadsDir = path.join(__dirname, 'uploads');
@@ -45,6 +52,47 @@ const storage = multer.diskStorage({
 });
 const upload = multer({ storage: storage });
 
+// --- Image Validation ---
+// Validates an upload through the long-running validation_server.py instead of
+// spawning a Python process per request. Returns null if the service is not configured
+// or unreachable so that submissions are never blocked on validation. The document does
+// not exist yet, so this is a preliminary check: no near-duplicate search and nothing
+// written back. The result is stored as upload_validation and the batch validator
+// (image_validator.py) still fills in image_validation, image_metadata and the phash.
+async function validateUpload(filePath) {
+    if (!imageValidatorUrl) {
+        return null;
+    }
+    try {
+        const response = await fetch(`${imageValidatorUrl}/validate`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ submission_id: 'dummy', image_path: filePath })
+        });
+        if (!response.ok) {
+            throw new Error(`Validator responded with ${response.status}`);
+        }
+        return await response.json();
+    } catch (error) {
+        console.error('[VALIDATION] Image validation skipped:', error.message);
+        return null;
+    }
+}
+
+// --- Map Tiles ---
+// Pushes a new submission into the tile aggregates. Fire-and-forget: the map
+// catches up on the next --rebuild if the tile server is down.
+function recordTileUpdate(collection, id, data) {
+    if (!tileServerUrl) {
+        return;
+    }
+    fetch(`${tileServerUrl}/issues`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ collection, id, data })
+    }).catch(error => console.error('[TILES] Tile update skipped:', error.message));
+}
+
 // --- API Routes ---
 app.get('/', (req, res) => {
     res.status(200).send('<h1>✅ Backend Server is Running!</h1>');
@@ -60,7 +108,7 @@ app.get('/api/test-db', async (req, res) => {
         if (testSnapshot.size > 0) {
             const testDoc = testSnapshot.docs[0];
             const testData = testDoc.data();
-            console.log('📋 Sample document data:', JSON.stringify(testData, null, 2));
+            if (debugLogging) console.log('📋 Sample document data:', JSON.stringify(testData, null, 2));
         }
         
         res.status(200).json({
@@ -89,7 +137,7 @@ app.get('/api/problems', async (req, res) => {
         
         rawSubmissionsSnapshot.forEach(doc => {
             const data = doc.data();
-            console.log(`📋 Raw submission ${doc.id}:`, JSON.stringify(data, null, 2));
+            if (debugLogging) console.log(`📋 Raw submission ${doc.id}:`, JSON.stringify(data, null, 2));
             
             // Check different possible location formats
             let location = null;
@@ -99,7 +147,7 @@ app.get('/api/problems', async (req, res) => {
                 const coords = data.location.split(',').map(coord => parseFloat(coord.trim()));
                 if (coords.length === 2 && !isNaN(coords[0]) && !isNaN(coords[1])) {
                     location = { lat: coords[0], lng: coords[1] };
-                    console.log(`✅ Parsed location string: ${data.location} -> lat: ${coords[0]}, lng: ${coords[1]}`);
+                    if (debugLogging) console.log(`✅ Parsed location string: ${data.location} -> lat: ${coords[0]}, lng: ${coords[1]}`);
                 }
             } else if (data.location && data.location.lat && data.location.lng) {
                 location = { lat: data.location.lat, lng: data.location.lng };
@@ -123,7 +171,7 @@ app.get('/api/problems', async (req, res) => {
                     source: 'raw_submissions'
                 });
             } else {
-                console.log(`⚠️ No valid location found for submission ${doc.id}`);
+                if (debugLogging) console.log(`⚠️ No valid location found for submission ${doc.id}`);
             }
         });
         
@@ -133,7 +181,7 @@ app.get('/api/problems', async (req, res) => {
         
         issuesSnapshot.forEach(doc => {
             const data = doc.data();
-            console.log(`📋 Issue ${doc.id}:`, JSON.stringify(data, null, 2));
+            if (debugLogging) console.log(`📋 Issue ${doc.id}:`, JSON.stringify(data, null, 2));
             
             // Check different possible location formats
             let location = null;
@@ -143,7 +191,7 @@ app.get('/api/problems', async (req, res) => {
                 const coords = data.location.split(',').map(coord => parseFloat(coord.trim()));
                 if (coords.length === 2 && !isNaN(coords[0]) && !isNaN(coords[1])) {
                     location = { lat: coords[0], lng: coords[1] };
-                    console.log(`✅ Parsed location string: ${data.location} -> lat: ${coords[0]}, lng: ${coords[1]}`);
+                    if (debugLogging) console.log(`✅ Parsed location string: ${data.location} -> lat: ${coords[0]}, lng: ${coords[1]}`);
                 }
             } else if (data.location && data.location.latitude && data.location.longitude) {
                 location = { lat: data.location.latitude, lng: data.location.longitude };
@@ -168,7 +216,7 @@ app.get('/api/problems', async (req, res) => {
                     source: 'issues'
                 });
             } else {
-                console.log(`⚠️ No valid location found for issue ${doc.id}`);
+                if (debugLogging) console.log(`⚠️ No valid location found for issue ${doc.id}`);
             }
         });
         
@@ -193,6 +241,21 @@ app.get('/api/problems', async (req, res) => {
     }
 });
 
+// Aggregated problems for the map: /api/problems/tiles?bbox=west,south,east,north&zoom=z
+app.get('/api/problems/tiles', async (req, res) => {
+    if (!tileServerUrl) {
+        return res.status(503).json({ error: 'Tile server not configured (set TILE_SERVER_URL)' });
+    }
+    try {
+        const query = new URLSearchParams({ bbox: req.query.bbox || '', zoom: req.query.zoom || '' });
+        const response = await fetch(`${tileServerUrl}/tiles?${query}`);
+        res.status(response.status).json(await response.json());
+    } catch (error) {
+        console.error('❌ Error fetching map tiles:', error);
+        res.status(502).json({ error: 'Failed to fetch map tiles', details: error.message });
+    }
+});
+
 app.post('/api/submit-report', upload.single('photo'), async (req, res) => {
     console.log('\n--- NEW SUBMISSION REQUEST RECEIVED ---');
     try {
@@ -207,6 +270,7 @@ app.post('/api/submit-report', upload.single('photo'), async (req, res) => {
             console.log(`[1] Photo received: ${req.file.filename}`);
             const filePath = req.file.path;
             imagePath = filePath;
+            imageValidation = await validateUpload(filePath);
 
             try {
                 // Upload to Firebase Storage directly without validation
@@ -239,15 +303,23 @@ app.post('/api/submit-report', upload.single('photo'), async (req, res) => {
             status: "submitted",
             created_at: admin.firestore.FieldValue.serverTimestamp(),
         };
+        if (imagePath) {
+            // Explicitly null so the batch validator's `image_validation == null` query picks it up
+            submissionData.image_validation = null;
+        }
+        if (imageValidation) {
+            submissionData.upload_validation = imageValidation;
+        }
         
-        console.log('[4] Prepared data for Firestore:', JSON.stringify(submissionData, null, 2));
+        if (debugLogging) console.log('[4] Prepared data for Firestore:', JSON.stringify(submissionData, null, 2));
         console.log('[5] Attempting to write to Firestore collection: raw_submissions...');
         
         const submissionRef = await db.collection('raw_submissions').add(submissionData);
         
         console.log(`[6] ✅ Firestore write successful! Document ID: ${submissionRef.id}`);
+        recordTileUpdate('raw_submissions', submissionRef.id, { category: submissionData.category, location: submissionData.location, status: submissionData.status });
 
-        res.status(200).send({ message: 'Submission successful!', id: submissionRef.id });
+        res.status(200).send({ message: 'Submission successful!', id: submissionRef.id, imageValidation });
 
     } catch (error) {
         console.error('❌ FULL ERROR during submission process:', error.message);
@@ -0,0 +1,103 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+# --- CONFIGURATION ---
+# Cold-start import budget per entry point, in milliseconds. Override all of
+# them at once with STARTUP_BUDGET_MS.
+ENTRY_POINT_BUDGETS_MS = {
+    "perception_agent": 150,
+    "image_validator": 150,
+    "assignment_agent": 150,
+    "scheduling_agent": 150,
+    "geospatial_agent": 150,
+}
+DEFAULT_RUNS = 5
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# --- MEASUREMENT ---
+def parse_importtime(stderr):
+    """Parses `-X importtime` output into {module: (self_us, cumulative_us, depth)}."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+
+def measure_entry_point(module, runs=DEFAULT_RUNS):
+    """Imports `module` in fresh interpreters and returns the median timings."""
+    import_ms, wall_ms, heaviest = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=BACKEND_DIR, capture_output=True, text=True,
+        )
+        wall_ms.append((time.perf_counter() - start) * 1000)
+        if completed.returncode != 0:
+            error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "unknown error"
+            return {"module": module, "error": error}
+        modules = parse_importtime(completed.stderr)
+        import_ms.append(modules.get(module, (0, 0, 0))[1] / 1000)
+        heaviest = sorted(((name, cumulative / 1000) for name, (_, cumulative, depth) in modules.items() if depth == 1),
+                          key=lambda item: item[1], reverse=True)[:5]
+
+    import_ms.sort()
+    wall_ms.sort()
+    return {
+        "module": module,
+        "import_ms": round(import_ms[len(import_ms) // 2], 1),
+        "wall_ms": round(wall_ms[len(wall_ms) // 2], 1),
+        "heaviest_imports": [{"module": name, "cumulative_ms": round(ms, 1)} for name, ms in heaviest],
+    }
+
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import time of each agent entry point.")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_POINT_BUDGETS_MS))
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    override = os.getenv("STARTUP_BUDGET_MS")
+    results, over_budget = [], []
+    print(f"⏱️  Measuring cold-start import time ({args.runs} runs each)...")
+    for module in args.modules:
+        result = measure_entry_point(module, args.runs)
+        budget = float(override) if override else ENTRY_POINT_BUDGETS_MS.get(module, 150)
+        result["budget_ms"] = budget
+        results.append(result)
+
+        if "error" in result:
+            print(f"  ❌ {module}: import failed ({result['error']})")
+            over_budget.append(module)
+            continue
+        status = "✅" if result["import_ms"] <= budget else "❌"
+        print(f"  {status} {module}: import {result['import_ms']} ms, process {result['wall_ms']} ms (budget {budget:.0f} ms)")
+        for heavy in result["heaviest_imports"][:3]:
+            print(f"       - {heavy['module']}: {heavy['cumulative_ms']} ms")
+        if result["import_ms"] > budget:
+            over_budget.append(module)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"timestamp": time.time(), "python": sys.version.split()[0], "results": results}, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+    if over_budget:
+        print(f"\n❌ Over budget: {', '.join(over_budget)}")
+        sys.exit(1)
+    print("\n✅ All entry points within budget.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,475 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from geo_utils import parse_location
+from metrics import get_logger
+
+# --- CONFIGURATION ---
+TILE_STORE_PATH = os.getenv("TILE_STORE_PATH", "tile_store.sqlite3")
+TILE_MIN_ZOOM = int(os.getenv("TILE_MIN_ZOOM", "2"))
+TILE_MAX_ZOOM = int(os.getenv("TILE_MAX_ZOOM", "16"))
+TILE_SERVER_HOST = os.getenv("TILE_SERVER_HOST", "127.0.0.1")
+TILE_SERVER_PORT = int(os.getenv("TILE_SERVER_PORT", "3003"))
+MAX_LATITUDE = 85.05112878  # Web Mercator limit
+# Default status per collection, as shown by server.js /api/problems
+COLLECTION_STATUS = {"raw_submissions": "submitted", "issues": "new"}
+
+log = get_logger("tiles")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    item_id TEXT PRIMARY KEY,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    category TEXT NOT NULL,
+    status TEXT NOT NULL,
+    tile_x INTEGER NOT NULL,
+    tile_y INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_items_tile ON items (tile_x, tile_y);
+CREATE TABLE IF NOT EXISTS tiles (
+    zoom INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    item_count INTEGER NOT NULL,
+    sum_lat REAL NOT NULL,
+    sum_lng REAL NOT NULL,
+    rep_id TEXT,
+    rep_lat REAL,
+    rep_lng REAL,
+    PRIMARY KEY (zoom, x, y)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tile_counts (
+    zoom INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    item_count INTEGER NOT NULL,
+    PRIMARY KEY (zoom, x, y, dimension, value)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+# --- TILE MATH ---
+def tile_xy(lat, lng, zoom):
+    """Slippy-map (Web Mercator) tile coordinates; accepts scalars or NumPy arrays."""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)
+    lng = np.asarray(lng, dtype=np.float64)
+    n = 1 << zoom
+    x = np.floor((lng + 180.0) / 360.0 * n)
+    y = np.floor((1.0 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2.0 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+
+def quadkey(x, y, zoom):
+    """Bing-style quadkey string for a tile."""
+    digits = []
+    for level in range(zoom, 0, -1):
+        mask = 1 << (level - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return "".join(digits)
+
+
+def document_item(collection, doc_id, data):
+    """Returns (item_id, lat, lng, category, status) for a Firestore document, or None without a location."""
+    location = parse_location(data)
+    if location is None:
+        return None
+    if collection == "issues":
+        category = data.get("category") or data.get("subcategory") or "Uncategorized"
+    else:
+        category = data.get("category") or "Uncategorized"
+    status = data.get("status") or COLLECTION_STATUS.get(collection, "new")
+    return f"{collection}/{doc_id}", location[0], location[1], str(category), str(status)
+
+
+# --- TILE STORE ---
+class TileStore:
+    """
+    Per-zoom tile aggregates (issue counts per category and status, centroid
+    sums and a representative issue) kept in SQLite so a bounding-box query
+    reads only the tiles it covers. Every issue is also kept at the finest
+    zoom so tiles can be updated incrementally as issues are added, moved or
+    change status.
+    """
+
+    def __init__(self, path=TILE_STORE_PATH, min_zoom=TILE_MIN_ZOOM, max_zoom=TILE_MAX_ZOOM):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+        zooms = f"{min_zoom}:{max_zoom}"
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'zooms'").fetchone()
+        if row and row[0] != zooms:
+            log.warning("⚠️  Tile zoom range changed. Clearing the tile store; run --rebuild to repopulate it.")
+            self.conn.executescript("DELETE FROM items; DELETE FROM tiles; DELETE FROM tile_counts;")
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('zooms', ?)", (zooms,))
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def _zoom_tiles(self, tile_x, tile_y):
+        for zoom in range(self.min_zoom, self.max_zoom + 1):
+            shift = self.max_zoom - zoom
+            yield zoom, tile_x >> shift, tile_y >> shift
+
+    def _item_in_tile(self, zoom, x, y):
+        shift = self.max_zoom - zoom
+        return self.conn.execute(
+            "SELECT item_id, latitude, longitude FROM items WHERE tile_x BETWEEN ? AND ? AND tile_y BETWEEN ? AND ? "
+            "LIMIT 1", (x << shift, ((x + 1) << shift) - 1, y << shift, ((y + 1) << shift) - 1)).fetchone()
+
+    def _count(self, zoom, x, y, dimension, value, delta):
+        self.conn.execute(
+            "INSERT INTO tile_counts (zoom, x, y, dimension, value, item_count) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (zoom, x, y, dimension, value) DO UPDATE SET item_count = item_count + excluded.item_count",
+            (zoom, x, y, dimension, value, delta))
+        if delta < 0:
+            self.conn.execute(
+                "DELETE FROM tile_counts WHERE zoom = ? AND x = ? AND y = ? AND dimension = ? AND value = ? "
+                "AND item_count <= 0", (zoom, x, y, dimension, value))
+
+    def _add(self, item_id, lat, lng, category, status):
+        tile_x, tile_y = (int(v) for v in tile_xy(lat, lng, self.max_zoom))
+        self.conn.execute("INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          (item_id, lat, lng, category, status, tile_x, tile_y))
+        for zoom, x, y in self._zoom_tiles(tile_x, tile_y):
+            self.conn.execute(
+                "INSERT INTO tiles VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?) ON CONFLICT (zoom, x, y) DO UPDATE SET "
+                "item_count = item_count + 1, sum_lat = sum_lat + excluded.sum_lat, "
+                "sum_lng = sum_lng + excluded.sum_lng", (zoom, x, y, lat, lng, item_id, lat, lng))
+            self._count(zoom, x, y, "category", category, 1)
+            self._count(zoom, x, y, "status", status, 1)
+
+    def _remove(self, item_id, lat, lng, category, status, tile_x, tile_y):
+        self.conn.execute("DELETE FROM items WHERE item_id = ?", (item_id,))
+        for zoom, x, y in self._zoom_tiles(tile_x, tile_y):
+            self.conn.execute(
+                "UPDATE tiles SET item_count = item_count - 1, sum_lat = sum_lat - ?, sum_lng = sum_lng - ? "
+                "WHERE zoom = ? AND x = ? AND y = ?", (lat, lng, zoom, x, y))
+            self.conn.execute("DELETE FROM tiles WHERE zoom = ? AND x = ? AND y = ? AND item_count <= 0", (zoom, x, y))
+            rep = self.conn.execute("SELECT rep_id FROM tiles WHERE zoom = ? AND x = ? AND y = ?", (zoom, x, y)).fetchone()
+            if rep and rep[0] == item_id:
+                self.conn.execute("UPDATE tiles SET rep_id = ?, rep_lat = ?, rep_lng = ? WHERE zoom = ? AND x = ? AND y = ?",
+                                  (*self._item_in_tile(zoom, x, y), zoom, x, y))
+            self._count(zoom, x, y, "category", category, -1)
+            self._count(zoom, x, y, "status", status, -1)
+
+    def _existing(self, item_id):
+        return self.conn.execute(
+            "SELECT item_id, latitude, longitude, category, status, tile_x, tile_y FROM items WHERE item_id = ?",
+            (item_id,)).fetchone()
+
+    # --- Incremental updates ---
+    def upsert(self, item_id, lat, lng, category, status):
+        """Adds an issue, or moves it between tiles/categories if it changed."""
+        with self._lock:
+            existing = self._existing(item_id)
+            if existing and existing[1:5] == (lat, lng, category, status):
+                return
+            if existing and existing[1:4] == (lat, lng, category):
+                self._set_status(existing, status)
+            else:
+                if existing:
+                    self._remove(*existing)
+                self._add(item_id, lat, lng, category, status)
+            self.conn.commit()
+
+    def _set_status(self, existing, status):
+        item_id, _, _, _, old_status, tile_x, tile_y = existing
+        self.conn.execute("UPDATE items SET status = ? WHERE item_id = ?", (status, item_id))
+        for zoom, x, y in self._zoom_tiles(tile_x, tile_y):
+            self._count(zoom, x, y, "status", old_status, -1)
+            self._count(zoom, x, y, "status", status, 1)
+
+    def update_status(self, item_id, status):
+        """Moves one issue between status counts; returns False if the issue is not in the store."""
+        with self._lock:
+            existing = self._existing(item_id)
+            if existing is None:
+                return False
+            if existing[4] != status:
+                self._set_status(existing, status)
+                self.conn.commit()
+            return True
+
+    def remove(self, item_id):
+        with self._lock:
+            existing = self._existing(item_id)
+            if existing:
+                self._remove(*existing)
+                self.conn.commit()
+
+    def add_document(self, collection, doc_id, data):
+        """Upserts a Firestore document; returns False if it has no usable location."""
+        item = document_item(collection, doc_id, data)
+        if item is None:
+            return False
+        self.upsert(*item)
+        return True
+
+    # --- Full rebuild ---
+    def rebuild(self, items):
+        """Replaces the store with `items` [(item_id, lat, lng, category, status)], aggregating per zoom in NumPy."""
+        items = list({item[0]: item for item in items}.values())
+        with self._lock:
+            self.conn.executescript("DELETE FROM items; DELETE FROM tiles; DELETE FROM tile_counts;")
+            if not items:
+                self.conn.commit()
+                return 0
+            ids = np.array([item[0] for item in items], dtype=object)
+            lats = np.array([item[1] for item in items], dtype=np.float64)
+            lngs = np.array([item[2] for item in items], dtype=np.float64)
+            dimensions = {
+                "category": np.unique(np.array([item[3] for item in items], dtype=object).astype(str), return_inverse=True),
+                "status": np.unique(np.array([item[4] for item in items], dtype=object).astype(str), return_inverse=True),
+            }
+            tile_x, tile_y = tile_xy(lats, lngs, self.max_zoom)
+            self.conn.executemany("INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?)", (
+                (*item, int(x), int(y)) for item, x, y in zip(items, tile_x, tile_y)))
+
+            for zoom in range(self.min_zoom, self.max_zoom + 1):
+                shift = self.max_zoom - zoom
+                keys = ((tile_x >> shift) << zoom) | (tile_y >> shift)
+                tiles, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+                inverse = inverse.reshape(-1)
+                sum_lat = np.bincount(inverse, weights=lats)
+                sum_lng = np.bincount(inverse, weights=lngs)
+                self.conn.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                    (zoom, int(key >> zoom), int(key & ((1 << zoom) - 1)), int(count), float(slat), float(slng),
+                     ids[i], float(lats[i]), float(lngs[i]))
+                    for key, count, slat, slng, i in zip(tiles, counts, sum_lat, sum_lng, first)))
+
+                for dimension, (values, value_index) in dimensions.items():
+                    combined, combined_counts = np.unique(inverse * len(values) + value_index.reshape(-1),
+                                                          return_counts=True)
+                    self.conn.executemany("INSERT INTO tile_counts VALUES (?, ?, ?, ?, ?, ?)", (
+                        (zoom, int(tiles[c // len(values)] >> zoom), int(tiles[c // len(values)] & ((1 << zoom) - 1)),
+                         dimension, str(values[c % len(values)]), int(count))
+                        for c, count in zip(combined, combined_counts)))
+            self.conn.commit()
+        return len(items)
+
+    # --- Queries ---
+    def query(self, west, south, east, north, zoom):
+        """
+        Returns the tiles intersecting the bounding box at `zoom` (clamped to
+        the stored range). At the finest zoom the individual issues are
+        included too, so the map can switch from clusters to pins.
+        """
+        zoom = max(self.min_zoom, min(self.max_zoom, int(zoom)))
+        x0, y0 = (int(v) for v in tile_xy(north, west, zoom))
+        x1, y1 = (int(v) for v in tile_xy(south, east, zoom))
+        # A box crossing the antimeridian (west > east) wraps around to x = 0
+        x_ranges = [(x0, x1)] if west <= east else [(x0, (1 << zoom) - 1), (0, x1)]
+
+        with self._lock:
+            tiles = {}
+            for low, high in x_ranges:
+                for x, y, count, sum_lat, sum_lng, rep_id, rep_lat, rep_lng in self.conn.execute(
+                        "SELECT x, y, item_count, sum_lat, sum_lng, rep_id, rep_lat, rep_lng FROM tiles "
+                        "WHERE zoom = ? AND x BETWEEN ? AND ? AND y BETWEEN ? AND ?", (zoom, low, high, y0, y1)):
+                    tiles[(x, y)] = {
+                        "quadkey": quadkey(x, y, zoom), "zoom": zoom, "x": x, "y": y, "count": count,
+                        "centroid": {"lat": sum_lat / count, "lng": sum_lng / count},
+                        "representative": {"id": rep_id, "lat": rep_lat, "lng": rep_lng},
+                        "categories": {}, "statuses": {},
+                    }
+                for x, y, dimension, value, count in self.conn.execute(
+                        "SELECT x, y, dimension, value, item_count FROM tile_counts "
+                        "WHERE zoom = ? AND x BETWEEN ? AND ? AND y BETWEEN ? AND ?", (zoom, low, high, y0, y1)):
+                    if (x, y) in tiles:
+                        tiles[(x, y)]["categories" if dimension == "category" else "statuses"][value] = count
+
+            result = {"zoom": zoom, "tiles": list(tiles.values())}
+            if zoom == self.max_zoom:
+                result["points"] = [
+                    {"id": item_id, "lat": lat, "lng": lng, "category": category, "status": status}
+                    for low, high in x_ranges
+                    for item_id, lat, lng, category, status in self.conn.execute(
+                        "SELECT item_id, latitude, longitude, category, status FROM items "
+                        "WHERE tile_x BETWEEN ? AND ? AND tile_y BETWEEN ? AND ?", (low, high, y0, y1))
+                    if south <= lat <= north
+                ]
+        return result
+
+    def close(self):
+        self.conn.close()
+
+
+# --- AGENT HOOKS ---
+def record_tile_updates(collection, documents=None, statuses=None):
+    """
+    Applies newly written documents {doc_id: data} and status changes
+    {doc_id: status} to the local tile store. Does nothing until the store
+    has been built with --rebuild, and never fails the calling agent.
+    """
+    if not os.path.exists(TILE_STORE_PATH):
+        return
+    try:
+        store = TileStore()
+        try:
+            for doc_id, data in (documents or {}).items():
+                store.add_document(collection, doc_id, data)
+            for doc_id, status in (statuses or {}).items():
+                store.update_status(f"{collection}/{doc_id}", status)
+        finally:
+            store.close()
+    except Exception as e:
+        log.warning("⚠️  Warning: Could not update map tiles: %s", e)
+
+
+def rebuild_from_firestore(store):
+    """Re-aggregates every raw submission and issue from Firestore."""
+    from geospatial_agent import initialize_clients
+
+    _, db = initialize_clients(use_bigquery=False)
+    items, skipped = [], 0
+    start = time.perf_counter()
+    for collection in COLLECTION_STATUS:
+        for doc in db.collection(collection).stream():
+            item = document_item(collection, doc.id, doc.to_dict())
+            if item is None:
+                skipped += 1
+            else:
+                items.append(item)
+    count = store.rebuild(items)
+    log.info("🗺️  Aggregated %d issue(s) into zoom %d-%d tiles in %.2fs (%d without a location).",
+             count, store.min_zoom, store.max_zoom, time.perf_counter() - start, skipped)
+
+
+# --- HTTP MODE ---
+def make_handler(store):
+    class TileHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/health":
+                self._send_json(200, {"status": "ok", "issues": len(store)})
+                return
+            if url.path != "/tiles":
+                self._send_json(404, {"error": "Not found"})
+                return
+            params = parse_qs(url.query)
+            try:
+                west, south, east, north = (float(v) for v in params["bbox"][0].split(","))
+                zoom = int(params.get("zoom", [store.min_zoom])[0])
+            except (KeyError, ValueError):
+                self._send_json(400, {"error": "Expected ?bbox=west,south,east,north&zoom=z"})
+                return
+            self._send_json(200, store.query(west, south, east, north, zoom))
+
+        def do_POST(self):
+            if self.path != "/issues":
+                self._send_json(404, {"error": "Not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                added = store.add_document(payload.get("collection", "raw_submissions"), payload["id"],
+                                           payload.get("data") or {})
+                self._send_json(200, {"added": added})
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            pass  # Tile queries are far cheaper than an access log line
+
+    return TileHandler
+
+
+def serve_http(store, host=TILE_SERVER_HOST, port=TILE_SERVER_PORT):
+    server = ThreadingHTTPServer((host, port), make_handler(store))
+    print(f"🚀 Map tile server listening at http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Tile server stopped.")
+    finally:
+        server.server_close()
+
+
+# --- BENCHMARK ---
+def run_benchmark(count, queries=200):
+    from hotspot_engine import synthetic_points
+
+    path = f"/tmp/tile_benchmark_{os.getpid()}.sqlite3"
+    store = TileStore(path)
+    points = synthetic_points(count)
+    statuses = np.array(["submitted", "new", "pending_assignment", "scheduled"], dtype=object)
+    items = [(f"issues/{i}", float(lat), float(lng), subcategory, statuses[i % len(statuses)])
+             for i, (lat, lng, subcategory) in enumerate(zip(points["latitude"], points["longitude"], points["subcategory"]))]
+
+    start = time.perf_counter()
+    store.rebuild(items)
+    print(f"📊 Rebuilt tiles for {count:,} issues in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    for i in range(100):
+        store.upsert(f"issues/new-{i}", 24.58 + i * 1e-4, 73.71, "pothole", "new")
+    print(f"📊 Incremental upsert: {(time.perf_counter() - start) * 10:.2f} ms/issue")
+
+    rng = np.random.default_rng(0)
+    timings = []
+    for _ in range(queries):
+        zoom = int(rng.integers(store.min_zoom, store.max_zoom + 1))
+        half = 180.0 / (1 << zoom) * 2  # Roughly a 4x4-tile viewport
+        lat, lng = 24.5854 + rng.uniform(-0.2, 0.2), 73.7125 + rng.uniform(-0.2, 0.2)
+        start = time.perf_counter()
+        store.query(lng - half, lat - half / 2, lng + half, lat + half / 2, zoom)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f"📊 Bounding-box queries: p50 {timings[len(timings) // 2]:.2f} ms, "
+          f"p99 {timings[int(len(timings) * 0.99) - 1]:.2f} ms")
+    store.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-zoom map tile aggregates for the issue map.")
+    parser.add_argument("--rebuild", action="store_true", help="Re-aggregate all submissions and issues from Firestore")
+    parser.add_argument("--serve", action="store_true", help="Serve bounding-box tile queries over HTTP")
+    parser.add_argument("--host", default=TILE_SERVER_HOST)
+    parser.add_argument("--port", type=int, default=TILE_SERVER_PORT)
+    parser.add_argument("--benchmark", type=int, metavar="N", help="Benchmark on N synthetic issues instead")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(args.benchmark)
+        sys.exit(0)
+    if not (args.rebuild or args.serve):
+        parser.print_help()
+        sys.exit(1)
+
+    tile_store = TileStore()
+    if args.rebuild:
+        rebuild_from_firestore(tile_store)
+    if args.serve:
+        serve_http(tile_store, args.host, args.port)
+    tile_store.close()
@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import base64
+import sqlite3
+import hashlib
+import argparse
+import threading
+from numbers import Rational
+from datetime import datetime
+from collections import namedtuple
+
+from metrics import count, get_logger
+
+# --- CONFIGURATION ---
+VALIDATION_CACHE_PATH = os.getenv(  # "" disables the cache
+    "VALIDATION_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "validation_cache.sqlite3"))
+VALIDATION_CACHE_MAX_MB = float(os.getenv("VALIDATION_CACHE_MAX_MB", "64"))
+EVICT_EVERY_WRITES = 200  # Size eviction runs every this many writes, and on close
+HASH_CHUNK_BYTES = 1 << 20
+SCHEMA_VERSION = 2  # 2: content stored as JSON; older files held pickles and are cleared
+
+log = get_logger("validation_cache")
+
+CacheEntry = namedtuple("CacheEntry", ["content", "image_path", "submission_id"])
+
+
+def file_digest(image_path):
+    """Streaming SHA-256 of the file's bytes; the cache key."""
+    digest = hashlib.sha256()
+    with open(image_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def known_submission(submission_id):
+    return submission_id if submission_id and submission_id != "dummy" else None
+
+
+# --- ENCODING ---
+# Image content is stored as JSON, never pickled. EXIF values that JSON has no
+# type for are tagged so they come back as they went in; rationals become floats.
+def encode_content(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(bytes(value)).decode("ascii")}
+    if isinstance(value, tuple):
+        return {"__tuple__": [encode_content(item) for item in value]}
+    if isinstance(value, list):
+        return [encode_content(item) for item in value]
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {key: encode_content(item) for key, item in value.items()}
+        return {"__items__": [[encode_content(key), encode_content(item)] for key, item in value.items()]}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, Rational) or hasattr(value, "numerator"):  # EXIF IFDRational
+        return float(value) if value.denominator else None
+    return str(value)
+
+
+def decode_content(value):
+    if isinstance(value, list):
+        return [decode_content(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        (tag, payload), = value.items()
+        if tag == "__datetime__":
+            return datetime.fromisoformat(payload)
+        if tag == "__bytes__":
+            return base64.b64decode(payload)
+        if tag == "__tuple__":
+            return tuple(decode_content(item) for item in payload)
+        if tag == "__items__":
+            return {decode_content(key): decode_content(item) for key, item in payload}
+    return {key: decode_content(item) for key, item in value.items()}
+
+
+# --- CACHE ---
+class ValidationCache:
+    """
+    SQLite-backed cache of what image_validator reads out of an image file:
+    format, dimensions, EXIF and phash, keyed on the SHA-256 of the bytes.
+
+    Each entry also remembers the first upload it came from, so identical
+    bytes arriving under another file or submission are reported as exact
+    duplicates. Per-file fields (name, size, mtime) and the rules themselves
+    are not cached: the age checks depend on when they run. The least
+    recently used entries are evicted once the stored content grows past
+    `max_mb`. Safe to share between threads; other processes may use the
+    same file.
+    """
+
+    def __init__(self, path=VALIDATION_CACHE_PATH, max_mb=VALIDATION_CACHE_MAX_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb > 0 else None
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")  # The upload server and batch validator can share the file
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._conn.execute("DROP TABLE IF EXISTS image_content")
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS image_content (
+                digest TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                image_path TEXT NOT NULL,
+                submission_id TEXT,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_content_last_access ON image_content(last_access)")
+        self._conn.commit()
+
+    def get(self, digest):
+        """Returns the CacheEntry for `digest`, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, image_path, submission_id FROM image_content WHERE digest = ?", (digest,)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                count("validation_cache_misses")
+                return None
+            self._conn.execute("UPDATE image_content SET last_access = ? WHERE digest = ?", (time.time(), digest))
+            self._conn.commit()
+            self.stats["hits"] += 1
+        count("validation_cache_hits")
+        content, image_path, submission_id = row
+        return CacheEntry(decode_content(json.loads(content)), image_path, submission_id)
+
+    def put(self, digest, content, image_path, submission_id=None):
+        """
+        Stores the content read from `image_path` and returns the entry now
+        cached. When another upload of the same bytes got there first (a
+        concurrent retry), that entry is kept and returned instead.
+        """
+        blob = json.dumps(encode_content(content), separators=(",", ":"))
+        entry = CacheEntry(content, os.path.abspath(image_path), known_submission(submission_id))
+        now = time.time()
+        with self._lock:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO image_content VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (digest, blob, len(blob), entry.image_path, entry.submission_id, now, now),
+            ).rowcount
+            if not inserted:
+                entry = entry._replace(**dict(zip(("image_path", "submission_id"), self._conn.execute(
+                    "SELECT image_path, submission_id FROM image_content WHERE digest = ?", (digest,)).fetchone())))
+            self._conn.commit()
+            self.stats["writes"] += inserted
+            self._writes_since_evict += inserted
+            if self._writes_since_evict >= EVICT_EVERY_WRITES:
+                self._evict()
+        return entry
+
+    def duplicate_of(self, digest, entry, image_path, submission_id):
+        """
+        Who already uploaded these bytes, or None when `entry` is this very
+        upload (the same submission, or the same file validated at upload time
+        and again later, in which case the submission id is recorded now).
+        """
+        submission_id = known_submission(submission_id)
+        if entry.submission_id and submission_id:
+            return entry.submission_id if entry.submission_id != submission_id else None
+        if entry.image_path != os.path.abspath(image_path):
+            return entry.submission_id or os.path.basename(entry.image_path)
+        if submission_id and not entry.submission_id:
+            with self._lock:
+                self._conn.execute("UPDATE image_content SET submission_id = ? WHERE digest = ?",
+                                   (submission_id, digest))
+                self._conn.commit()
+        return None
+
+    def _evict(self):
+        """Deletes the least recently used entries beyond max_bytes. Caller holds the lock."""
+        self._writes_since_evict = 0
+        if self.max_bytes is None:
+            return
+        cursor = self._conn.execute("""
+            DELETE FROM image_content WHERE digest IN (
+                SELECT digest FROM (
+                    SELECT digest, SUM(size) OVER (ORDER BY last_access DESC, digest) AS running
+                    FROM image_content
+                ) WHERE running > ?
+            )
+        """, (self.max_bytes,))
+        self._conn.commit()
+        self.stats["evicted"] += cursor.rowcount
+
+    def flush(self):
+        """Applies size eviction and commits."""
+        with self._lock:
+            self._evict()
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_validation_cache():
+    """Process-wide ValidationCache at VALIDATION_CACHE_PATH, or None when it is disabled or unusable."""
+    global _cache
+    if not VALIDATION_CACHE_PATH:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = ValidationCache()
+            except sqlite3.Error as e:
+                log.warning("⚠️ Validation cache unavailable, validating without it: %s", e)
+                return None
+        return _cache
+
+
+# --- BENCHMARK ---
+def validate_through(cache, image_path):
+    import image_validator
+    metadata, duplicate_of = image_validator.load_image_metadata(image_path, "dummy", cache)
+    result = image_validator.validate_image_metadata(metadata)
+    if duplicate_of:
+        image_validator.flag_exact_duplicate(result, duplicate_of)
+    return result
+
+
+def run_benchmark(image_dir, rounds):
+    """Validates every image in `image_dir` once cold, then `rounds` times against a warm cache."""
+    import tempfile
+    import image_validator
+
+    paths = [os.path.join(image_dir, name) for name in sorted(os.listdir(image_dir))]
+    paths = [path for path in paths if os.path.isfile(path)]
+    if not paths:
+        print(f"⚠️ No images found in {image_dir}.")
+        return
+    with tempfile.TemporaryDirectory() as workdir:
+        cache = ValidationCache(os.path.join(workdir, "validation_cache.sqlite3"))
+
+        start = time.perf_counter()
+        for path in paths:
+            image_validator.validate_image_metadata(image_validator.extract_image_metadata(path))
+        uncached = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for path in paths:
+            validate_through(cache, path)
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        duplicates = 0
+        for _ in range(rounds):
+            for path in paths:
+                result = validate_through(cache, path)
+                duplicates += any(e.startswith("Duplicate image found") for e in result["errors"])
+        warm = (time.perf_counter() - start) / rounds
+        cache.close()
+
+    distinct = cache.stats["writes"]
+    print(f"📊 {len(paths)} images ({distinct} distinct contents):")
+    print(f"   No cache:   {uncached:.3f}s ({uncached / len(paths) * 1000:.2f} ms/image)")
+    print(f"   Cold cache: {cold:.3f}s ({cold / len(paths) * 1000:.2f} ms/image)")
+    print(f"   Warm cache: {warm:.3f}s ({warm / len(paths) * 1000:.2f} ms/image, "
+          f"{uncached / max(warm, 1e-9):.1f}x faster)")
+    print(f"   {len(paths) - distinct} repeat upload(s) in the directory; warm rounds flagged "
+          f"{duplicates // rounds} duplicate(s) per round")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Content-addressed cache of image validation inputs.")
+    parser.add_argument("--benchmark", nargs="?", const="uploads", metavar="IMAGE_DIR",
+                        help="Time validation of a directory of images without, cold and warm cache")
+    parser.add_argument("--rounds", type=int, default=3, help="Warm-cache passes for --benchmark")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(args.benchmark, args.rounds)
+    else:
+        parser.print_help()
@@ -0,0 +1,350 @@
+import time
+import random
+import argparse
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from metrics import get_logger
+
+# --- CONFIGURATION ---
+MAX_AGE_HOURS = 12  # Maximum age of image in hours
+AGING_HOURS = 6  # Older than this earns a warning
+RECENT_HOURS = 0.1  # Younger than this (6 minutes) is suspicious
+SIMULTANEOUS_SECONDS = 30  # Created and modified closer together than this is suspicious
+MIN_IMAGE_SIZE = 100 * 1024  # 100KB minimum
+MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB maximum
+ACCEPTED_FORMATS = ["JPEG", "JPG", "PNG", "WEBP"]
+EDITOR_SOFTWARE = ["photoshop", "gimp", "paint", "canva", "pixlr"]
+SCREENSHOT_SOFTWARE = ["screenshot", "snip", "printscreen"]
+SUSPICIOUS_FILENAMES = ["download", "screenshot", "snip", "capture", "print", "copy", "save", "img_", "photo_"]
+SCREENSHOT_RESOLUTIONS = [(1920, 1080), (1366, 768)]
+# As written by image_validator.apply_duplicate_check; kept when results are re-validated
+DUPLICATE_ERROR_PREFIX = "Duplicate image found"
+RAW_SUBMISSIONS_COLLECTION = "raw_submissions"
+
+log = get_logger("validation_rules")
+
+
+# --- RULE TABLE ---
+# `predicate` takes the column dict from metadata_columns() and returns one
+# boolean per record; comparisons against a missing (NaN) time are False, so
+# time rules skip records without one. `message` is formatted with the
+# record's values; `weight` is taken off the 100-point authenticity score.
+Rule = namedtuple("Rule", ["rule_id", "severity", "predicate", "message", "weight"])
+
+
+def contains_any(column, words):
+    """Element-wise: does the string contain any of `words`?"""
+    if not len(column):
+        return np.zeros(0, dtype=bool)
+    return np.logical_or.reduce([np.char.find(column, word) >= 0 for word in words])
+
+
+RULES = [
+    Rule("file_too_small", "error", lambda c: c["file_size"] < MIN_IMAGE_SIZE,
+         "Image too small: {file_size} bytes", 40),
+    Rule("file_too_large", "error", lambda c: c["file_size"] > MAX_IMAGE_SIZE,
+         "Image too large: {file_size} bytes", 40),
+    Rule("unusual_format", "warning", lambda c: ~np.isin(c["format"], ACCEPTED_FORMATS),
+         "Unusual format: {format}", 5),
+    Rule("small_dimensions", "warning", lambda c: (c["width"] < 200) | (c["height"] < 200),
+         "Small image dimensions: {width}x{height}", 10),
+    Rule("low_resolution", "warning", lambda c: (c["width"] < 800) | (c["height"] < 600),
+         "Low resolution image (may be poor quality)", 5),
+    Rule("screenshot_resolution", "warning",
+         lambda c: np.logical_or.reduce([(c["width"] == w) & (c["height"] == h) for w, h in SCREENSHOT_RESOLUTIONS]),
+         "Common screenshot resolution detected ({width}x{height})", 10),
+    Rule("very_small_file", "warning", lambda c: c["file_size"] < 50000,
+         "Very small file size (may be compressed/edited)", 5),
+    Rule("heavy_compression", "warning",
+         lambda c: (c["file_size"] > 0) & (c["width"] * c["height"] * 3 > 50 * c["file_size"]),
+         "Image appears heavily compressed", 5),
+    # --- Timestamps ---
+    Rule("too_old", "error", lambda c: c["age_hours"] > MAX_AGE_HOURS,
+         f"Image too old: {{age_hours:.1f}} hours old (max {MAX_AGE_HOURS} hours)", 50),
+    Rule("aging", "warning", lambda c: (c["age_hours"] > AGING_HOURS) & (c["age_hours"] <= MAX_AGE_HOURS),
+         "Image is {age_hours:.1f} hours old", 5),
+    Rule("future_timestamp", "error", lambda c: c["age_hours"] < 0,
+         "Image has future timestamp (impossible)", 60),
+    Rule("created_very_recently", "warning", lambda c: c["age_hours"] < RECENT_HOURS,
+         "Image created very recently (may be suspicious)", 5),
+    Rule("modified_long_ago", "warning", lambda c: c["mod_age_hours"] > MAX_AGE_HOURS,
+         "File modified {mod_age_hours:.1f} hours ago", 5),
+    Rule("modified_very_recently", "warning", lambda c: c["mod_age_hours"] < RECENT_HOURS,
+         "File modified very recently (suspicious)", 5),
+    Rule("created_modified_together", "warning",
+         lambda c: np.abs(c["mod_age_hours"] - c["age_hours"]) * 3600 < SIMULTANEOUS_SECONDS,
+         "File created and modified almost simultaneously (suspicious)", 5),
+    # --- EXIF and file name ---
+    Rule("no_gps", "warning", lambda c: ~c["has_gps"], "No GPS data found (may be edited)", 10),
+    Rule("no_camera_info", "warning", lambda c: ~c["has_camera"], "No camera information found", 10),
+    Rule("little_exif", "warning", lambda c: c["exif_count"] < 5, "Very little EXIF data (may be downloaded)", 10),
+    Rule("editing_software", "error", lambda c: contains_any(c["software"], EDITOR_SOFTWARE),
+         "Image appears to be edited with image software", 60),
+    Rule("screenshot_software", "error", lambda c: contains_any(c["software"], SCREENSHOT_SOFTWARE),
+         "Image appears to be a screenshot", 60),
+    Rule("suspicious_filename", "warning", lambda c: contains_any(c["file_name"], SUSPICIOUS_FILENAMES),
+         "Suspicious filename (may be downloaded or captured)", 10),
+]
+
+
+# --- COLUMNS ---
+def to_epoch(value):
+    """Epoch seconds from a datetime (naive means local time, as datetime.now()), ISO string or number."""
+    if value is None:
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.rstrip("Z"))
+        except ValueError:
+            return np.nan
+    try:
+        return value.timestamp()
+    except (AttributeError, OverflowError, OSError, ValueError):
+        return np.nan
+
+
+def metadata_columns(records, reference_times=None):
+    """
+    Flattens metadata dicts (as extract_image_metadata returns or Firestore
+    stores them) into one NumPy column per feature. Ages are measured from
+    `reference_times` (epoch seconds per record), defaulting to now.
+    """
+    n = len(records)
+    now = time.time()
+    reference = np.full(n, now) if reference_times is None else np.asarray(reference_times, dtype=np.float64)
+    file_size = np.zeros(n)
+    width = np.zeros(n)
+    height = np.zeros(n)
+    created = np.full(n, np.nan)
+    modified = np.full(n, np.nan)
+    exif_count = np.zeros(n)
+    has_gps = np.zeros(n, dtype=bool)
+    has_camera = np.zeros(n, dtype=bool)
+    formats, software, file_names = [], [], []
+    for i, metadata in enumerate(records):
+        file_size[i] = metadata.get("file_size") or 0
+        size = metadata.get("size") or (0, 0)
+        width[i], height[i] = size[0], size[1]
+        created[i] = to_epoch(metadata.get("creation_time"))
+        modified[i] = to_epoch(metadata.get("modification_time"))
+        exif = metadata.get("exif_data") or {}
+        keys = [str(key) for key in exif]
+        exif_count[i] = len(keys)
+        has_gps[i] = any("GPS" in key for key in keys)
+        has_camera[i] = any("Make" in key or "Model" in key for key in keys)
+        formats.append(str(metadata.get("format") or ""))
+        software.append(str(exif.get("Software", "")).lower())
+        file_names.append(str(metadata.get("file_name") or "").lower())
+    return {
+        "file_size": file_size,
+        "width": width,
+        "height": height,
+        "age_hours": (reference - created) / 3600,
+        "mod_age_hours": (reference - modified) / 3600,
+        "exif_count": exif_count,
+        "has_gps": has_gps,
+        "has_camera": has_camera,
+        "format": np.array(formats, dtype=str),
+        "software": np.array(software, dtype=str),
+        "file_name": np.array(file_names, dtype=str),
+    }
+
+
+# --- ENGINE ---
+class RuleSet:
+    """
+    The rule table compiled into arrays: evaluate() runs every predicate once
+    over a whole batch of records and returns an (n_records, n_rules) hit
+    matrix, from which verdicts, messages, scores and per-rule counts follow.
+    """
+
+    def __init__(self, rules=RULES):
+        self.rules = list(rules)
+        ids = [rule.rule_id for rule in self.rules]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Rule ids must be unique")
+        self.ids = np.array(ids)
+        self.is_error = np.array([rule.severity == "error" for rule in self.rules])
+        self.weights = np.array([rule.weight for rule in self.rules], dtype=np.float64)
+
+    def evaluate(self, columns):
+        n = len(columns["file_size"])
+        hits = np.zeros((n, len(self.rules)), dtype=bool)
+        with np.errstate(invalid="ignore"):
+            for j, rule in enumerate(self.rules):
+                hits[:, j] = rule.predicate(columns)
+        return hits
+
+    def scores(self, hits):
+        """Authenticity score per record: 100 minus the weights of the rules it hit, floored at 0."""
+        return np.clip(100.0 - hits.astype(np.float64) @ self.weights, 0.0, 100.0)
+
+    def hit_counts(self, hits):
+        return dict(zip(self.ids.tolist(), hits.sum(axis=0).tolist()))
+
+    def validate_many(self, records, reference_times=None):
+        """Returns (one validation result per record, {rule_id: hit count})."""
+        from metrics import count, timer
+
+        with timer("validation_rules", records="batch" if len(records) > 1 else "single"):
+            columns = metadata_columns(records, reference_times)
+            hits = self.evaluate(columns)
+            scores = self.scores(hits)
+            valid = ~(hits & self.is_error).any(axis=1)
+        counts = self.hit_counts(hits)
+        for rule_id, hit_count in counts.items():
+            if hit_count:
+                count("validation_rule_hits", hit_count, rule=rule_id)
+
+        results = []
+        for i, metadata in enumerate(records):
+            values = {
+                "file_size": int(columns["file_size"][i]), "format": columns["format"][i],
+                "width": int(columns["width"][i]), "height": int(columns["height"][i]),
+                "age_hours": columns["age_hours"][i], "mod_age_hours": columns["mod_age_hours"][i],
+            }
+            errors, warnings, failed = [], [], []
+            for j in np.flatnonzero(hits[i]):
+                rule = self.rules[j]
+                (errors if rule.severity == "error" else warnings).append(rule.message.format(**values))
+                failed.append(rule.rule_id)
+            results.append({
+                "is_valid": bool(valid[i]),
+                "warnings": warnings,
+                "errors": errors,
+                "metadata": metadata,
+                "authenticity_score": round(float(scores[i]), 1),
+                "failed_rules": failed,
+            })
+        return results, counts
+
+    def validate(self, metadata, reference_time=None):
+        """Validates one metadata record; see validate_many."""
+        results, _ = self.validate_many([metadata], None if reference_time is None else [reference_time])
+        return results[0]
+
+
+_rule_set = None
+
+
+def get_rule_set():
+    """The compiled default rule set, built on first use."""
+    global _rule_set
+    if _rule_set is None:
+        _rule_set = RuleSet()
+    return _rule_set
+
+
+# --- RE-VALIDATION ---
+def revalidate_submissions(db, dry_run=False):
+    """
+    Re-runs the current rules over every submission with stored image
+    metadata, measuring ages from when each was submitted, and rewrites
+    `image_validation` where the outcome changed. Duplicate-image errors are
+    carried over, since they do not come from the rules.
+    """
+    from firestore_backend import FieldFilter, SERVER_TIMESTAMP
+    from batch_writer import BatchWriter, iter_pages
+
+    start = time.perf_counter()
+    rule_set = get_rule_set()
+    query = db.collection(RAW_SUBMISSIONS_COLLECTION).where(filter=FieldFilter("image_metadata", "!=", None))
+    totals = dict.fromkeys(rule_set.ids.tolist(), 0)
+    scanned = changed = flipped = 0
+    with BatchWriter(db, label="re-validation writes") as writer:
+        for page in iter_pages(query):
+            data = [doc.to_dict() for doc in page]
+            records = [item["image_metadata"] for item in data]
+            reference = [to_epoch(item.get("created_at") or item.get("validated_at")) for item in data]
+            reference = [time.time() if np.isnan(value) else value for value in reference]
+            results, counts = rule_set.validate_many(records, reference)
+            for rule_id, hit_count in counts.items():
+                totals[rule_id] += hit_count
+            scanned += len(page)
+            for doc, item, result in zip(page, data, results):
+                previous = item.get("image_validation") or {}
+                carried = [error for error in previous.get("errors", []) if error.startswith(DUPLICATE_ERROR_PREFIX)]
+                if carried:
+                    result["errors"] += carried
+                    result["is_valid"] = False
+                if all(previous.get(key) == result[key] for key in ("is_valid", "errors", "warnings", "authenticity_score")):
+                    continue
+                changed += 1
+                flipped += previous.get("is_valid") != result["is_valid"]
+                if not dry_run:
+                    writer.update(doc.reference, {"image_validation": result, "revalidated_at": SERVER_TIMESTAMP})
+
+    elapsed = time.perf_counter() - start
+    log.info("✅ Re-validated %d image(s) in %.2fs: %d changed, %d verdict(s) flipped%s.", scanned, elapsed,
+             changed, flipped, " (dry run, nothing written)" if dry_run else "")
+    for rule_id, hit_count in sorted(totals.items(), key=lambda item: -item[1]):
+        if hit_count:
+            log.info("   %-26s %8d", rule_id, hit_count)
+    return totals
+
+
+# --- BENCHMARK ---
+def synthetic_metadata(count, seed=3):
+    """Metadata records shaped like extract_image_metadata output."""
+    rng = random.Random(seed)
+    now = time.time()
+    records = []
+    for i in range(count):
+        created = datetime.fromtimestamp(now - rng.uniform(-0.5, 24) * 3600)
+        exif = {}
+        if rng.random() < 0.7:
+            exif = {"Make": "Phone", "Model": "X", "DateTime": "", "GPSInfo": {}, "ExifOffset": 0, "Orientation": 1}
+            if rng.random() < 0.05:
+                exif["Software"] = rng.choice(["Adobe Photoshop 24.0", "Snipping Tool", "Android 14"])
+        records.append({
+            "format": rng.choice(["JPEG", "JPEG", "PNG", "GIF"]),
+            "size": rng.choice([(4032, 3024), (1920, 1080), (640, 480), (150, 150)]),
+            "file_size": rng.randint(20_000, 6_000_000),
+            "file_name": rng.choice(["IMG_2024.jpg", "report.jpg", "screenshot_1.png", f"{i}.jpg"]),
+            "exif_data": exif,
+            "creation_time": created,
+            "modification_time": datetime.fromtimestamp(created.timestamp() + rng.choice([0, 5, 600, 7200])),
+        })
+    return records
+
+
+def run_benchmark(count):
+    records = synthetic_metadata(count)
+    rule_set = get_rule_set()
+    start = time.perf_counter()
+    results, counts = rule_set.validate_many(records)
+    batch_seconds = time.perf_counter() - start
+
+    sample = records[:min(len(records), 2000)]
+    start = time.perf_counter()
+    for metadata in sample:
+        rule_set.validate(metadata)
+    single_seconds = (time.perf_counter() - start) * len(records) / max(1, len(sample))
+
+    valid = sum(result["is_valid"] for result in results)
+    print(f"✅ {len(records):,} records: batch {batch_seconds:.2f}s "
+          f"({len(records) / max(batch_seconds, 1e-9):,.0f} records/sec), "
+          f"one at a time ~{single_seconds:.2f}s; {valid:,} valid, "
+          f"mean authenticity {np.mean([r['authenticity_score'] for r in results]):.1f}")
+    for rule_id, hit_count in sorted(counts.items(), key=lambda item: -item[1]):
+        print(f"   {rule_id:<26} {hit_count:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Image metadata validation rules.")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="Validate N synthetic metadata records")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="Re-run the rules over all stored submissions and update changed results")
+    parser.add_argument("--dry-run", action="store_true", help="With --revalidate: report changes without writing")
+    args = parser.parse_args()
+
+    if args.revalidate:
+        import image_validator
+        revalidate_submissions(image_validator.initialize_firebase(), dry_run=args.dry_run)
+    else:
+        run_benchmark(args.benchmark or 100_000)
@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import image_validator
+
+# --- CONFIGURATION ---
+VALIDATOR_HOST = os.getenv("VALIDATOR_HOST", "127.0.0.1")
+VALIDATOR_PORT = int(os.getenv("VALIDATOR_PORT", "3002"))
+VALIDATOR_WORKERS = int(os.getenv("VALIDATOR_WORKERS", str(os.cpu_count() or 4)))
+
+
+# --- WARM STATE ---
+class ValidationService:
+    """Keeps Pillow/imagehash imported and the Firestore client alive across jobs."""
+
+    def __init__(self):
+        self._db = None
+        self._db_lock = threading.Lock()
+        # Pay the Pillow/imagehash import cost once, at start-up
+        import imagehash  # noqa: F401
+        from PIL import Image  # noqa: F401
+
+    def get_db(self):
+        with self._db_lock:
+            if self._db is None:
+                self._db = image_validator.initialize_firebase()
+            return self._db
+
+    def validate(self, job):
+        """Validates one {"submission_id", "image_path"} job and returns a JSON-ready dict."""
+        submission_id = job.get("submission_id") or "dummy"
+        image_path = job.get("image_path")
+        if not image_path:
+            return {"is_valid": False, "warnings": [], "errors": ["Missing image_path"], "metadata": {}}
+        db = self.get_db() if submission_id != "dummy" else None
+        result = image_validator.validate_submission_image(db, submission_id, image_path)
+        return image_validator.to_json_result(result)
+
+
+# --- HTTP MODE ---
+def make_handler(service, workers=VALIDATOR_WORKERS):
+    # Each request gets a thread, but at most `workers` validate at once; the rest wait their turn
+    slots = threading.BoundedSemaphore(workers)
+
+    class ValidationHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok"})
+            else:
+                self._send_json(404, {"error": "Not found"})
+
+        def do_POST(self):
+            if self.path != "/validate":
+                self._send_json(404, {"error": "Not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                job = json.loads(self.rfile.read(length) or b"{}")
+                with slots:
+                    payload = service.validate(job)
+                self._send_json(200, payload)
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            pass  # Per-request access logs would cost more than the validation itself
+
+    return ValidationHandler
+
+
+def serve_http(service, host=VALIDATOR_HOST, port=VALIDATOR_PORT, workers=VALIDATOR_WORKERS):
+    server = ThreadingHTTPServer((host, port), make_handler(service, workers))
+    print(f"🚀 Image validation server listening at http://{host}:{port} ({workers} worker(s))")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Validation server stopped.")
+    finally:
+        server.server_close()
+
+
+# --- JSON-LINES MODE ---
+def serve_stdin(service, workers=VALIDATOR_WORKERS):
+    """
+    Reads one JSON job per line from stdin and writes one JSON result per line
+    to stdout as each job finishes. An optional "id" field is echoed back so
+    callers can match out-of-order results. Progress logs go to stderr.
+    """
+    results_out = sys.stdout
+    sys.stdout = sys.stderr  # Keep validator progress output off the result stream
+    write_lock = threading.Lock()
+
+    def run(job):
+        try:
+            payload = service.validate(job)
+        except Exception as e:
+            payload = {"is_valid": False, "warnings": [], "errors": [str(e)], "metadata": {}}
+        payload["id"] = job.get("id")
+        with write_lock:
+            results_out.write(json.dumps(payload, default=str) + "\n")
+            results_out.flush()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                with write_lock:
+                    results_out.write(json.dumps({"id": None, "error": f"Invalid JSON: {e}"}) + "\n")
+                    results_out.flush()
+                continue
+            executor.submit(run, job)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-running image validation service.")
+    parser.add_argument("--stdin", action="store_true", help="Serve JSON-lines jobs on stdin/stdout instead of HTTP")
+    parser.add_argument("--host", default=VALIDATOR_HOST)
+    parser.add_argument("--port", type=int, default=VALIDATOR_PORT)
+    parser.add_argument("--workers", type=int, default=VALIDATOR_WORKERS,
+                        help="Images validated at once, in both HTTP and stdin mode")
+    args = parser.parse_args()
+
+    validation_service = ValidationService()
+    if args.stdin:
+        serve_stdin(validation_service, args.workers)
+    else:
+        serve_http(validation_service, args.host, args.port, args.workers)
@@ -130,10 +130,11 @@ export const DetailsModal: React.FC<{ item: SelectableItem | null; onClose: () =
                                 {item.created_at && <div><h4 className="font-semibold text-gray-700">Reported At</h4><p className="text-gray-600">{new Date(item.created_at.seconds * 1000).toLocaleString()}</p></div>}
                                 
                                 {/* Image Validation Display */}
-                                {(item as any).image_validation && (
+                                {/* The upload-time check stands in until the batch validator has run */}
+                                {((item as any).image_validation || (item as any).upload_validation) && (
                                     <div className="md:col-span-2">
                                         <h4 className="font-semibold text-gray-700 mb-2">Image Validation</h4>
-                                        <ImageValidationDisplay validation={(item as any).image_validation} />
+                                        <ImageValidationDisplay validation={(item as any).image_validation || (item as any).upload_validation} />
                                     </div>
                                 )}
                             </div>